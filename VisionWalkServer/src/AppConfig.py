@@ -0,0 +1,84 @@
+# app_config.py
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# Thư mục chứa vision_api.py, mặc định cho dữ liệu cục bộ (jobs.sqlite3, spool/)
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@dataclass
+class AppConfig:
+    """
+    Cấu hình server, đọc từ biến môi trường bằng from_env():
+
+        GOOGLE_APPLICATION_CREDENTIALS      service account cho Cloud TTS/STT (không đặt thì dùng ADC)
+        VISIONWALK_FIREBASE_CREDENTIALS     service account cho Firebase Admin
+        VISIONWALK_FIREBASE_BUCKET          bucket Storage
+        VISIONWALK_FIREBASE_DATABASE_URL    URL Realtime Database
+        GEMINI_API_KEY                      key cho Gemini (/analyze-image, /qa)
+        JWT_SECRET_KEY                      khóa ký access/refresh token (bắt buộc)
+        VISIONWALK_STORAGE                  firebase | memory
+        VISIONWALK_WARMUP                   các subsystem khởi tạo sẵn lúc startup, ví dụ "speech,gemini" hoặc "all"
+        VISIONWALK_LOOP_LAG_THRESHOLD_MS    ngưỡng ghi stack khi event loop bị chặn (0 để tắt)
+        VISIONWALK_DATA_DIR                 thư mục dữ liệu cục bộ, mặc định thư mục src
+        VISIONWALK_JOBS_PATH                file SQLite của job queue, mặc định <data_dir>/jobs.sqlite3
+        VISIONWALK_SPOOL_DIR                ảnh đại diện chờ xử lý, mặc định <data_dir>/spool/profile_images
+
+    Đường dẫn tương đối tính theo data_dir và được đổi thành tuyệt đối khi tạo
+    config, nên không phụ thuộc thư mục làm việc lúc chạy server.
+    Redis (REDIS_URL) và loại job queue (VISIONWALK_JOBS) đọc cấu hình riêng.
+    """
+    google_credentials: Optional[str] = None
+    firebase_credentials: Optional[str] = None
+    firebase_bucket: Optional[str] = None
+    firebase_database_url: Optional[str] = None
+    gemini_api_key: Optional[str] = None
+    jwt_secret_key: Optional[str] = None
+    storage_backend: str = "firebase"
+    warmup: Tuple[str, ...] = ()
+    loop_lag_threshold_ms: float = 100.0
+    data_dir: str = SRC_DIR
+    jobs_path: str = "jobs.sqlite3"
+    spool_dir: str = os.path.join("spool", "profile_images")
+
+    def __post_init__(self):
+        self.data_dir = os.path.abspath(self.data_dir)
+        self.jobs_path = os.path.join(self.data_dir, self.jobs_path)
+        self.spool_dir = os.path.join(self.data_dir, self.spool_dir)
+
+    @classmethod
+    def from_env(cls) -> "AppConfig":
+        warmup = os.getenv("VISIONWALK_WARMUP", "")
+        return cls(
+            google_credentials=os.getenv("GOOGLE_APPLICATION_CREDENTIALS") or None,
+            firebase_credentials=os.getenv("VISIONWALK_FIREBASE_CREDENTIALS") or None,
+            firebase_bucket=os.getenv("VISIONWALK_FIREBASE_BUCKET") or None,
+            firebase_database_url=os.getenv("VISIONWALK_FIREBASE_DATABASE_URL") or None,
+            gemini_api_key=os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY") or None,
+            jwt_secret_key=os.getenv("JWT_SECRET_KEY") or None,
+            storage_backend=os.getenv("VISIONWALK_STORAGE", "firebase").lower(),
+            warmup=tuple(name.strip() for name in warmup.split(",") if name.strip()),
+            loop_lag_threshold_ms=float(os.getenv("VISIONWALK_LOOP_LAG_THRESHOLD_MS", "100")),
+            data_dir=os.getenv("VISIONWALK_DATA_DIR") or SRC_DIR,
+            jobs_path=os.getenv("VISIONWALK_JOBS_PATH") or "jobs.sqlite3",
+            spool_dir=os.getenv("VISIONWALK_SPOOL_DIR") or os.path.join("spool", "profile_images")
+        )
+
+    def validate(self):
+        """Kiểm tra lúc tạo app (không phải lúc import); lỗi cấu hình báo bằng ValueError"""
+        if not self.jwt_secret_key:
+            raise ValueError("JWT_SECRET_KEY is required")
+        if self.storage_backend not in ("firebase", "memory"):
+            raise ValueError(f"VISIONWALK_STORAGE must be 'firebase' or 'memory', got {self.storage_backend!r}")
+        if self.storage_backend == "firebase":
+            for name, value in (
+                ("VISIONWALK_FIREBASE_CREDENTIALS", self.firebase_credentials),
+                ("VISIONWALK_FIREBASE_BUCKET", self.firebase_bucket),
+                ("VISIONWALK_FIREBASE_DATABASE_URL", self.firebase_database_url)
+            ):
+                if not value:
+                    raise ValueError(f"{name} is required with the firebase storage backend")
+            if not os.path.exists(self.firebase_credentials):
+                raise ValueError(f"Firebase admin credentials file not found at {self.firebase_credentials}")
+        if self.google_credentials and not os.path.exists(self.google_credentials):
+            raise ValueError(f"Google credentials file not found at {self.google_credentials}")
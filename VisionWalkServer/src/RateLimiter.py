@@ -0,0 +1,135 @@
+# rate_limiter.py
+import logging, math
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+from fastapi import Depends, HTTPException, Request, Response
+from redis import asyncio as aioredis
+from RedisConfig import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Token bucket trong một lệnh EVALSHA: nạp lại theo thời gian của Redis, trừ token, đặt TTL
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float
+    retry_after: float = 0.0
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+class RateLimiter:
+    def __init__(self, prefix: str = "ratelimit"):
+        self.prefix = prefix
+        self._script = None
+
+    def script(self, redis: aioredis.Redis):
+        # register_script gửi EVALSHA và chỉ nạp lại script khi Redis báo NOSCRIPT
+        if self._script is None or self._script.registered_client is not redis:
+            self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        return self._script
+
+    async def hit(
+        self,
+        redis: aioredis.Redis,
+        route: str,
+        identity: str,
+        burst: int,
+        rate: float,
+        cost: int = 1
+    ) -> RateLimitResult:
+        """Lấy `cost` token từ bucket (route, identity); một round trip tới Redis"""
+        key = f"{self.prefix}:{route}:{identity}"
+        allowed, tokens, retry_after = await self.script(redis)(keys=[key], args=[burst, rate, cost])
+        tokens, retry_after = float(tokens), float(retry_after)
+
+        result = RateLimitResult(
+            allowed=bool(int(allowed)),
+            limit=burst,
+            remaining=int(tokens),
+            reset_after=(burst - tokens) / rate,
+            retry_after=retry_after
+        )
+        result.headers = {
+            "X-RateLimit-Limit": str(burst),
+            "X-RateLimit-Remaining": str(result.remaining),
+            "X-RateLimit-Reset": str(math.ceil(result.reset_after))
+        }
+        if not result.allowed:
+            result.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return result
+
+
+rate_limiter = RateLimiter()
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limit(
+    route: str,
+    burst: int,
+    rate: float,
+    identity: Optional[Callable[..., Awaitable[str]]] = None
+):
+    """
+    Dependency giới hạn tần suất theo token bucket cho mỗi (route, user) hoặc (route, IP).
+
+    burst: số request tối đa liên tiếp; rate: số token nạp lại mỗi giây.
+    identity: dependency trả về id người dùng (ví dụ get_current_user), mặc định dùng IP.
+    Header X-RateLimit-* được gắn vào response; vượt giới hạn trả 429 kèm Retry-After.
+    Nếu Redis lỗi thì cho request đi qua để không chặn cả API.
+    """
+    identity = identity or client_ip
+
+    async def dependency(
+        response: Response,
+        who: str = Depends(identity),
+        redis: aioredis.Redis = Depends(get_redis)
+    ) -> Optional[RateLimitResult]:
+        try:
+            result = await rate_limiter.hit(redis, route, who, burst, rate)
+        except aioredis.RedisError as e:
+            logger.warning("Rate limiter unavailable for %s: %s", route, e)
+            return None
+
+        if not result.allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests. Please wait.",
+                headers=result.headers
+            )
+        response.headers.update(result.headers)
+        return result
+
+    return dependency
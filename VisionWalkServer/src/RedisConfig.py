@@ -1,55 +1,186 @@
 # redis_config.py
+import asyncio, logging, os, time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
 from redis import asyncio as aioredis
-from typing import Optional
-from fastapi import Depends
+from redis.asyncio.client import Pipeline
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis import exceptions
+
+logger = logging.getLogger(__name__)
+
+
+class CommandStats:
+    def __init__(self, samples: int = 1024):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.commands = 0
+        self._samples = deque(maxlen=samples)
+
+    def record(self, elapsed_ms: float, ok: bool, commands: int = 1):
+        self.count += 1
+        self.commands += commands
+        if not ok:
+            self.errors += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self._samples.append(elapsed_ms)
+
+    def snapshot(self) -> Dict:
+        samples = sorted(self._samples)
+        percentile = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))], 3) if samples else 0.0
+        return {
+            'count': self.count,
+            'commands': self.commands,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': percentile(0.5),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(self.max_ms, 3)
+        }
+
+
+class InstrumentedPipeline(Pipeline):
+    config: "RedisConfig" = None
+
+    async def execute(self, raise_on_error: bool = True) -> List:
+        return await self.config.timed('PIPELINE', super().execute(raise_on_error), len(self.command_stack))
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """Redis client ghi lại độ trễ từng lệnh; khi Redis đang mất kết nối thì báo lỗi ngay"""
+    config: "RedisConfig" = None
+
+    async def execute_command(self, *args, **options):
+        return await self.config.timed(str(args[0]).upper(), super().execute_command(*args, **options))
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        pipe = InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.config = self.config
+        return pipe
+
 
 class RedisConfig:
     def __init__(self):
-        self.redis_url = "redis://localhost:6379"
-        self._redis_client: Optional[aioredis.Redis] = None
+        self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.max_connections = 50
+        self.health_check_interval = 30  # Pool tự PING connection đã rảnh quá lâu trước khi dùng lại (giây)
+        self.max_probe_interval = 5.0    # Khoảng thử kết nối lại tối đa khi Redis không phản hồi (giây)
+        self._redis_client: Optional[InstrumentedRedis] = None
+        self._init_lock = asyncio.Lock()
+        self._available = True
+        self._probe_task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, CommandStats] = {}
 
     async def init_redis_pool(self):
         """Initialize Redis connection pool"""
-        try:
+        async with self._init_lock:
             if not self._redis_client:
-                self._redis_client = await aioredis.from_url(
+                pool = aioredis.ConnectionPool.from_url(
                     self.redis_url,
                     encoding="utf-8",
                     decode_responses=True,
                     socket_timeout=5,  # Thêm timeout
-                    socket_connect_timeout=5
+                    socket_connect_timeout=5,
+                    socket_keepalive=True,
+                    health_check_interval=self.health_check_interval,
+                    max_connections=self.max_connections,
+                    # Lỗi mạng thoáng qua được thử lại trên connection mới
+                    retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), retries=3),
+                    retry_on_error=[exceptions.ConnectionError, exceptions.TimeoutError]
                 )
-                # Verify connection
-                await self._redis_client.ping()
-                print("[DEBUG] Redis connection successful")
+                client = InstrumentedRedis(connection_pool=pool)
+                client.config = self
+                self._redis_client = client
+                try:
+                    await client.ping()
+                    logger.debug("Redis connection successful")
+                except aioredis.RedisError as e:
+                    # Không chặn startup; probe nền sẽ kết nối lại
+                    logger.error("Redis connection failed: %s", e)
             return self._redis_client
-        except Exception as e:
-            print(f"[ERROR] Redis connection failed: {str(e)}")
-            raise
-
 
     async def get_redis(self) -> aioredis.Redis:
-        """Get Redis client instance"""
+        """Get Redis client instance (không PING, pool tự kiểm tra connection)"""
         if not self._redis_client:
             await self.init_redis_pool()
+        return self._redis_client
+
+    async def timed(self, name: str, coro, commands: int = 1):
+        if not self._available:
+            coro.close()
+            raise exceptions.ConnectionError("Redis unavailable, reconnecting")
+
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = CommandStats()
+        start = time.perf_counter()
+        ok = False
         try:
-            # Verify connection is still alive
-            await self._redis_client.ping()
-            return self._redis_client
-        except Exception as e:
-            print(f"[ERROR] Redis connection check failed: {str(e)}")
-            # Reset client and try to reconnect
-            self._redis_client = None
-            return await self.init_redis_pool()
+            result = await coro
+            ok = True
+            return result
+        except (exceptions.ConnectionError, exceptions.TimeoutError):
+            self._mark_down()
+            raise
+        finally:
+            stats.record((time.perf_counter() - start) * 1000, ok, commands)
+
+    def _mark_down(self):
+        if not self._available:
+            return
+        logger.error("Redis unreachable, failing fast until it answers again")
+        self._available = False
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.get_running_loop().create_task(self._probe())
+
+    async def _probe(self):
+        """Thử PING với backoff cho đến khi Redis phản hồi, trong lúc đó caller nhận lỗi ngay"""
+        delay = 0.1
+        while not self._available and self._redis_client is not None:
+            await asyncio.sleep(delay)
+            try:
+                await aioredis.Redis.execute_command(self._redis_client, 'PING')
+                self._available = True
+                logger.info("Redis reconnected")
+            except aioredis.RedisError:
+                delay = min(delay * 2, self.max_probe_interval)
+
+    async def execute_batch(self, commands: Iterable[Tuple], transaction: bool = False) -> List:
+        """Gửi nhiều lệnh trong một round trip, ví dụ [("GET", k1), ("GET", k2)]"""
+        client = await self.get_redis()
+        pipe = client.pipeline(transaction=transaction)
+        for args in commands:
+            pipe.execute_command(*args)
+        return await pipe.execute()
+
+    def snapshot(self) -> Dict:
+        pool = self._redis_client.connection_pool if self._redis_client else None
+        return {
+            'available': self._available,
+            'commands': {name: stats.snapshot() for name, stats in sorted(self.stats.items())},
+            'pool': {
+                'max_connections': pool.max_connections if pool else 0,
+                'in_use': len(pool._in_use_connections) if pool else 0,
+                'idle': len(pool._available_connections) if pool else 0
+            }
+        }
 
     async def close(self):
         """Close Redis connection"""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
         if self._redis_client:
-            await self._redis_client.close()
+            await self._redis_client.aclose()
+            await self._redis_client.connection_pool.disconnect()
             self._redis_client = None
 
 redis_config = RedisConfig()
 
 # Dependency for getting Redis client
 async def get_redis() -> aioredis.Redis:
-    return await redis_config.get_redis()
\ No newline at end of file
+    return await redis_config.get_redis()
@@ -0,0 +1,100 @@
+# services.py
+import asyncio, threading, time
+from typing import Callable, Dict, Iterable, Tuple
+from AppConfig import AppConfig
+
+GENERATION_CONFIG = {
+    "max_output_tokens": 150,  # Approximately 100-150 words
+    "temperature": 0.7,
+    "top_p": 0.8,
+    "top_k": 40
+}
+
+
+class Services:
+    """
+    Các subsystem nặng chỉ phục vụ /analyze-image, /qa và TTS:
+
+        speech   Cloud TTS/STT + googletrans (GoogleCloudAPI)
+        gemini   google-generativeai (GenerativeModel)
+        image    cv2 (ImagePreprocessor)
+        audio    librosa, noisereduce (AudioPreprocessor)
+
+    Mỗi subsystem được import và khởi tạo ở lần dùng đầu tiên, nên worker chỉ
+    phục vụ location không phải trả chi phí này. Thời gian khởi tạo ghi vào
+    init_seconds; warm_up() khởi tạo sẵn lúc startup nếu muốn.
+    """
+    def __init__(self, config: AppConfig):
+        self.config = config
+        self.factories: Dict[str, Callable[[], object]] = {
+            'speech': self._speech,
+            'gemini': self._gemini,
+            'image': self._image,
+            'audio': self._audio
+        }
+        self.init_seconds: Dict[str, float] = {}
+        self._instances: Dict[str, object] = {}
+        self._locks = {name: threading.Lock() for name in self.factories}
+
+    def _speech(self):
+        from utils.GoogleCloudAPI import GoogleCloudAPI
+        return GoogleCloudAPI(self.config.google_credentials)
+
+    def _gemini(self):
+        if not self.config.gemini_api_key:
+            raise RuntimeError("GEMINI_API_KEY is not set")
+        import google.generativeai as genai
+        genai.configure(api_key=self.config.gemini_api_key)
+        return genai.GenerativeModel(
+            model_name="gemini-1.5-pro",
+            generation_config=GENERATION_CONFIG
+        )
+
+    def _image(self):
+        from utils.ImagePreprocessor import ImagePreprocessor
+        return ImagePreprocessor()
+
+    def _audio(self):
+        from utils.AudioPreprocessor import AudioPreprocessor
+        return AudioPreprocessor()
+
+    def resolve(self, names: Iterable[str]) -> Tuple[str, ...]:
+        """Tên subsystem hợp lệ ("all" là tất cả), tên lạ báo ValueError"""
+        names = tuple(names)
+        if "all" in names:
+            return tuple(self.factories)
+        unknown = [name for name in names if name not in self.factories]
+        if unknown:
+            raise ValueError(f"Unknown subsystems {unknown}, expected some of {list(self.factories)} or 'all'")
+        return names
+
+    def require(self, name: str):
+        """Lấy subsystem, khởi tạo nếu chưa có (chặn luồng gọi; trong event loop dùng get())"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._locks[name]:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = self.factories[name]()
+                self.init_seconds[name] = round(time.perf_counter() - started, 3)
+            return self._instances[name]
+
+    async def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        # Import + khởi tạo mất vài giây: chạy trong thread pool để không chặn event loop
+        return await asyncio.get_running_loop().run_in_executor(None, self.require, name)
+
+    async def warm_up(self, names: Iterable[str]) -> Dict[str, float]:
+        """Khởi tạo song song các subsystem, trả về thời gian khởi tạo từng cái (giây)"""
+        names = self.resolve(names)
+        await asyncio.gather(*(self.get(name) for name in names))
+        return {name: self.init_seconds.get(name, 0.0) for name in names}
+
+    def snapshot(self) -> Dict:
+        return {
+            'loaded': sorted(self._instances),
+            'init_seconds': dict(self.init_seconds)
+        }
@@ -0,0 +1,169 @@
+"""
+Cold start: what importing and creating the app costs, and what the first
+request into each subsystem pays.
+
+Each measurement runs in a fresh interpreter, `--rounds` times (median):
+
+    import <module>     each heavy dependency on its own
+    eager (before)      vision_api plus every subsystem module and
+                        google.generativeai, what `import vision_api` loaded
+    import vision_api   the app module as it is now
+    create_app()        config, storage (memory backend), job queue, services
+
+Then, with VISIONWALK_STORAGE=memory, the first and second request of the
+auth/location routes (always-on services), and per subsystem the first and
+second `services.get()` (import + construction, then cached), each
+subsystem in its own interpreter. Missing packages or credentials are
+reported instead of timed.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.cold_start --rounds 3
+"""
+import argparse, json, os, statistics, subprocess, sys, tempfile
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = (
+    'cv2', 'librosa', 'noisereduce', 'google.generativeai', 'google.cloud.texttospeech',
+    'google.cloud.speech', 'googletrans', 'firebase_admin'
+)
+SUBSYSTEMS = ('speech', 'gemini', 'image', 'audio')
+
+IMPORT = """
+import json, sys, time
+started = time.perf_counter()
+try:
+    for name in {modules!r}:
+        __import__(name)
+except ImportError as e:
+    print(json.dumps({{'error': str(e)}}))
+else:
+    print(json.dumps({{'seconds': time.perf_counter() - started}}))
+"""
+
+CREATE_APP = """
+import json, time
+started = time.perf_counter()
+import vision_api
+imported = time.perf_counter()
+vision_api.create_app()
+print(json.dumps({'import': imported - started, 'create_app': time.perf_counter() - imported}))
+"""
+
+ROUTES = """
+import json, time
+from fastapi.testclient import TestClient
+from benchmarks.profile_images import photo
+import vision_api
+
+def timed(call):
+    started = time.perf_counter()
+    response = call()
+    return {'seconds': time.perf_counter() - started, 'status': response.status_code}
+
+with TestClient(vision_api.create_app()) as client:
+    result = {}
+    for k in range(2):
+        email = f'user{k}@example.com'
+        register = timed(lambda: client.post(
+            '/auth/register',
+            data={'email': email, 'password': 'pw', 'displayName': 'A', 'phoneNumber': '1'},
+            files={'profileImage': ('a.jpg', photo(k, 400, 300), 'image/jpeg')}
+        ))
+        tokens = client.post('/auth/login', data={'email': email, 'password': 'pw'}).json()
+        headers = {'Authorization': 'Bearer ' + tokens['access_token']}
+        calls = {
+            'POST /auth/register': register,
+            'POST /auth/login': timed(lambda: client.post('/auth/login', data={'email': email, 'password': 'pw'})),
+            'GET /user/profile': timed(lambda: client.get('/user/profile', headers=headers)),
+            'POST /location/update-location': timed(lambda: client.post(
+                '/location/update-location', json={'latitude': 10.77, 'longitude': 106.7}, headers=headers
+            )),
+            'GET /metrics': timed(lambda: client.get('/metrics')),
+        }
+        for route, call in calls.items():
+            result.setdefault(route, []).append(call)
+print(json.dumps(result))
+"""
+
+SUBSYSTEM = """
+import asyncio, json, time
+from AppConfig import AppConfig
+from Services import Services
+
+async def main():
+    services = Services(AppConfig.from_env())
+    times = []
+    for _ in range(2):
+        started = time.perf_counter()
+        try:
+            await services.get({name!r})
+        except Exception as e:
+            return {{'error': f'{{type(e).__name__}}: {{e}}'}}
+        times.append(time.perf_counter() - started)
+    return {{'first': times[0], 'second': times[1]}}
+
+print(json.dumps(asyncio.run(main())))
+"""
+
+
+def run(code: str, workdir: str) -> dict:
+    env = {**os.environ, 'PYTHONPATH': SRC, 'VISIONWALK_STORAGE': 'memory', 'VISIONWALK_LOG_LEVEL': 'WARNING'}
+    out = subprocess.run(
+        [sys.executable, '-c', code], cwd=workdir, env=env, capture_output=True, text=True
+    )
+    lines = out.stdout.strip().splitlines()
+    if out.returncode != 0 or not lines:
+        return {'error': (out.stderr.strip().splitlines() or ['exit code %d' % out.returncode])[-1]}
+    return json.loads(lines[-1])
+
+
+def median(results, key):
+    return statistics.median(r[key] for r in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"import time, fresh interpreter, median of {args.rounds}")
+        for module in HEAVY:
+            results = [run(IMPORT.format(modules=(module,)), workdir) for _ in range(args.rounds)]
+            if 'error' in results[0]:
+                print(f"  {module:28} not installed ({results[0]['error']})")
+            else:
+                print(f"  {module:28} {median(results, 'seconds') * 1e3:8.0f} ms")
+
+        eager = ('vision_api', 'utils.GoogleCloudAPI', 'utils.ImagePreprocessor', 'utils.AudioPreprocessor', 'google.generativeai')
+        results = [run(IMPORT.format(modules=eager), workdir) for _ in range(args.rounds)]
+        if 'error' in results[0]:
+            print(f"  {'eager (before)':28} cannot import ({results[0]['error']})")
+        else:
+            print(f"  {'eager (before)':28} {median(results, 'seconds') * 1e3:8.0f} ms")
+
+        results = [run(CREATE_APP, workdir) for _ in range(args.rounds)]
+        if 'error' in results[0]:
+            print(f"  vision_api: {results[0]['error']}")
+            return
+        print(f"  {'import vision_api':28} {median(results, 'import') * 1e3:8.0f} ms")
+        print(f"  {'create_app()':28} {median(results, 'create_app') * 1e3:8.0f} ms")
+
+        print("first / second request, memory storage")
+        routes = run(ROUTES, workdir)
+        if 'error' in routes:
+            print(f"  routes: {routes['error']}")
+        for route, (first, second) in ((route, calls) for route, calls in routes.items() if route != 'error'):
+            print(f"  {route:34} {first['seconds'] * 1e3:8.1f} / {second['seconds'] * 1e3:6.1f} ms  (HTTP {first['status']})")
+
+        print("first / second services.get(), one interpreter per subsystem")
+        for name in SUBSYSTEMS:
+            result = run(SUBSYSTEM.format(name=name), workdir)
+            if 'error' in result:
+                print(f"  {name:34} unavailable ({result['error']})")
+            else:
+                print(f"  {name:34} {result['first'] * 1e3:8.1f} / {result['second'] * 1e3:6.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
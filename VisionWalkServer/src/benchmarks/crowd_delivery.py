@@ -0,0 +1,118 @@
+"""
+Per-frame vs. tick-batched location delivery in a crowd.
+
+N connected users stand within a few hundred metres of each other and each
+sends `--rate` updates per second. Every update is fanned out as a move
+event to everyone in range through ClientConnection, into sockets that
+serialize frames with json.dumps. Reports websocket frames per second,
+bytes per second and CPU seconds per wall second for each mode.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.crowd_delivery --crowds 10 50 200 --ticks 0 0.1 0.25
+"""
+import argparse, asyncio, json, random, time
+from datetime import datetime
+from utils.SpatialIndex import SpatialIndex
+from utils.ClientConnection import ClientConnection
+
+CENTER = (10.7626, 106.6602)
+RADIUS_KM = 1.0
+
+
+class CountingWebSocket:
+    def __init__(self, totals):
+        self.totals = totals
+
+    async def send_json(self, data):
+        self.totals['frames'] += 1
+        self.totals['bytes'] += len(json.dumps(data))
+
+    async def send_text(self, data):
+        self.totals['frames'] += 1
+        self.totals['bytes'] += len(data)
+
+    async def send_bytes(self, data):
+        self.totals['frames'] += 1
+        self.totals['bytes'] += len(data)
+
+
+async def run_crowd(n: int, tick: float, args) -> dict:
+    rng = random.Random(args.seed)
+    spread = args.spread_km / 111.32
+    index = SpatialIndex()
+    totals = {'frames': 0, 'bytes': 0}
+    connections = {}
+    positions = {}
+    for i in range(n):
+        uid = f"user-{i}"
+        positions[uid] = [CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)]
+        index.update(uid, *positions[uid])
+        connections[uid] = ClientConnection(
+            CountingWebSocket(totals), uid, max_queue=max(256, n), tick_interval=tick or None
+        )
+        connections[uid].start()
+
+    def deliver(uid):
+        latitude, longitude = positions[uid]
+        payload = {'latitude': latitude, 'longitude': longitude, 'timestamp': datetime.now().isoformat()}
+        for other_id, distance in index.query_radius(latitude, longitude, RADIUS_KM, exclude=uid):
+            connections[other_id].send({
+                'type': 'move',
+                'id': uid,
+                'info': {'displayName': uid, 'profileImage': None, 'email': f"{uid}@example.com"},
+                'location': payload,
+                'distance': round(distance, 2),
+                'status': 'active'
+            }, key=('location', uid))
+
+    # Updates arrive spread evenly over each second, not in lockstep
+    interval = 1.0 / (n * args.rate)
+    uids = list(positions)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    deadline = wall_start + args.seconds
+    step = 0
+    while time.perf_counter() < deadline:
+        uid = uids[step % n]
+        positions[uid][0] += rng.uniform(-1e-5, 1e-5)
+        positions[uid][1] += rng.uniform(-1e-5, 1e-5)
+        index.update(uid, *positions[uid])
+        deliver(uid)
+        step += 1
+        await asyncio.sleep(max(0.0, wall_start + step * interval - time.perf_counter()))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    for connection in connections.values():
+        connection.close()
+    return {
+        'frames': totals['frames'] / wall,
+        'bytes': totals['bytes'] / wall,
+        'cpu': cpu / wall,
+        'coalesced': sum(c.stats['coalesced'] for c in connections.values())
+    }
+
+
+async def main_async(args):
+    print(f"{'users':>6} {'tick':>6} {'frames/s':>10} {'frames/s/user':>14} {'KB/s':>9} {'cpu':>6} {'coalesced':>10}")
+    for n in args.crowds:
+        for tick in args.ticks:
+            row = await run_crowd(n, tick, args)
+            print(
+                f"{n:6} {tick if tick else 'none':>6} {row['frames']:10.0f} {row['frames'] / n:14.1f} "
+                f"{row['bytes'] / 1024:9.0f} {row['cpu']:6.2f} {row['coalesced']:10}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--crowds", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--ticks", type=float, nargs="+", default=[0, 0.1, 0.25], help="0 = send every frame")
+    parser.add_argument("--rate", type=float, default=1.0, help="updates per user per second")
+    parser.add_argument("--spread-km", type=float, default=0.3)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=37)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Cross-worker geo fan-out over a local Redis.
+
+Starts N worker processes, each with its own SpatialIndex / GeoFanout and a
+share of simulated connected users walking around the same area. Every
+update is delivered locally and published on its cell's channel; the other
+workers deliver it to their own users in range. Reports per-worker message
+rates, subscribed cells and publish-to-delivery latency.
+
+Run from VisionWalkServer/src (needs `redis-server` on localhost):
+    python -m benchmarks.geo_fanout --workers 4 --users 2000 --seconds 10
+"""
+import argparse, asyncio, multiprocessing, random, statistics, time
+from redis import asyncio as aioredis
+from utils.SpatialIndex import SpatialIndex
+from utils.GeoFanout import GeoFanout
+
+CENTER = (10.7626, 106.6602)
+RADIUS_KM = 1.0
+
+
+async def worker_main(worker: int, args, results):
+    rng = random.Random(worker)
+    redis = aioredis.from_url(args.redis_url, decode_responses=True)
+    index = SpatialIndex()
+    latencies = []
+    delivered = [0]
+
+    def on_message(message):
+        if message['type'] != 'location':
+            return
+        latencies.append(time.time() - message['sent_at'])
+        location = message['location']
+        index.update(message['id'], location['latitude'], location['longitude'])
+        delivered[0] += sum(
+            1 for uid, _ in index.query_radius(location['latitude'], location['longitude'], RADIUS_KM)
+            if uid in local
+        )
+
+    fanout = GeoFanout(index, RADIUS_KM, on_message)
+    spread = args.spread_km / 111.32
+    local = {}
+    for i in range(args.users // args.workers):
+        uid = f"w{worker}-u{i}"
+        position = [CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)]
+        local[uid] = position
+        index.update(uid, *position)
+        fanout.track(uid, *position)
+
+    subscriber = asyncio.create_task(fanout.run(redis))
+    await asyncio.sleep(1.0)  # let subscriptions settle
+
+    step = 0.00005
+    interval = 1.0 / args.rate
+    published = 0
+    deadline = time.monotonic() + args.seconds
+    while time.monotonic() < deadline:
+        tick = time.monotonic()
+        for uid, position in local.items():
+            position[0] += rng.uniform(-step, step)
+            position[1] += rng.uniform(-step, step)
+            index.update(uid, *position)
+            fanout.track(uid, *position)
+            await fanout.publish(position[0], position[1], {
+                'type': 'location',
+                'id': uid,
+                'location': {'latitude': position[0], 'longitude': position[1]}
+            })
+            published += 1
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - tick)))
+
+    await asyncio.sleep(1.0)  # drain in-flight messages
+    subscriber.cancel()
+    try:
+        await subscriber
+    except asyncio.CancelledError:
+        pass
+    await redis.aclose()
+
+    latencies.sort()
+    results.put({
+        'worker': worker,
+        'published': published,
+        'received': len(latencies),
+        'delivered': delivered[0],
+        'cells': fanout.snapshot()['subscribed_cells'],
+        'p50_ms': statistics.median(latencies) * 1e3 if latencies else 0.0,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1e3 if latencies else 0.0
+    })
+
+
+def run_worker(worker: int, args, results):
+    asyncio.run(worker_main(worker, args, results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--redis-url", default="redis://localhost:6379")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=2000, help="connected users across all workers")
+    parser.add_argument("--spread-km", type=float, default=10.0)
+    parser.add_argument("--rate", type=float, default=1.0, help="updates per user per second")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(worker, args, results))
+        for worker in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    rows = sorted((results.get() for _ in processes), key=lambda row: row['worker'])
+    for process in processes:
+        process.join()
+
+    for row in rows:
+        print(
+            f"worker={row['worker']}  published={row['published'] / args.seconds:8.0f}/s  "
+            f"received={row['received'] / args.seconds:8.0f}/s  delivered={row['delivered'] / args.seconds:9.0f}/s  "
+            f"cells={row['cells']:4}  p50={row['p50_ms']:6.2f}ms  p99={row['p99_ms']:6.2f}ms"
+        )
+    total_published = sum(row['published'] for row in rows)
+    total_received = sum(row['received'] for row in rows)
+    print(
+        f"total: published={total_published / args.seconds:.0f}/s  "
+        f"cross-worker received={total_received / args.seconds:.0f}/s "
+        f"({total_received / max(total_published, 1):.2f} per update)"
+    )
+
+
+if __name__ == "__main__":
+    main()
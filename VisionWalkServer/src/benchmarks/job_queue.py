@@ -0,0 +1,114 @@
+"""
+Deferred side effects: awaiting them on the request path vs. JobQueue.
+
+Each simulated request triggers one side effect that takes `--effect-ms`
+(a Realtime DB / Firestore round trip). "inline" awaits it before
+responding; "queued" enqueues a job and responds, while the queue's
+workers run the effects `--concurrency` at a time. Requests pick users with
+a skewed popularity, so repeated effects for the same user are merged by
+the dedup key, and `--fail-rate` of the handler calls raise to exercise
+retries. Reports response latency, time until the queue is empty, job
+wait/run percentiles and the dedup/retry counters.
+
+Run from VisionWalkServer/src (the redis backend needs `redis-server`):
+    python -m benchmarks.job_queue --requests 2000 --backend sqlite
+"""
+import argparse, asyncio, os, random, statistics, tempfile, time
+from redis import asyncio as aioredis
+from utils.JobQueue import JobQueue, RedisJobBackend, SQLiteJobBackend
+
+
+def workload(users: int, requests: int, rng: random.Random):
+    weights = [1 / (rank + 1) for rank in range(users)]
+    return [f"user-{uid}" for uid in rng.choices(range(users), weights, k=requests)]
+
+
+async def inline(uids, effect_latency: float):
+    latencies = []
+    for uid in uids:
+        start = time.perf_counter()
+        await asyncio.sleep(effect_latency)
+        latencies.append((time.perf_counter() - start) * 1e3)
+    return latencies
+
+
+async def queued(uids, args, backend):
+    rng = random.Random(args.seed)
+    done = set()
+
+    async def handler(payload):
+        await asyncio.sleep(args.effect_ms / 1e3)
+        if rng.random() < args.fail_rate:
+            raise RuntimeError("simulated failure")
+        done.add(payload['uid'])
+
+    jobs = JobQueue(backend, poll_interval=0.05)
+    jobs.register('effect', handler, concurrency=args.concurrency, max_attempts=5, backoff_base=0.01)
+    worker = asyncio.create_task(jobs.run())
+
+    latencies = []
+    started = time.perf_counter()
+    for uid in uids:
+        start = time.perf_counter()
+        await jobs.enqueue('effect', {'uid': uid}, key=f"effect:{uid}")
+        latencies.append((time.perf_counter() - start) * 1e3)
+
+    while True:
+        depth = await backend.depth()
+        if not depth.get('effect', {}).get('pending') and not depth.get('effect', {}).get('running'):
+            break
+        await asyncio.sleep(0.01)
+    empty_after = (time.perf_counter() - started) * 1e3
+    snapshot = await jobs.snapshot()
+    await jobs.drain()
+    await worker
+    return latencies, empty_after, len(done), snapshot['types']['effect']
+
+
+async def main_async(args):
+    uids = workload(args.users, args.requests, random.Random(args.seed))
+    print(f"{args.requests} requests over {args.users} users, {args.effect_ms} ms per side effect, "
+          f"{args.backend} backend, concurrency {args.concurrency}, fail rate {args.fail_rate}")
+
+    latencies = await inline(uids, args.effect_ms / 1e3)
+    print(f"  inline: response p50 {statistics.median(latencies):7.3f} ms  p99 {sorted(latencies)[int(len(latencies) * 0.99)]:7.3f} ms  "
+          f"total {sum(latencies):8.0f} ms")
+
+    redis = None
+    if args.backend == 'redis':
+        redis = aioredis.from_url(args.redis_url, decode_responses=True)
+        await redis.flushdb()
+
+        async def get_redis():
+            return redis
+        backend = RedisJobBackend(get_redis, prefix='bench-jobs')
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3')
+        backend = SQLiteJobBackend(path)
+
+    latencies, empty_after, users_done, stats = await queued(uids, args, backend)
+    print(f"  queued: response p50 {statistics.median(latencies):7.3f} ms  p99 {sorted(latencies)[int(len(latencies) * 0.99)]:7.3f} ms  "
+          f"queue empty after {empty_after:8.0f} ms")
+    print(f"          enqueued {stats['enqueued']}, deduplicated {stats['deduplicated']}, succeeded {stats['succeeded']}, "
+          f"retried {stats['retried']}, dead {stats['dead']}, users done {users_done}/{len(set(uids))}")
+    print(f"          wait p50/p99 {stats['wait_ms']['p50']}/{stats['wait_ms']['p99']} ms, "
+          f"run p50/p99 {stats['run_ms']['p50']}/{stats['run_ms']['p99']} ms")
+    if redis is not None:
+        await redis.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--effect-ms", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    parser.add_argument("--backend", choices=('sqlite', 'redis'), default='sqlite')
+    parser.add_argument("--redis-url", default="redis://localhost:6379")
+    parser.add_argument("--seed", type=int, default=47)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
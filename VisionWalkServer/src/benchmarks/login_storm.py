@@ -0,0 +1,97 @@
+"""
+Event-loop lag during a login storm: bcrypt inline vs. PasswordHasher.
+
+A ticker task sleeps `--tick-ms` in a loop and records how late it wakes
+up, standing in for the websocket traffic sharing the worker. Meanwhile
+`--logins` password checks arrive at `--rate` per second, either calling
+bcrypt.checkpw on the loop (what login_user used to do) or going through the
+bounded PasswordHasher pool. Reports ticker lag, login latency and how many
+logins were rejected with 503.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.login_storm --logins 200 --rate 100
+"""
+import argparse, asyncio, time, bcrypt
+from utils.PasswordHasher import PasswordHasher, HasherBusy
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def ticker(tick: float, lags, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(tick)
+        lags.append((time.perf_counter() - start - tick) * 1e3)
+
+
+async def storm(mode: str, hashed: bytes, args):
+    hasher = PasswordHasher(workers=args.workers, max_pending=args.max_pending, rounds=args.rounds)
+    lags, latencies, rejected = [], [], [0]
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(args.tick_ms / 1e3, lags, stop))
+
+    async def login():
+        start = time.perf_counter()
+        if mode == 'inline':
+            bcrypt.checkpw(b'correct horse', hashed)
+        else:
+            try:
+                await hasher.verify('correct horse', hashed.decode('utf-8'))
+            except HasherBusy:
+                rejected[0] += 1
+                return
+        latencies.append((time.perf_counter() - start) * 1e3)
+
+    await asyncio.sleep(0.2)
+    started = time.perf_counter()
+    tasks = []
+    for i in range(args.logins):
+        tasks.append(asyncio.create_task(login()))
+        await asyncio.sleep(max(0.0, started + (i + 1) / args.rate - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick_task
+    hasher.executor.shutdown()
+
+    return {
+        'lag_p50': percentile(lags, 0.5),
+        'lag_p99': percentile(lags, 0.99),
+        'lag_max': max(lags) if lags else 0.0,
+        'login_p50': percentile(latencies, 0.5),
+        'login_p99': percentile(latencies, 0.99),
+        'throughput': len(latencies) / elapsed,
+        'rejected': rejected[0]
+    }
+
+
+async def main_async(args):
+    hashed = bcrypt.hashpw(b'correct horse', bcrypt.gensalt(rounds=args.rounds))
+    start = time.perf_counter()
+    bcrypt.checkpw(b'correct horse', hashed)
+    print(f"one checkpw at {args.rounds} rounds: {(time.perf_counter() - start) * 1e3:.1f} ms")
+    print(f"{'mode':>7} {'lag p50':>8} {'lag p99':>8} {'lag max':>8} {'login p50':>10} {'login p99':>10} {'ok/s':>6} {'503':>5}")
+    for mode in ('inline', 'pool'):
+        row = await storm(mode, hashed, args)
+        print(
+            f"{mode:>7} {row['lag_p50']:8.1f} {row['lag_p99']:8.1f} {row['lag_max']:8.1f} "
+            f"{row['login_p50']:10.1f} {row['login_p99']:10.1f} {row['throughput']:6.1f} {row['rejected']:5}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=100.0, help="login attempts per second")
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--tick-ms", type=float, default=10.0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+LoopLagMonitor and SamplingProfiler: what they catch and what they cost.
+
+`--tasks` coroutines hop through the event loop doing a little work each
+step (the steady traffic). Every `--stall-every` seconds one of two
+blocking calls runs on the loop: `sync_firestore_get` (a blocking network
+wait, time.sleep) or `inline_password_hash` (CPU, pbkdf2). Each setting
+runs `--seconds`, `--rounds` times interleaved (median reported):
+
+    off       no diagnostics
+    monitor   LoopLagMonitor (heartbeat + watchdog thread)
+    profiler  monitor plus SamplingProfiler sampling every thread the whole time
+
+Reports steps/s (the overhead), the stalls the monitor recorded and the
+blocking functions found at the top of the sampled stacks.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.loop_lag --seconds 5
+"""
+import argparse, asyncio, hashlib, statistics, time
+from collections import Counter
+from utils.Diagnostics import LoopLagMonitor, SamplingProfiler
+
+BLOCKERS = ('sync_firestore_get', 'inline_password_hash')
+
+
+def sync_firestore_get(seconds: float):
+    time.sleep(seconds)
+
+
+def inline_password_hash(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        hashlib.pbkdf2_hmac('sha256', b'password', b'salt', 2000)
+
+
+async def traffic(counter, stop):
+    while not stop.is_set():
+        sum(range(50))
+        counter[0] += 1
+        await asyncio.sleep(0)
+
+
+async def stalls(args, stop):
+    k = 0
+    while not stop.is_set():
+        await asyncio.sleep(args.stall_every)
+        blocker = (sync_firestore_get, inline_password_hash)[k % 2]
+        blocker(args.stall_ms / 1e3)
+        k += 1
+
+
+async def run(args, mode):
+    stop = asyncio.Event()
+    counter = [0]
+    monitor = profile = None
+    if mode in ('monitor', 'profiler'):
+        monitor = LoopLagMonitor(threshold=args.threshold_ms / 1e3)
+        monitor.start()
+    if mode == 'profiler':
+        profile = asyncio.create_task(SamplingProfiler().profile(args.seconds, interval=args.profile_interval_ms / 1e3))
+
+    tasks = [asyncio.create_task(traffic(counter, stop)) for _ in range(args.tasks)]
+    tasks.append(asyncio.create_task(stalls(args, stop)))
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    result = {'steps_per_s': counter[0] / args.seconds}
+    if monitor is not None:
+        await monitor.stop()
+        snapshot = monitor.snapshot(limit=1000)
+        caught = Counter()
+        for stack, count in monitor.stacks.items():
+            for blocker in BLOCKERS:
+                if f";{blocker} (" in stack:
+                    caught[blocker] += count
+        result.update(stalls=snapshot['stalls_total'], lag=snapshot['lag_ms'], caught=dict(caught))
+    if profile is not None:
+        profiled = await profile
+        blocked = Counter()
+        for line in profiled['collapsed'].splitlines():
+            stack, count = line.rsplit(' ', 1)
+            for blocker in BLOCKERS:
+                if f";{blocker} (" in stack:
+                    blocked[blocker] += int(count)
+        result.update(profile_samples=profiled['samples'], profile_blocked=dict(blocked))
+    return result
+
+
+async def main_async(args):
+    expected = int(args.seconds / (args.stall_every + args.stall_ms / 1e3))
+    print(f"{args.tasks} traffic tasks, a {args.stall_ms:.0f} ms blocking call every {args.stall_every} s "
+          f"(~{expected} stalls), threshold {args.threshold_ms} ms, {args.seconds} s per mode")
+    await run(argparse.Namespace(**{**vars(args), 'seconds': 1.0}), 'off')  # warm-up
+    modes = ('off', 'monitor', 'profiler')
+    results = {mode: [] for mode in modes}
+    for _ in range(args.rounds):
+        for mode in modes:
+            results[mode].append(await run(args, mode))
+
+    baseline = None
+    for mode in modes:
+        result = results[mode][-1]
+        result['steps_per_s'] = statistics.median(r['steps_per_s'] for r in results[mode])
+        baseline = baseline or result['steps_per_s']
+        line = f"  {mode:>8}: {result['steps_per_s']:10.0f} steps/s ({result['steps_per_s'] / baseline - 1:+.1%})"
+        if 'stalls' in result:
+            line += f"  stalls {result['stalls']}, lag p50/p99 {result['lag']['p50']}/{result['lag']['p99']} ms, stack samples {result['caught']}"
+        print(line)
+        if 'profile_samples' in result:
+            print(f"            profiler: {result['profile_samples']} samples, loop thread inside blockers {result['profile_blocked']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--stall-every", type=float, default=0.5)
+    parser.add_argument("--stall-ms", type=float, default=250.0)
+    parser.add_argument("--threshold-ms", type=float, default=100.0)
+    parser.add_argument("--profile-interval-ms", type=float, default=10.0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Cost of per-stage timing: the old print() lines vs. Metrics histograms.
+
+The endpoints used to print two lines per stage ("Processing image..." and
+"... took: 0.12 seconds"). This times one stage both ways for `--iterations`
+rounds: the prints going to a line-buffered /dev/null (one write syscall per
+line, like a terminal or a pipe to a log collector) and the histogram via
+`with metrics.stage(path, stage).time()`, with and without the label lookup.
+It also reports how long rendering /metrics takes with every path/stage
+series of vision_api populated.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.metrics_overhead --iterations 200000
+"""
+import argparse, asyncio, os, random, time
+from utils.Metrics import Metrics
+
+STAGES = {
+    'analyze_image': ('read', 'preprocess', 'model', 'tts', 'response', 'total'),
+    'qa': ('read', 'preprocess', 'stt', 'model', 'tts', 'response', 'total'),
+    'tts': ('tts',),
+    'translate_tts': ('tts',),
+    'location': ('update', 'user_info', 'proximity', 'fanout', 'db_write'),
+    'nearby_users': ('proximity_query',),
+}
+
+
+def per_op_ns(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    fn(iterations)
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def empty(iterations):
+    for _ in range(iterations):
+        pass
+
+
+def prints(iterations):
+    with open(os.devnull, 'w', buffering=1) as out:
+        for _ in range(iterations):
+            start_time = time.time()
+            print("Processing image...", file=out)
+            print(f"Processing image took: {time.time() - start_time:.2f} seconds", file=out)
+
+
+def timed_lookup(metrics):
+    def run(iterations):
+        for _ in range(iterations):
+            with metrics.stage('analyze_image', 'preprocess').time():
+                pass
+    return run
+
+
+def timed_bound(histogram):
+    def run(iterations):
+        for _ in range(iterations):
+            with histogram.time():
+                pass
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=48)
+    args = parser.parse_args()
+
+    metrics = Metrics()
+    baseline = per_op_ns(empty, args.iterations)
+    results = {
+        'print (2 lines)': per_op_ns(prints, args.iterations),
+        'histogram, labels per call': per_op_ns(timed_lookup(metrics), args.iterations),
+        'histogram, pre-bound': per_op_ns(timed_bound(metrics.stage('analyze_image', 'model')), args.iterations),
+    }
+    print(f"{args.iterations} timed stages, ns per stage (loop overhead {baseline:.0f} ns subtracted)")
+    for name, ns in results.items():
+        print(f"  {name:28} {ns - baseline:8.0f}")
+
+    rng = random.Random(args.seed)
+    for path, stages in STAGES.items():
+        for stage in stages:
+            histogram = metrics.stage(path, stage)
+            for _ in range(1000):
+                histogram.observe(rng.lognormvariate(-4, 1.5))
+    series = sum(len(stages) for stages in STAGES.values())
+    start = time.perf_counter()
+    rounds = 100
+    for _ in range(rounds):
+        text = asyncio.run(metrics.render())
+    print(f"  render /metrics ({series} stage series, {len(text.splitlines())} lines, {len(text) / 1e3:.1f} kB): "
+          f"{(time.perf_counter() - start) / rounds * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+get_nearby_users latency as the number of concurrent callers grows.
+
+The service runs against the in-memory storage backend, so the numbers
+cover only the server-side work. "legacy" replays the local
+part of the old whole-tree transaction (copy every node and recompute its
+online flag per query); the real thing also paid a network round trip and
+contention retries on top of it.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.nearby_latency --users 10000 --concurrency 1 10 100 1000
+"""
+import argparse, asyncio, random, statistics, time
+from datetime import datetime
+from utils.FirebaseLocation import FirebaseLocation
+from utils.Storage import create_storage
+
+CENTER = (10.7626, 106.6602)
+
+
+def legacy_read(service: FirebaseLocation, uid: str):
+    """CPU side of the removed `transaction(get_all_users)` callback"""
+    current_time = datetime.now()
+    current_data = service.location_store.records
+    modified_data = current_data.copy()
+    for other_id, other_data in current_data.items():
+        if other_id != uid and 'position' in other_data:
+            last_activity = datetime.fromisoformat(other_data['device_info']['last_activity'])
+            is_online = (current_time - last_activity).total_seconds() <= 300
+            if other_data.get('status', {}).get('online') != is_online:
+                modified_data[other_id] = {**other_data, 'status': {'online': is_online}}
+    return modified_data
+
+
+async def populate(service: FirebaseLocation, users: int, spread_km: float, rng: random.Random):
+    spread = spread_km / 111.32
+    for i in range(users):
+        await service.update_location(str(i), {
+            'latitude': CENTER[0] + rng.uniform(-spread, spread),
+            'longitude': CENTER[1] + rng.uniform(-spread, spread)
+        })
+
+
+async def run(service: FirebaseLocation, concurrency: int, requests: int, users: int, legacy: bool):
+    rng = random.Random(concurrency)
+    latencies = []
+
+    async def caller():
+        for _ in range(requests):
+            uid = str(rng.randrange(users))
+            start = time.perf_counter()
+            if legacy:
+                legacy_read(service, uid)
+            await service.get_nearby_users(uid)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return (
+        statistics.median(latencies) * 1e3,
+        latencies[int(len(latencies) * 0.99) - 1] * 1e3,
+        len(latencies) / elapsed
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--spread-km", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=20, help="queries per concurrent caller")
+    parser.add_argument("--legacy", action="store_true", help="also time the old whole-tree read")
+    args = parser.parse_args()
+
+    service = FirebaseLocation(create_storage('memory'))
+    await populate(service, args.users, args.spread_km, random.Random(30))
+
+    for concurrency in args.concurrency:
+        p50, p99, qps = await run(service, concurrency, args.requests, args.users, legacy=False)
+        line = f"concurrency={concurrency:>5}  p50={p50:7.3f}ms  p99={p99:7.3f}ms  {qps:9.0f} q/s"
+        if args.legacy:
+            p50, p99, qps = await run(service, concurrency, args.requests, args.users, legacy=True)
+            line += f"   legacy p50={p50:8.3f}ms  p99={p99:8.3f}ms  {qps:7.0f} q/s"
+        print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Profile image uploads: inline raw upload vs. ProfileImagePipeline.
+
+Generates `--distinct` phone-camera sized JPEGs and submits `--uploads`
+profile images drawn from them (so some are repeats) against the in-memory
+blob store with `--upload-ms` of simulated latency per object. "inline" is
+what registration used to wait for: one upload of the raw bytes. The
+pipeline returns after a header check, a local spool write and a job
+enqueue (JobQueue on a temporary SQLite file); the report also shows how
+long until every profile was patched, bytes stored and how many uploads
+were deduplicated.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.profile_images --uploads 20 --distinct 5
+"""
+import argparse, asyncio, os, random, statistics, tempfile, time, numpy as np
+from io import BytesIO
+from PIL import Image
+from utils.JobQueue import JobQueue, SQLiteJobBackend
+from utils.ProfileImagePipeline import ProfileImagePipeline
+from utils.Storage import MemoryBlobs, MemoryDocuments
+
+
+def photo(seed: int, width: int, height: int) -> bytes:
+    """A smooth gradient with sensor-like noise, encoded like a phone would"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    out = BytesIO()
+    Image.fromarray(pixels).save(out, format='JPEG', quality=92)
+    return out.getvalue()
+
+
+async def inline(images, upload_latency: float):
+    blobs = MemoryBlobs(upload_latency)
+    latencies = []
+    for k, image in enumerate(images):
+        start = time.perf_counter()
+        await blobs.put(f"profileImages/{k}.jpg", image, 'image/jpeg')
+        latencies.append((time.perf_counter() - start) * 1e3)
+    return latencies, sum(len(data) for data, _ in blobs.blobs.values())
+
+
+async def pipeline(images, upload_latency: float):
+    blobs = MemoryBlobs(upload_latency)
+    ready = {}
+    started = time.perf_counter()
+
+    async def on_ready(uid, urls):
+        ready[uid] = time.perf_counter() - started
+
+    jobs = JobQueue(SQLiteJobBackend(os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3')), poll_interval=0.05)
+    images_pipeline = ProfileImagePipeline(blobs, MemoryDocuments(), on_ready, jobs, spool_dir=tempfile.mkdtemp())
+    worker = asyncio.create_task(jobs.run())
+    latencies = []
+    for k, image in enumerate(images):
+        start = time.perf_counter()
+        await images_pipeline.submit(f"user-{k}", image)
+        latencies.append((time.perf_counter() - start) * 1e3)
+    while len(ready) + images_pipeline.stats['failed'] < len(images):
+        await asyncio.sleep(0.01)
+    await jobs.drain(timeout=None)
+    await worker
+    stored = sum(len(data) for data, _ in blobs.blobs.values())
+    return latencies, stored, max(ready.values()) * 1e3, images_pipeline.snapshot()
+
+
+async def main_async(args):
+    rng = random.Random(args.seed)
+    distinct = [photo(k, args.width, args.height) for k in range(args.distinct)]
+    images = [rng.choice(distinct) for _ in range(args.uploads)]
+    uploaded = sum(len(image) for image in images)
+    print(f"{args.uploads} uploads of {args.width}x{args.height} JPEGs ({uploaded / len(images) / 1e6:.2f} MB avg, "
+          f"{args.distinct} distinct), {args.upload_ms} ms per stored object")
+
+    latencies, stored = await inline(images, args.upload_ms / 1e3)
+    print(f"  inline:   response p50 {statistics.median(latencies):8.2f} ms   stored {stored / 1e6:6.2f} MB")
+
+    latencies, stored, all_ready, stats = await pipeline(images, args.upload_ms / 1e3)
+    print(f"  pipeline: response p50 {statistics.median(latencies):8.2f} ms   stored {stored / 1e6:6.2f} MB   "
+          f"all profiles patched after {all_ready:.0f} ms")
+    print(f"            processed {stats['processed']}, deduplicated {stats['deduplicated']}, "
+          f"renditions uploaded {stats['renditions_uploaded']}, failed {stats['failed']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--distinct", type=int, default=5)
+    parser.add_argument("--width", type=int, default=3024)
+    parser.add_argument("--height", type=int, default=4032)
+    parser.add_argument("--upload-ms", type=float, default=150.0)
+    parser.add_argument("--seed", type=int, default=46)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
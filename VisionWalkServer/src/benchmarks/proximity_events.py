@@ -0,0 +1,118 @@
+"""
+Moving-crowd simulation: incremental enter/move/leave vs. full recomputation.
+
+N users random-walk inside a square; each step one user moves and the
+neighbourhood of everyone around it must be brought up to date.
+
+  full         what the server did before: query the mover's radius and
+               send the whole neighbour list (one entry per user in range)
+  incremental  ProximityTracker.update: diff against the previous
+               neighbourhood and emit enter / move / leave events
+
+Reports update cost, events per update and how many of those events are
+membership changes (enter + leave). The simulation also checks that the
+tracked relation matches a brute-force recomputation at the end.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.proximity_events --users 1000 5000 --steps 20000
+"""
+import argparse, random, time
+from utils.SpatialIndex import SpatialIndex
+from utils.ProximityTracker import ProximityTracker
+
+CENTER = (10.7626, 106.6602)
+RADIUS_KM = 1.0
+
+
+def build(initial):
+    index = SpatialIndex()
+    for uid, position in initial.items():
+        index.update(uid, *position)
+    return index
+
+
+def simulate(n: int, args):
+    rng = random.Random(args.seed)
+    spread = args.spread_km / 111.32
+    step_deg = args.speed_mps * args.dt / 111320.0
+    clamp = lambda value, center: min(max(value, center - spread), center + spread)
+
+    initial = {
+        f"user-{i}": (CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread))
+        for i in range(n)
+    }
+    uids = list(initial)
+    positions = dict(initial)
+    walk = []
+    for _ in range(args.steps):
+        uid = rng.choice(uids)
+        latitude, longitude = positions[uid]
+        positions[uid] = (
+            clamp(latitude + rng.uniform(-step_deg, step_deg), CENTER[0]),
+            clamp(longitude + rng.uniform(-step_deg, step_deg), CENTER[1])
+        )
+        walk.append((uid, positions[uid]))
+
+    # Both strategies replay the same walk on their own index
+    index = build(initial)
+    full_entries = 0
+    start = time.perf_counter()
+    for uid, position in walk:
+        index.update(uid, *position)
+        full_entries += len(index.query_radius(*position, RADIUS_KM, exclude=uid))
+    full_seconds = time.perf_counter() - start
+
+    index = build(initial)
+    tracker = ProximityTracker(index, RADIUS_KM)
+    for uid in uids:
+        tracker.update(uid)
+    tracker.stats.update({'updates': 0, 'enters': 0, 'moves': 0, 'leaves': 0})
+    start = time.perf_counter()
+    for uid, position in walk:
+        index.update(uid, *position)
+        tracker.update(uid)
+    incremental_seconds = time.perf_counter() - start
+
+    # The relation must equal a from-scratch recomputation (up to hysteresis)
+    mismatches = 0
+    for uid in uids:
+        position = index.get(uid)
+        exact = {other for other, _ in index.query_radius(*position, RADIUS_KM, exclude=uid)}
+        loose = {other for other, _ in index.query_radius(*position, tracker.leave_radius_km, exclude=uid)}
+        tracked = {other for other, _ in tracker.neighbors(uid)}
+        if not exact <= tracked <= loose:
+            mismatches += 1
+
+    stats = tracker.stats
+    steps = len(walk)
+    return {
+        'full_us': full_seconds / steps * 1e6,
+        'full_entries': full_entries / steps,
+        'incremental_us': incremental_seconds / steps * 1e6,
+        'events': (stats['enters'] + stats['moves'] + stats['leaves']) / steps,
+        'changes': (stats['enters'] + stats['leaves']) / steps,
+        'mismatches': mismatches
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[1_000, 5_000])
+    parser.add_argument("--steps", type=int, default=20_000)
+    parser.add_argument("--spread-km", type=float, default=2.0, help="half-width of the square")
+    parser.add_argument("--speed-mps", type=float, default=1.4)
+    parser.add_argument("--dt", type=float, default=5.0, help="seconds between two updates of a user")
+    parser.add_argument("--seed", type=int, default=38)
+    args = parser.parse_args()
+
+    print(f"{'users':>6} {'full us':>9} {'entries':>9} {'incr us':>9} {'events':>8} {'enter+leave':>12} {'mismatch':>9}")
+    for n in args.users:
+        row = simulate(n, args)
+        print(
+            f"{n:6} {row['full_us']:9.1f} {row['full_entries']:9.1f} {row['incremental_us']:9.1f} "
+            f"{row['events']:8.1f} {row['changes']:12.2f} {row['mismatches']:9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
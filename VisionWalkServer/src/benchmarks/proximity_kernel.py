@@ -0,0 +1,70 @@
+"""
+Vectorized haversine kernel vs. the per-user geodesic loop from get_nearby_users.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.proximity_kernel --sizes 1000 10000 100000
+"""
+import argparse, random, time, numpy as np
+from geopy.distance import geodesic
+from utils.geo import within_radius
+
+CENTER = (10.7626, 106.6602)
+RADIUS_KM = 1.0
+
+
+def per_user_loop(users, origin):
+    """The pre-kernel loop: one tuple and one geodesic per user"""
+    result = []
+    for uid, position in users.items():
+        other_location = (position['latitude'], position['longitude'])
+        distance = geodesic(origin, other_location).km
+        if distance <= RADIUS_KM:
+            result.append((uid, distance))
+    return sorted(result, key=lambda item: item[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--spread-km", type=float, default=3.0, help="half-width of the candidate box")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=28)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    spread = args.spread_km / 111.32
+    for n in args.sizes:
+        users = {
+            str(i): {
+                'latitude': CENTER[0] + rng.uniform(-spread, spread),
+                'longitude': CENTER[1] + rng.uniform(-spread, spread)
+            }
+            for i in range(n)
+        }
+        uids = list(users)
+        lats = np.array([users[uid]['latitude'] for uid in uids])
+        lons = np.array([users[uid]['longitude'] for uid in uids])
+
+        start = time.perf_counter()
+        expected = per_user_loop(users, CENTER)
+        loop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            idx, distances = within_radius(CENTER[0], CENTER[1], lats, lons, RADIUS_KM)
+        kernel = (time.perf_counter() - start) / args.repeat
+
+        same = {uid for uid, _ in expected} == {uids[i] for i in idx.tolist()}
+        max_err_m = max(
+            (abs(d - e) * 1000 for d, (_, e) in zip(distances.tolist(), expected)),
+            default=0.0
+        )
+        print(
+            f"n={n:>7}  loop={loop * 1e3:9.2f}ms  kernel={kernel * 1e3:7.3f}ms  "
+            f"speedup={loop / kernel:8.1f}x  hits={len(idx)}  same_set={same}  "
+            f"max_err={max_err_m:.2f}m"
+        )
+
+
+if __name__ == "__main__":
+    main()
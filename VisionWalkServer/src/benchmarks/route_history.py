@@ -0,0 +1,97 @@
+"""
+Route history queries on TrajectoryStore.
+
+Simulates one user walking for `--hours` at one fix per second, persists it
+in segments to the in-memory tree store, then asks for the whole walk
+(older part read back from "the database", recent part from the ring
+buffer) simplified with Douglas-Peucker and with time buckets. Reports query
+latency, points returned and the largest distance between a raw fix and the
+simplified path.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.route_history --hours 2 --max-points 300
+"""
+import argparse, asyncio, math, random, statistics, time, numpy as np
+from utils.TrajectoryStore import TrajectoryStore
+from utils.Storage import MemoryTree
+
+CENTER = (10.7626, 106.6602)
+
+
+def walk(seconds: int, rng: random.Random):
+    """A pedestrian path: mostly straight streets with occasional turns and GPS noise"""
+    latitude, longitude, heading = *CENTER, rng.uniform(0, 360)
+    for second in range(seconds):
+        if rng.random() < 0.01:
+            heading = (heading + rng.choice((-90, 90))) % 360
+        step = 1.4 / 111320.0
+        latitude += step * math.cos(math.radians(heading))
+        longitude += step * math.sin(math.radians(heading)) / math.cos(math.radians(latitude))
+        noise = 2.0 / 111320.0
+        yield second, latitude + rng.gauss(0, noise), longitude + rng.gauss(0, noise), 1.4, heading
+
+
+def max_error_m(raw, route):
+    """Largest distance from a raw fix to the simplified polyline (equirectangular, metres)"""
+    scale = 111320.0
+    cos_lat = math.cos(math.radians(CENTER[0]))
+    to_xy = lambda lats, lons: (np.asarray(lons) * scale * cos_lat, np.asarray(lats) * scale)
+    rx, ry = to_xy(raw['lat'], raw['lon'])
+    px, py = to_xy([p['latitude'] for p in route], [p['longitude'] for p in route])
+    rt = raw['t']
+    pt = np.array([p['timestamp'] for p in route])
+    worst = 0.0
+    for k in range(len(route) - 1):
+        mask = (rt >= pt[k]) & (rt <= pt[k + 1])
+        ax, ay, bx, by = px[k], py[k], px[k + 1], py[k + 1]
+        dx, dy = bx - ax, by - ay
+        length = dx * dx + dy * dy or 1e-12
+        u = np.clip(((rx[mask] - ax) * dx + (ry[mask] - ay) * dy) / length, 0, 1)
+        distance = np.hypot(rx[mask] - (ax + u * dx), ry[mask] - (ay + u * dy))
+        if len(distance):
+            worst = max(worst, float(distance.max()))
+    return worst
+
+
+async def main_async(args):
+    rng = random.Random(args.seed)
+    store = TrajectoryStore(MemoryTree(), capacity=args.capacity)
+    seconds = int(args.hours * 3600)
+    t0 = time.time() - seconds
+    raw = {'t': [], 'lat': [], 'lon': []}
+    for second, latitude, longitude, speed, heading in walk(seconds, rng):
+        store.append('walker', latitude, longitude, t0 + second, speed, heading)
+        raw['t'].append(t0 + second)
+        raw['lat'].append(latitude)
+        raw['lon'].append(longitude)
+        if second % 30 == 29:
+            await store.persist()
+    await store.persist()
+    raw = {name: np.array(values) for name, values in raw.items()}
+
+    print(f"{seconds} fixes, {len(store.trajectories['walker'])} in memory, "
+          f"{store.stats['chunks_written']} chunks persisted")
+    print(f"{'method':>8} {'p50 ms':>8} {'points':>8} {'max err m':>10}")
+    for method in ('dp', 'bucket'):
+        latencies = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            route = await store.query('walker', t0, t0 + seconds, args.max_points, method, args.tolerance_m)
+            latencies.append((time.perf_counter() - start) * 1e3)
+        error = max_error_m(raw, route['points'])
+        print(f"{method:>8} {statistics.median(latencies):8.2f} {len(route['points']):8} {error:10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hours", type=float, default=2.0)
+    parser.add_argument("--capacity", type=int, default=3600, help="fixes kept in memory per user")
+    parser.add_argument("--max-points", type=int, default=300)
+    parser.add_argument("--tolerance-m", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=39)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Grid spatial index vs. the full per-user scan used by get_nearby_users.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.spatial_index --sizes 10000 100000 1000000
+"""
+import argparse, random, time
+from geopy.distance import geodesic
+from utils.SpatialIndex import SpatialIndex
+
+CENTER = (10.7626, 106.6602)  # Ho Chi Minh City
+RADIUS_KM = 1.0
+
+
+def random_points(n: int, area_km: float, rng: random.Random):
+    half_deg = area_km / 2 / SpatialIndex.KM_PER_DEG_LAT
+    return [
+        (CENTER[0] + rng.uniform(-half_deg, half_deg), CENTER[1] + rng.uniform(-half_deg, half_deg))
+        for _ in range(n)
+    ]
+
+
+def full_scan(points, origin):
+    result = []
+    for i, point in enumerate(points):
+        distance = geodesic(origin, point).km
+        if distance <= RADIUS_KM:
+            result.append((i, distance))
+    return sorted(result, key=lambda item: item[1])
+
+
+def bench(n: int, args, rng: random.Random):
+    points = random_points(n, args.area_km, rng)
+    queries = random_points(args.queries, args.area_km, rng)
+
+    index = SpatialIndex()
+    start = time.perf_counter()
+    for i, (lat, lon) in enumerate(points):
+        index.update(str(i), lat, lon)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i, (lat, lon) in enumerate(points[:args.queries]):
+        index.update(str(i), lat + 1e-5, lon + 1e-5)
+    update = (time.perf_counter() - start) / args.queries
+
+    start = time.perf_counter()
+    found = 0
+    for lat, lon in queries:
+        found += len(index.query_radius(lat, lon, RADIUS_KM))
+    radius = (time.perf_counter() - start) / args.queries
+
+    start = time.perf_counter()
+    for lat, lon in queries:
+        index.nearest(lat, lon, args.k)
+    knn = (time.perf_counter() - start) / args.queries
+
+    line = (
+        f"n={n:>8}  build={build:7.2f}s  update={update * 1e6:7.1f}us  "
+        f"radius={radius * 1e3:8.2f}ms (avg {found / args.queries:.0f} hits)  "
+        f"knn(k={args.k})={knn * 1e3:8.2f}ms"
+    )
+
+    if n <= args.scan_max:
+        scan_queries = queries[:args.scan_queries]
+        start = time.perf_counter()
+        for origin in scan_queries:
+            full_scan(points, origin)
+        scan = (time.perf_counter() - start) / len(scan_queries)
+        line += f"  full-scan={scan * 1e3:9.2f}ms  speedup={scan / radius:6.1f}x"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--area-km", type=float, default=50.0, help="side of the square users are spread over")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--scan-max", type=int, default=100_000, help="skip the full scan above this size")
+    parser.add_argument("--scan-queries", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=27)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for n in args.sizes:
+        bench(n, args, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Per-request token verification: jose decode every time vs. TokenCache.
+
+Issues `--users` access tokens shaped like FirebaseAdmin.create_tokens,
+then verifies `--requests` randomly chosen ones the way get_current_user
+did (jwt.decode + HMAC on every call) and through TokenCache (decode only
+on a miss). `--maxsize` below `--users` shows the cost of LRU churn.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.token_verify --users 2000 --requests 200000
+"""
+import argparse, random, time
+from datetime import datetime, timedelta
+from jose import jwt
+from utils.TokenCache import TokenCache
+from utils.types import TokenClaims
+
+SECRET, ALGORITHM = "benchmark-secret", "HS256"
+
+
+def issue(uid: int) -> str:
+    now = datetime.utcnow()
+    return jwt.encode({
+        "id": f"user-{uid}",
+        "email": f"user-{uid}@example.com",
+        "role": "user",
+        "phoneNumber": "0900000000",
+        "exp": now + timedelta(days=30),
+        "type": "access",
+        "iat": now
+    }, SECRET, algorithm=ALGORITHM)
+
+
+def decode(token: str) -> dict:
+    return jwt.decode(token, SECRET, algorithms=[ALGORITHM])
+
+
+def run(verify, tokens, order) -> float:
+    start = time.perf_counter()
+    for k in order:
+        verify(tokens[k])
+    return (time.perf_counter() - start) / len(order) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--maxsize", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=43)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tokens = [issue(uid) for uid in range(args.users)]
+    order = [rng.randrange(args.users) for _ in range(args.requests)]
+    cache = TokenCache(lambda token: TokenClaims(**decode(token)), maxsize=args.maxsize)
+
+    baseline = run(lambda token: decode(token)['id'], tokens, order)
+    cached = run(lambda token: cache.get(token).id, tokens, order)
+    stats = cache.snapshot()
+
+    print(f"{args.users} tokens, {args.requests} verifications, cache maxsize {args.maxsize}")
+    print(f"{'path':>12} {'us/request':>11}")
+    print(f"{'jwt.decode':>12} {baseline:11.2f}")
+    print(f"{'TokenCache':>12} {cached:11.2f}   ({baseline / cached:.1f}x, hit rate {stats['hit_rate']:.3f}, size {stats['size']})")
+
+    cache.revoke(tokens[0])
+    cache.revoke_user("user-1")
+    rejected = 0
+    for token in tokens[:2]:
+        try:
+            cache.get(token)
+        except Exception:
+            rejected += 1
+    print(f"revoked token + revoked user rejected: {rejected}/2")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+JSON vs. binary (`visionwalk.bin.v1`) framing for /ws/track.
+
+Inbound: decoding a client location (json.loads + pydantic Location vs.
+BinaryCodec.decode). Outbound: encoding the move events one
+subscriber receives while N neighbours keep moving (json.dumps vs.
+BinaryCodec.encode, where user info goes out once and is then referenced).
+Reports bytes and microseconds per message.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.track_protocol --neighbors 50 --updates 20000
+"""
+import argparse, json, random, time
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+from utils.TrackProtocol import BinaryCodec
+
+CENTER = (10.7626, 106.6602)
+
+
+class Location(BaseModel):
+    """Mirror of vision_api.Location (importing vision_api needs credentials)"""
+    latitude: float
+    longitude: float
+    accuracy: Optional[float] = 0
+    heading: Optional[float] = 0
+    speed: Optional[float] = 0
+
+
+def random_location(rng):
+    return {
+        'latitude': CENTER[0] + rng.uniform(-0.01, 0.01),
+        'longitude': CENTER[1] + rng.uniform(-0.01, 0.01),
+        'accuracy': rng.uniform(3, 20),
+        'heading': rng.uniform(0, 360),
+        'speed': rng.uniform(0, 2)
+    }
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--neighbors", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=36)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    # Inbound
+    locations = [random_location(rng) for _ in range(args.updates)]
+    json_in = [json.dumps(location) for location in locations]
+    binary_in = [BinaryCodec.encode_location(location) for location in locations]
+
+    json_decode_us = timed(lambda data: Location(**json.loads(data)).dict(), json_in)
+    binary_decode_us = timed(BinaryCodec.decode, binary_in)
+    json_in_bytes = sum(len(data.encode('utf-8')) for data in json_in) / len(json_in)
+    binary_in_bytes = sum(len(data) for data in binary_in) / len(binary_in)
+
+    # Outbound: one subscriber, `neighbors` users moving around it
+    infos = {
+        f"user-{i:04d}-{rng.getrandbits(64):016x}": {
+            'displayName': f"Người dùng {i}",
+            'profileImage': f"https://storage.googleapis.com/visionwalk/profile_images/{i}.jpg",
+            'email': f"user{i}@example.com"
+        }
+        for i in range(args.neighbors)
+    }
+    uids = list(infos)
+    frames = []
+    for location in locations:
+        uid = rng.choice(uids)
+        frames.append({
+            'type': 'move',
+            'id': uid,
+            'info': infos[uid],
+            'location': {**location, 'timestamp': datetime.now().isoformat()},
+            'distance': round(rng.uniform(0, 1), 2),
+            'status': 'active'
+        })
+
+    json_out_bytes = [0]
+    def encode_json(frame):
+        json_out_bytes[0] += len(json.dumps(frame).encode('utf-8'))
+
+    codec = BinaryCodec()
+    binary_out_bytes = [0]
+    def encode_binary(frame):
+        binary_out_bytes[0] += sum(len(message) for message in codec.encode(frame))
+
+    json_encode_us = timed(encode_json, frames)
+    binary_encode_us = timed(encode_binary, frames)
+
+    print(f"{'':22}{'json':>12}{'binary':>12}{'ratio':>8}")
+    print(f"{'inbound bytes/msg':22}{json_in_bytes:12.1f}{binary_in_bytes:12.1f}{json_in_bytes / binary_in_bytes:8.1f}x")
+    print(f"{'inbound decode us/msg':22}{json_decode_us:12.2f}{binary_decode_us:12.2f}{json_decode_us / binary_decode_us:8.1f}x")
+    n = len(frames)
+    print(f"{'outbound bytes/msg':22}{json_out_bytes[0] / n:12.1f}{binary_out_bytes[0] / n:12.1f}"
+          f"{json_out_bytes[0] / binary_out_bytes[0]:8.1f}x")
+    print(f"{'outbound encode us/msg':22}{json_encode_us:12.2f}{binary_encode_us:12.2f}{json_encode_us / binary_encode_us:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Login and profile lookups: Firestore queries per request vs. UserDirectory.
+
+The in-memory document store answers every read and query after
+`--latency-ms` of simulated round trip. A stream of requests, half logins
+by email and half /user/profile reads, picks users with a skewed
+popularity. It runs once the way FirebaseAdmin used to
+(`where(email == ...)` per login, a document get per profile read) and
+once through UserDirectory. Reports Firestore round trips per request,
+mean latency and cache hit rates.
+
+Run from VisionWalkServer/src:
+    python -m benchmarks.user_directory --users 1000 --requests 5000
+"""
+import argparse, asyncio, random, time
+from utils.UserDirectory import UserDirectory
+from utils.Storage import MemoryDocuments
+
+
+def workload(users: int, requests: int, rng: random.Random):
+    weights = [1 / (rank + 1) for rank in range(users)]
+    for uid in rng.choices(range(users), weights, k=requests):
+        yield ('login' if rng.random() < 0.5 else 'profile'), f"user-{uid}"
+
+
+async def old_path(documents, kind, uid):
+    if kind == 'login':
+        found = await documents.find('users', "email", f"{uid}@example.com")
+        return found[0][1] if found else None
+    return await documents.get('users', uid)
+
+
+async def run(args, use_directory: bool):
+    documents = MemoryDocuments(args.latency_ms / 1e3)
+    for k in range(args.users):
+        await documents.set('users', f"user-{k}", {'id': f"user-{k}", 'email': f"user-{k}@example.com", 'displayName': f"User {k}"})
+    directory = UserDirectory(documents)
+    documents.calls = 0
+
+    rng = random.Random(args.seed)
+    latencies = []
+    for kind, uid in workload(args.users, args.requests, rng):
+        start = time.perf_counter()
+        if not use_directory:
+            user = await old_path(documents, kind, uid)
+        elif kind == 'login':
+            user = await directory.find_by_email(f"{uid}@example.com")
+        else:
+            user = await directory.get(uid)
+        assert user is not None and user['id'] == uid
+        latencies.append((time.perf_counter() - start) * 1e3)
+    return documents.calls, latencies, directory.snapshot()
+
+
+async def main_async(args):
+    print(f"{args.users} users, {args.requests} requests, {args.latency_ms} ms per Firestore call")
+    print(f"{'path':>10} {'trips/req':>10} {'mean ms':>8} {'hit rate':>9} {'email hit':>10} {'backfilled':>11}")
+    for name, use_directory in (('query', False), ('directory', True)):
+        trips, latencies, stats = await run(args, use_directory)
+        hits = f"{stats['hit_rate']:9.3f} {stats['email_hit_rate']:10.3f} {stats['backfilled']:11}" if use_directory else ""
+        print(f"{name:>10} {trips / args.requests:10.3f} {sum(latencies) / len(latencies):8.3f} {hits}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=44)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
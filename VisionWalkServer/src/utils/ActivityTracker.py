@@ -0,0 +1,62 @@
+from typing import Dict, List, Set
+from redis import asyncio as aioredis
+
+class ActivityTracker:
+    """
+    Last-activity index kept in a Redis sorted set (member = uid,
+    score = epoch seconds of the last activity).
+
+    `touch` / `forget` only record locally; `sweep` pushes them with a single
+    pipelined ZADD / ZREM and, in the same round trip, atomically pops the
+    members older than the cutoff. A sweep therefore costs O(log N + expired)
+    however many users are tracked, and with several workers sharing the set
+    each user is expired by exactly one of them.
+    """
+    POP_EXPIRED_SCRIPT = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+    if #expired > 0 then
+        redis.call('ZREM', KEYS[1], unpack(expired))
+    end
+    return expired
+    """
+
+    def __init__(self, key: str = 'locations:last_activity', batch_size: int = 500):
+        self.key = key
+        self.batch_size = batch_size
+        self._pending: Dict[str, float] = {}
+        self._removed: Set[str] = set()
+        self._pop_expired = None
+
+    def touch(self, uid: str, timestamp: float):
+        self._removed.discard(uid)
+        self._pending[uid] = max(timestamp, self._pending.get(uid, 0.0))
+
+    def forget(self, uid: str):
+        self._pending.pop(uid, None)
+        self._removed.add(uid)
+
+    async def sweep(self, redis: aioredis.Redis, cutoff: float) -> List[str]:
+        """Sync local changes and pop up to batch_size users idle since before cutoff"""
+        if self._pop_expired is None:
+            self._pop_expired = redis.register_script(self.POP_EXPIRED_SCRIPT)
+
+        pending, removed = self._pending, self._removed
+        self._pending, self._removed = {}, set()
+
+        try:
+            pipe = redis.pipeline(transaction=False)
+            if pending:
+                pipe.zadd(self.key, pending)
+            if removed:
+                pipe.zrem(self.key, *removed)
+            await self._pop_expired(keys=[self.key], args=[cutoff, self.batch_size], client=pipe)
+            results = await pipe.execute()
+        except BaseException:
+            # Keep what has not been written; newer local changes win
+            for uid, timestamp in pending.items():
+                if uid not in self._removed:
+                    self._pending[uid] = max(timestamp, self._pending.get(uid, 0.0))
+            self._removed |= {uid for uid in removed if uid not in self._pending}
+            raise
+
+        return list(results[-1] or [])
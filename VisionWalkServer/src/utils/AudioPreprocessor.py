@@ -1,23 +1,36 @@
-import os, time, librosa, soundfile as sf, noisereduce as nr, numpy as np
+import os, uuid, librosa, soundfile as sf, noisereduce as nr, numpy as np, numpy.typing as npt
+from io import BytesIO
 from typing import Tuple
 
 class AudioPreprocessor:
-    def __init__(self):
+    def __init__(self, target_sr: int = 16000):
         self.temp_dir = "temp_audio"
         os.makedirs(self.temp_dir, exist_ok=True)
-        
+
+        # Must match GoogleCloudAPI.default_stt_config (FLAC, 16 kHz, mono)
+        self.target_sr = target_sr
+        self.output_format = "FLAC"
+
+        # Voice activity detection
+        self.frame_ms = 30
+        self.hop_ms = 10
+        self.energy_range_db = 35      # frames quieter than peak - 35 dB are silence
+        self.noise_margin_db = 6       # ... unless they are this far above the noise floor
+        self.zcr_threshold = 0.25      # unvoiced consonants: low energy, high zero-crossing rate
+        self.min_silence_s = 0.4       # internal pauses shorter than this are kept
+        self.keep_silence_s = 0.15     # padding kept around each speech segment
+
     async def denoise_audio(self, audio_data: bytes) -> Tuple[bytes, dict]:
-        temp_path = os.path.join(self.temp_dir, f"temp_{int(time.time())}.wav")
-        output_path = os.path.join(self.temp_dir, f"processed_{int(time.time())}.wav")
-        
+        temp_path = os.path.join(self.temp_dir, f"temp_{uuid.uuid4().hex}")
+
         try:
             # Save temporary file
             with open(temp_path, "wb") as f:
                 f.write(audio_data)
-            
-            # Load and process audio
-            audio, sr = librosa.load(temp_path, sr=None)
-            
+
+            # Load, downmix and resample once to the recognizer's rate
+            audio, sr = librosa.load(temp_path, sr=self.target_sr, mono=True)
+
             # Apply noise reduction
             reduced_noise = nr.reduce_noise(
                 y=audio,
@@ -26,28 +39,84 @@ class AudioPreprocessor:
                 stationary=True,
                 time_constant_s=2.0
             )
-            
+
+            # Drop leading, trailing and long internal silence
+            speech = self.trim_silence(reduced_noise, sr)
+
             # Normalize audio
-            normalized_audio = librosa.util.normalize(reduced_noise)
-            
-            # Save processed audio
-            sf.write(output_path, normalized_audio, sr, subtype='PCM_16')
-            
-            # Read processed audio
-            with open(output_path, "rb") as f:
-                processed_audio = f.read()
-            
+            normalized_audio = librosa.util.normalize(speech)
+
+            # Encode losslessly in memory
+            buffer = BytesIO()
+            sf.write(buffer, normalized_audio, sr, format=self.output_format, subtype='PCM_16')
+            processed_audio = buffer.getvalue()
+
             metadata = {
                 "sample_rate": sr,
+                "encoding": self.output_format,
                 "duration": len(audio) / sr,
+                "speech_duration": len(speech) / sr,
                 "original_size": len(audio_data),
                 "processed_size": len(processed_audio)
             }
-            
+
             return processed_audio, metadata
-            
+
         finally:
             # Cleanup
-            for path in [temp_path, output_path]:
-                if os.path.exists(path):
-                    os.remove(path)
\ No newline at end of file
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def trim_silence(self, audio: npt.NDArray, sr: int) -> npt.NDArray:
+        """
+        Energy / zero-crossing VAD. Returns the audio with silence removed,
+        or the input unchanged when no speech could be detected.
+        """
+        frame_len = int(sr * self.frame_ms / 1000)
+        hop = int(sr * self.hop_ms / 1000)
+        if len(audio) < frame_len:
+            return audio
+
+        frames = np.lib.stride_tricks.sliding_window_view(audio, frame_len)[::hop]
+
+        energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+        threshold_db = max(
+            energy_db.max() - self.energy_range_db,
+            np.percentile(energy_db, 10) + self.noise_margin_db
+        )
+        speech = (energy_db > threshold_db) | (
+            (energy_db > threshold_db - 10) & (zcr > self.zcr_threshold)
+        )
+        if not speech.any():
+            return audio
+
+        speech = self._fill_short_gaps(speech, int(self.min_silence_s * 1000 / self.hop_ms))
+
+        # Dilate so word onsets / tails are not clipped
+        pad = int(self.keep_silence_s * 1000 / self.hop_ms)
+        speech = np.convolve(speech, np.ones(2 * pad + 1), mode='same') > 0
+
+        # One hop of samples per frame, the final frame also owns the tail
+        sample_mask = np.repeat(speech, hop)
+        tail = len(audio) - len(sample_mask)
+        if tail > 0:
+            sample_mask = np.concatenate((sample_mask, np.full(tail, speech[-1])))
+        return audio[sample_mask[:len(audio)]]
+
+    @staticmethod
+    def _fill_short_gaps(mask: npt.NDArray, min_gap: int) -> npt.NDArray:
+        """Mark interior silence runs shorter than min_gap frames as speech."""
+        padded = np.concatenate(([True], mask, [True])).astype(np.int8)
+        edges = np.flatnonzero(np.diff(padded))
+        starts, ends = edges[::2], edges[1::2]
+
+        interior = (starts > 0) & (ends < len(mask))
+        short = interior & ((ends - starts) < min_gap)
+
+        delta = np.zeros(len(mask) + 1, dtype=np.int32)
+        np.add.at(delta, starts[short], 1)
+        np.add.at(delta, ends[short], -1)
+        return mask | (np.cumsum(delta[:-1]) > 0)
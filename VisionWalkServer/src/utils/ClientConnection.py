@@ -0,0 +1,164 @@
+import asyncio, logging
+from collections import OrderedDict, deque
+from typing import Dict, Hashable, Optional, Union
+from fastapi import WebSocket
+from .TrackProtocol import JsonCodec
+
+logger = logging.getLogger(__name__)
+
+Frame = Union[Dict, str]
+
+class ClientConnection:
+    """
+    Outbound side of one websocket: a bounded queue drained by its own writer task.
+
+    `send` never awaits the socket. Frames sent with a coalescing `key` (e.g. the
+    move of one particular user) replace a queued frame with the same key, so a
+    slow consumer only receives the newest state. When the queue is full the
+    oldest keyed frame is dropped. Unkeyed control frames (enter, leave, errors,
+    pings) are written before keyed ones and never dropped: if they alone fill
+    the queue the socket is closed with 1013 so the client reconnects and gets
+    a fresh neighbour snapshot instead of silently missing an enter or leave.
+
+    Frames are queued as dicts/strings and only turned into wire messages by
+    `codec` when written, so coalescing works the same for every protocol.
+
+    With a `tick_interval` the keyed frames are not written one by one: once
+    per tick everything pending goes out as a single `location_batch` frame
+    holding the newest frame of each key, so a subscriber in a crowd gets a
+    bounded number of frames per second however many neighbours move.
+    """
+    def __init__(
+        self,
+        websocket: WebSocket,
+        uid: str,
+        max_queue: int = 64,
+        codec=None,
+        tick_interval: Optional[float] = None
+    ):
+        self.websocket = websocket
+        self.uid = uid
+        self.max_queue = max_queue
+        self.codec = codec or JsonCodec()
+        self.tick_interval = tick_interval
+
+        self._latest: "OrderedDict[Hashable, Frame]" = OrderedDict()
+        self._control: deque = deque()
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._closer: Optional[asyncio.Task] = None
+        self.closed = False
+
+        self.stats = {
+            'enqueued': 0, 'sent': 0, 'coalesced': 0, 'dropped': 0, 'max_depth': 0, 'batches': 0, 'overflowed': 0
+        }
+
+    @property
+    def depth(self) -> int:
+        return len(self._latest) + len(self._control)
+
+    def start(self):
+        self._writer = asyncio.create_task(self._run())
+
+    def close(self):
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        self._latest.clear()
+        self._control.clear()
+
+    def send(self, frame: Frame, key: Optional[Hashable] = None) -> bool:
+        """Enqueue a frame; returns False if it was dropped"""
+        if self.closed:
+            return False
+
+        if key is not None and key in self._latest:
+            # Keep the queue position, replace the content
+            self._latest[key] = frame
+            self.stats['coalesced'] += 1
+            return True
+
+        if self.depth >= self.max_queue:
+            if self._latest:
+                self._latest.popitem(last=False)
+                self.stats['dropped'] += 1
+            elif key is None:
+                self._overflow()
+                return False
+            else:
+                self.stats['dropped'] += 1
+                return False
+
+        if key is None:
+            self._control.append(frame)
+        else:
+            self._latest[key] = frame
+
+        self.stats['enqueued'] += 1
+        self.stats['max_depth'] = max(self.stats['max_depth'], self.depth)
+        self._ready.set()
+        return True
+
+    def discard(self, key: Hashable) -> bool:
+        """Drop the queued frame for `key`, e.g. a move overtaken by a leave"""
+        return self._latest.pop(key, None) is not None
+
+    def _overflow(self):
+        self.stats['overflowed'] += 1
+        self.close()
+        self._closer = asyncio.create_task(self._close_socket(1013))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _write(self, frame: Frame):
+        for message in self.codec.encode(frame):
+            if isinstance(message, bytes):
+                await self.websocket.send_bytes(message)
+            elif isinstance(message, str):
+                await self.websocket.send_text(message)
+            else:
+                await self.websocket.send_json(message)
+        self.stats['sent'] += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        try:
+            while True:
+                await self._ready.wait()
+                if self.tick_interval:
+                    delay = next_tick - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_tick = loop.time() + self.tick_interval
+                self._ready.clear()
+
+                if self.tick_interval:
+                    while self._control:
+                        await self._write(self._control.popleft())
+                    if self._latest:
+                        updates = list(self._latest.values())
+                        self._latest.clear()
+                        await self._write({'type': 'location_batch', 'updates': updates})
+                        self.stats['batches'] += 1
+                    continue
+
+                while self._control or self._latest:
+                    if self._control:
+                        frame = self._control.popleft()
+                    else:
+                        _, frame = self._latest.popitem(last=False)
+                    await self._write(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Writer for %s stopped: %s", self.uid, e)
+            self.closed = True
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, 'depth': self.depth, 'closed': self.closed, 'protocol': self.codec.subprotocol or 'json'}
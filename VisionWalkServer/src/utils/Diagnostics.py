@@ -0,0 +1,204 @@
+import asyncio, os, sys, threading, time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Optional
+from .Metrics import Metrics
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def collapse(frame, prefix: str = '', max_depth: int = 64) -> str:
+    """One stack as `prefix;outermost;...;innermost`, the collapsed format of flamegraph.pl / speedscope"""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    if prefix:
+        names.append(prefix)
+    return ';'.join(reversed(names))
+
+
+def render_collapsed(stacks: Counter) -> str:
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class LoopLagMonitor:
+    """
+    Event-loop lag monitor.
+
+    A heartbeat task sleeps `interval` seconds at a time and records how
+    late it wakes up (the lag every other coroutine saw) in a histogram. A
+    watchdog thread checks the heartbeat every `threshold / 2` seconds; while
+    it is more than `threshold` late, the loop is stalled and the watchdog
+    samples the loop thread's stack with sys._current_frames. Each stall is
+    kept (start, duration, sampled stacks) in a bounded list and all sampled
+    stacks are counted for a collapsed-stack dump. Outside stalls the cost is
+    one timer per `interval` on the loop and one clock read per check.
+    """
+    def __init__(
+        self,
+        threshold: float = 0.1,
+        interval: float = 0.05,
+        max_stalls: int = 100,
+        max_stacks: int = 1000,
+        metrics: Optional[Metrics] = None
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.check_interval = threshold / 2
+        self.max_stacks = max_stacks
+        self.stalls: Deque[Dict] = deque(maxlen=max_stalls)
+        self.stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._beat = time.monotonic()
+        self._last_lag = 0.0
+        self._current: Optional[Dict] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        metrics = metrics or Metrics()
+        self.lag = metrics.histogram(
+            'visionwalk_event_loop_lag_seconds', 'How late the event loop heartbeat woke up',
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+        ).labels()
+        self.stall_count = metrics.counter(
+            'visionwalk_event_loop_stalls_total', 'Event loop stalls longer than the threshold'
+        ).labels()
+
+    def start(self):
+        """Start the heartbeat on the running loop and the watchdog thread"""
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        expected = loop.time() + self.interval
+        while True:
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            lag = max(0.0, now - expected)
+            self.lag.observe(lag)
+            self._last_lag = lag
+            self._beat = time.monotonic()
+            expected = now + self.interval
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            stalled_for = time.monotonic() - self._beat - self.interval
+            if stalled_for < self.threshold:
+                if self._current is not None:
+                    with self._lock:
+                        self._current['duration_ms'] = round(max(self._current['duration_ms'], self._last_lag * 1000), 1)
+                        self._current = None
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = collapse(frame)
+            del frame
+            with self._lock:
+                if self._current is None:
+                    self.stall_count.inc()
+                    self._current = {'started_at': time.time() - stalled_for, 'duration_ms': 0.0, 'stacks': Counter()}
+                    self.stalls.append(self._current)
+                self._current['duration_ms'] = round(stalled_for * 1000, 1)
+                self._current['stacks'][stack] += 1
+                if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                    self.stacks[stack] += 1
+
+    def collapsed(self) -> str:
+        with self._lock:
+            return render_collapsed(self.stacks)
+
+    def snapshot(self, limit: int = 20) -> Dict:
+        with self._lock:
+            stalls = [
+                {
+                    'started_at': stall['started_at'],
+                    'duration_ms': stall['duration_ms'],
+                    'ongoing': stall is self._current,
+                    'top_stack': stall['stacks'].most_common(1)[0][0] if stall['stacks'] else None,
+                    'samples': sum(stall['stacks'].values())
+                }
+                for stall in list(self.stalls)[-limit:]
+            ]
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'lag_ms': {
+                'p50': round(self.lag.quantile(0.5) * 1000, 3),
+                'p99': round(self.lag.quantile(0.99) * 1000, 3)
+            },
+            'stalls_total': int(self.stall_count.value),
+            'recent_stalls': stalls
+        }
+
+
+class SamplingProfiler:
+    """
+    Time-boxed wall-clock sampling profiler for all threads (or only the
+    event loop thread). Samples sys._current_frames every `interval`
+    seconds on a thread of its own and returns collapsed stacks prefixed with
+    the thread name. Only one profile runs at a time and `duration` is capped
+    at `max_duration`, so it is safe to leave reachable in production.
+    """
+    def __init__(self, max_duration: float = 30.0, min_interval: float = 0.001):
+        self.max_duration = max_duration
+        self.min_interval = min_interval
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='profiler')
+        self._running = False
+
+    def _sample(self, duration: float, interval: float, only_thread: Optional[int]) -> Dict:
+        own = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (only_thread is not None and ident != only_thread):
+                    continue
+                stacks[collapse(frame, prefix=names.get(ident, str(ident)))] += 1
+            frame = None  # do not keep the last sampled frame alive while sleeping
+            samples += 1
+            time.sleep(interval)
+        return {'stacks': stacks, 'samples': samples}
+
+    async def profile(self, duration: float = 5.0, interval: float = 0.01, loop_only: bool = False) -> Dict:
+        if self._running:
+            raise ProfilerBusy("A profile is already running")
+        self._running = True
+        try:
+            duration = min(max(duration, 0.1), self.max_duration)
+            interval = max(interval, self.min_interval)
+            only_thread = threading.get_ident() if loop_only else None
+            started = time.perf_counter()
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._sample, duration, interval, only_thread
+            )
+            return {
+                'duration': round(time.perf_counter() - started, 3),
+                'interval': interval,
+                'samples': result['samples'],
+                'collapsed': render_collapsed(result['stacks'])
+            }
+        finally:
+            self._running = False
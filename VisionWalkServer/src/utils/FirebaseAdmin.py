@@ -0,0 +1,318 @@
+from typing import Awaitable, Callable, Dict, Optional
+import logging, os
+from datetime import datetime
+from fastapi import HTTPException
+import uuid
+from jose import JWTError, jwt
+from datetime import timedelta
+from .PasswordHasher import PasswordHasher, HasherBusy
+from .TokenCache import TokenCache, TokenRevoked
+from .UserDirectory import UserDirectory, EmailTaken
+from .Storage import Storage, DocumentNotFound, create_storage
+from .ProfileImagePipeline import ProfileImagePipeline
+from .JobQueue import JobQueue, create_job_queue
+from .types import TokenClaims
+
+logger = logging.getLogger(__name__)
+
+class FirebaseAdmin:
+    def __init__(
+        self,
+        credentials_path: Optional[str] = None,
+        storage: Optional[Storage] = None,
+        jobs: Optional[JobQueue] = None,
+        secret_key: Optional[str] = None,
+        spool_dir: Optional[str] = None
+    ):
+        # Khóa ký JWT bắt buộc phải cấu hình: không có giá trị mặc định để tránh token giả mạo
+        self.secret_key = secret_key or os.getenv("JWT_SECRET_KEY")
+        if not self.secret_key:
+            raise RuntimeError("JWT_SECRET_KEY is not set")
+        # Firestore/Storage qua lớp storage async (firebase hoặc memory, xem create_storage)
+        self.storage = storage or create_storage(credentials_path=credentials_path)
+        # Job queue bền cho việc chạy nền (xử lý ảnh), có retry khi lỗi
+        self.jobs = jobs or create_job_queue()
+        # Index email -> uid và cache hồ sơ: login/profile chỉ cần một lần đọc theo key
+        self.directory = UserDirectory(self.storage.documents, collection='users')
+        self.algorithm = "HS256"
+        self.access_token_expire_minutes = 60 * 24 * 30  # 30 days
+        self.refresh_token_expire_minutes = 60 * 24 * 365  # 1 year
+        # bcrypt chạy trên pool riêng, giới hạn hàng đợi để không làm nghẽn event loop
+        self.password_hasher = PasswordHasher(workers=2, max_pending=32, rounds=12)
+        # Token đã xác thực được cache tới `exp`, tránh decode + HMAC lại mỗi request
+        self.token_cache = TokenCache(
+            self._decode_claims,
+            maxsize=10000,
+            max_token_age=self.refresh_token_expire_minutes * 60
+        )
+        # Ảnh đại diện xử lý nền (chuẩn hóa, thumbnail, khử trùng lặp) rồi mới gắn URL vào hồ sơ
+        self.profile_images = ProfileImagePipeline(
+            self.storage.blobs,
+            self.storage.documents,
+            self._apply_profile_image,
+            self.jobs,
+            sizes=(512, 256, 96),
+            spool_dir=spool_dir
+        )
+        # Gọi sau khi hồ sơ đổi ở nền (ví dụ FirebaseLocation.update_user_info)
+        self.on_profile_changed: Optional[Callable[[str], Awaitable]] = None
+
+    def _busy(self) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"}
+        )
+
+    def _create_token(self, data: Dict, expire_minutes: int, token_type: str = "access") -> str:
+        to_encode = data.copy()
+        expire = datetime.utcnow() + timedelta(minutes=expire_minutes)
+        to_encode.update({
+            "exp": expire,
+            "type": token_type,
+            "iat": datetime.utcnow()
+        })
+        
+        return jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+
+    def create_tokens(self, user_data: Dict) -> Dict[str, str]:
+        token_data = {
+            "id": user_data["id"],
+            "email": user_data["email"],
+            "role": user_data.get("role", "user"),
+            "phoneNumber": user_data["phoneNumber"]
+        }
+        
+        access_token = self._create_token(
+            token_data, 
+            self.access_token_expire_minutes, 
+            "access"
+        )
+        refresh_token = self._create_token(
+            token_data, 
+            self.refresh_token_expire_minutes, 
+            "refresh"
+        )
+        
+        return {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "token_type": "bearer"
+        }
+
+    def verify_token(self, token: str) -> Dict:
+        try:
+            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            return payload
+        except JWTError:
+            raise HTTPException(
+                status_code=401,
+                detail="Could not validate credentials"
+            )
+
+    def _decode_claims(self, token: str) -> TokenClaims:
+        return TokenClaims(**self.verify_token(token))
+
+    def verify_claims(self, token: str) -> TokenClaims:
+        """verify_token qua cache, trả về claims có kiểu"""
+        try:
+            return self.token_cache.get(token)
+        except TokenRevoked:
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+
+    async def _apply_profile_image(self, uid: str, urls: Dict[str, str]):
+        """Gắn URL ảnh đã xử lý vào hồ sơ (callback của ProfileImagePipeline)"""
+        try:
+            await self.directory.update(uid, {
+                'profileImage': urls[str(self.profile_images.sizes[0])],
+                'profileImages': urls,
+                'updated_at': datetime.now()
+            })
+        except DocumentNotFound:
+            # User đã bị xóa trong lúc xử lý ảnh
+            return
+        if self.on_profile_changed is not None:
+            await self.on_profile_changed(uid)
+
+    def _check_image(self, image_bytes: bytes):
+        try:
+            self.profile_images.check(image_bytes)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid profile image: {str(e)}")
+
+    async def register_user(self, email: str, password: str, user_data: Dict, profile_image_file: Optional[bytes] = None) -> Dict:
+        try:
+            if await self.directory.uid_for_email(email) is not None:
+                raise HTTPException(status_code=400, detail="Email already registered")
+
+            if profile_image_file:
+                self._check_image(profile_image_file)
+
+            try:
+                hashed_password = await self.password_hasher.hash(password)
+            except HasherBusy:
+                raise self._busy()
+
+            user_id = str(uuid.uuid4())
+            user_doc = {
+                'id': user_id,
+                'email': email,
+                'password': hashed_password,
+                'salt': self.password_hasher.salt_of(hashed_password),
+                'created_at': datetime.now(),
+                'updated_at': datetime.now(),
+                "phoneNumber": user_data.get("phoneNumber", None),
+                'profileImage': None,
+                'displayName': user_data.get('displayName', None),
+                'role': 'user',
+                'is_active': True
+            }
+
+            try:
+                await self.directory.create(user_id, user_doc)
+            except EmailTaken:
+                raise HTTPException(status_code=400, detail="Email already registered")
+
+            # Ảnh được xử lý và upload ở nền, profileImage được cập nhật khi xong
+            if profile_image_file:
+                await self.profile_images.submit(user_id, profile_image_file)
+
+            tokens = self.create_tokens(user_doc)
+
+            return {
+                "user": {
+                    'id': user_id,
+                    'email': email,
+                    'profileImage': None,
+                    'profileImagePending': bool(profile_image_file),
+                    'displayName': user_data.get('displayName'),
+                    'phoneNumber': user_data.get('phoneNumber'),
+                },
+                **tokens,
+                'message': 'User registered successfully'
+            }
+
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            logger.exception("Registration failed")
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def login_user(self, email: str, password: str) -> Dict:
+        try:
+            user_doc = await self.directory.find_by_email(email)
+            if user_doc is None:
+                raise HTTPException(status_code=401, detail="Invalid credentials")
+            
+            try:
+                valid, upgraded = await self.password_hasher.verify_and_upgrade(password, user_doc['password'])
+            except HasherBusy:
+                raise self._busy()
+            if not valid:
+                raise HTTPException(status_code=401, detail="Invalid credentials")
+
+            if upgraded:
+                # Hash cũ có cost thấp hơn hiện tại: lưu lại hash mới
+                await self.directory.update(user_doc['id'], {
+                    'password': upgraded,
+                    'salt': self.password_hasher.salt_of(upgraded),
+                    'updated_at': datetime.now()
+                })
+
+            if not user_doc.get('is_active', True):
+                raise HTTPException(status_code=400, detail="Account is deactivated")
+
+            tokens = self.create_tokens(user_doc)
+
+            return {
+                'user': {
+                    'id': user_doc['id'],
+                    'email': email,
+                    'profileImage': user_doc.get('profileImage'),
+                    'displayName': user_doc.get('displayName'),
+                    'phoneNumber': user_doc.get('phoneNumber')
+                },
+                **tokens,
+                'message': "User login successfully"
+            }
+
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def refresh_tokens(self, refresh_token: str) -> Dict[str, str]:
+        try:
+            # Verify refresh token
+            payload = self.verify_token(refresh_token)
+            
+            if payload["type"] != "refresh":
+                raise HTTPException(status_code=401, detail="Invalid token type")
+            
+            # Get user data
+            user_data = await self.directory.get(payload["id"])
+            if user_data is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            
+            return self.create_tokens(user_data)
+            
+        except Exception as e:
+            raise HTTPException(status_code=401, detail=str(e))
+
+    async def upload_image(self, file_bytes: bytes, folder: str = "images") -> str:
+        try:
+            filename = f"{uuid.uuid4()}.jpg"
+            file_path = f"{folder}/{filename}"
+
+            return await self.storage.blobs.put(file_path, file_bytes, 'image/jpeg')
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
+
+    async def update_user_profile(self, id: str, update_data: Dict, profile_image_file: Optional[bytes] = None) -> Dict:
+        try:
+            if await self.directory.get(id) is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            if profile_image_file:
+                self._check_image(profile_image_file)
+
+            update_data['updated_at'] = datetime.now()
+            await self.directory.update(id, update_data)
+
+            if profile_image_file:
+                await self.profile_images.submit(id, profile_image_file)
+            user = await self.directory.get(id)
+            return {**user, 'profileImagePending': bool(profile_image_file)}
+
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def get_user_profile(self, id: str) -> Dict:
+        try:
+            user_data = await self.directory.get(id)
+            if user_data is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            
+            return {
+                'id': id,
+                'profileImage': user_data.get('profileImage'),
+                'role': user_data.get('role'),
+                'displayName': user_data.get('displayName'),
+                'email': user_data.get('email'),
+                'phoneNumber': user_data.get('phoneNumber')
+            }
+
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def delete_user(self, id: str) -> Dict:
+        try:
+            if await self.directory.get(id) is None:
+                raise HTTPException(status_code=404, detail="User not found")
+                
+            await self.directory.delete(id)
+            self.token_cache.revoke_user(id)
+            return {'message': 'User deleted successfully'}
+
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
@@ -1,80 +1,153 @@
-import asyncio
-from typing import Dict, List
+import asyncio, logging, time
+from typing import Dict, Iterable, List, Optional
 from datetime import datetime
-from geopy.distance import geodesic
 from fastapi import WebSocket
-from firebase_admin import db, firestore
-from cachetools import TTLCache
+from .SpatialIndex import SpatialIndex
+from .LocationStore import LocationStore
+from .ActivityTracker import ActivityTracker
+from .ClientConnection import ClientConnection
+from .GeoFanout import GeoFanout
+from .MotionFilter import MotionFilter
+from .UserInfoLoader import UserInfoLoader
+from .ProximityTracker import ProximityTracker
+from .TrajectoryStore import TrajectoryStore
+from .TrackProtocol import JsonCodec
+from .Storage import Storage, create_storage
+from .JobQueue import JobQueue, create_job_queue
+from .Metrics import Metrics
+
+logger = logging.getLogger(__name__)
 
 class FirebaseLocation:
-    def __init__(self):
-        # Realtime DB cho location tracking
-        self.rtdb = db
-        # Firestore cho user data
-        self.firestore = firestore.client()
-        # WebSocket connections
-        self.active_connections: Dict[str, WebSocket] = {}
-        # Cache cho user info để giảm số query đến Firestore
-        self.user_cache = TTLCache(maxsize=1000, ttl=300)  # Cache 5 phút
+    def __init__(self, storage: Optional[Storage] = None, jobs: Optional[JobQueue] = None, metrics: Optional[Metrics] = None):
+        # Realtime DB (tree) cho location tracking, Firestore (documents) cho user data;
+        # backend firebase hoặc memory chọn qua VISIONWALK_STORAGE
+        self.storage = storage or create_storage()
+        # Việc phụ (làm mới user info) đưa vào job queue bền, có retry và gộp theo uid
+        self.jobs = jobs or create_job_queue()
+        self.jobs.register('user_info', self._write_user_info, concurrency=8, max_attempts=5)
+        # Histogram cho từng bước của đường cập nhật vị trí (xem /metrics)
+        self.metrics = metrics or Metrics()
+        self.stage_update = self.metrics.stage('location', 'update')
+        self.stage_user_info = self.metrics.stage('location', 'user_info')
+        self.stage_proximity = self.metrics.stage('location', 'proximity')
+        self.stage_fanout = self.metrics.stage('location', 'fanout')
+        self.stage_nearby_query = self.metrics.stage('nearby_users', 'proximity_query')
+        # WebSocket connections, mỗi connection có hàng đợi gửi và writer task riêng
+        self.active_connections: Dict[str, ClientConnection] = {}
+        # Cache cho user info để giảm số query đến Firestore,
+        # các UID chưa có được gộp thành một get_many trên document store
+        self.user_info = UserInfoLoader(self.storage.documents, ttl=300)  # Cache 5 phút
+        # Grid index cho truy vấn lân cận, cập nhật theo từng update_location/disconnect
+        self.spatial_index = SpatialIndex()
         
         self.NEARBY_RADIUS_KM = 1.0  # Bán kính tìm kiếm (km)
+        self.ONLINE_TIMEOUT = 300     # Không hoạt động quá thời gian này thì hiển thị offline (giây)
         self.INACTIVE_TIMEOUT = 900   # Thời gian để xem user không hoạt động (5 phút)
-        self.CLEANUP_INTERVAL = 300    # Interval cho cleanup task (1 phút)
-
-        self._initialize_database()
-    
-    def _initialize_database(self):
-        """Khởi tạo cấu trúc cho Realtime Database"""
+        self.CLEANUP_INTERVAL = 0.5    # Interval cho cleanup task (giây)
+        self.FLUSH_INTERVAL = 1.0      # Chu kỳ ghi dồn vị trí xuống Realtime DB (giây)
+        self.MAX_STALENESS = 10.0      # Độ trễ ghi tối đa khi flush bị lỗi (giây)
+        self.SEND_QUEUE_SIZE = 256     # Số user lân cận tối đa chờ gửi cho mỗi connection
+        self.DELIVERY_TICK = 0.2       # Gom các sự kiện vị trí của một connection thành một frame mỗi tick (giây)
+        self.MOVE_THRESHOLD_M = 5.0    # Lệch khỏi vị trí dự đoán quá ngưỡng này mới broadcast (m)
+        self.HEADING_THRESHOLD_DEG = 20.0  # Đổi hướng quá ngưỡng này mới broadcast (độ)
+        self.KEYFRAME_INTERVAL = 10.0  # Broadcast ít nhất một lần mỗi khoảng này (giây)
+        self.TRAJECTORY_CAPACITY = 3600      # Số điểm lộ trình giữ trong bộ nhớ cho mỗi user
+        self.TRAJECTORY_SEGMENT = 300        # Độ dài mỗi đoạn lộ trình lưu xuống Realtime DB (giây)
+        self.TRAJECTORY_PERSIST_INTERVAL = 30.0  # Chu kỳ ghi các điểm lộ trình mới (giây)
+        self.DB_SYNC_INTERVAL = 1.0    # Khoảng tối thiểu giữa hai lần đọc lại /locations cho nearby-users (giây)
+
+        # Vị trí live trong bộ nhớ, ghi dồn (write-behind) xuống Realtime DB
+        self.location_store = LocationStore(
+            self.storage.tree,
+            flush_interval=self.FLUSH_INTERVAL,
+            max_staleness=self.MAX_STALENESS,
+            flush_timer=self.metrics.stage('location', 'db_write')
+        )
+        # Sorted set last_activity trên Redis để chỉ xử lý các user vừa hết hạn
+        self.activity_tracker = ActivityTracker()
+        # Bỏ qua các cập nhật mà dead-reckoning đã dự đoán được
+        self.motion_filter = MotionFilter(
+            distance_threshold_m=self.MOVE_THRESHOLD_M,
+            heading_threshold_deg=self.HEADING_THRESHOLD_DEG,
+            keyframe_interval=self.KEYFRAME_INTERVAL
+        )
+        # Fan-out giữa các worker qua Redis pub/sub, chia kênh theo ô của grid
+        self.fanout = GeoFanout(
+            self.spatial_index,
+            self.NEARBY_RADIUS_KM,
+            self._on_remote_message,
+            remote_ttl=self.ONLINE_TIMEOUT
+        )
+        # Lộ trình của từng user (ring buffer NumPy), lưu theo đoạn dưới /trajectories
+        self.trajectories = TrajectoryStore(
+            self.storage.tree,
+            capacity=self.TRAJECTORY_CAPACITY,
+            segment_seconds=self.TRAJECTORY_SEGMENT,
+            persist_interval=self.TRAJECTORY_PERSIST_INTERVAL
+        )
+        # Tập user lân cận của từng user, cập nhật dần khi có user di chuyển
+        self.proximity = ProximityTracker(self.spatial_index, self.NEARBY_RADIUS_KM)
+        # Lần đọc /locations đang chạy, dùng chung cho các request nearby-users đồng thời
+        self._db_sync: Optional[asyncio.Future] = None
+        self._db_synced_at = 0.0
+
+    async def initialize(self):
+        """Nạp vị trí hiện có từ Realtime Database, gọi một lần khi khởi động"""
         try:
-            root_ref = self.rtdb.reference('/')
-            locations_ref = root_ref.child('locations')
-            if not locations_ref.get():
-                locations_ref.set({})
+            locations = await self.storage.tree.get(self.location_store.root)
+            if not locations:
+                return
+
+            # Nạp dữ liệu hiện có vào location store và spatial index
+            self.location_store.load(locations)
+            for uid, data in locations.items():
+                if not isinstance(data, dict) or not data.get('status', {}).get('online', False):
+                    continue
+                position = data.get('position')
+                if position:
+                    self.spatial_index.update(uid, position['latitude'], position['longitude'])
+                last_activity = data.get('device_info', {}).get('last_activity')
+                try:
+                    last_activity_ts = datetime.fromisoformat(last_activity).timestamp()
+                except (TypeError, ValueError):
+                    last_activity_ts = time.time()
+                self.activity_tracker.touch(uid, last_activity_ts)
 
         except Exception as e:
-            print(f"Database initialization error: {str(e)}")
+            logger.error("Database initialization error: %s", e)
 
     async def _get_user_info(self, uid: str) -> Dict:
         """Lấy user info từ cache hoặc Firestore"""
-        try:
-            # Kiểm tra cache trước
-            if uid in self.user_cache:
-                return self.user_cache[uid]
-
-            # Nếu không có trong cache, query từ Firestore
-            user_doc = self.firestore.collection('users').document(uid).get()
-            if user_doc.exists:
-                user_data = user_doc.to_dict()
-                user_info = {
-                    'displayName': user_data.get('displayName', ''),
-                    'profileImage': user_data.get('profileImage', None),
-                    'email': user_data.get('email', '')
-                }
-                # Lưu vào cache
-                self.user_cache[uid] = user_info
-                return user_info
-            return {}
-        except Exception as e:
-            print(f"Error getting user info: {str(e)}")
-            return {}
+        return await self.user_info.load(uid)
 
     def _clear_user_cache(self, uid: str):
         """Xóa cache khi user data thay đổi"""
-        if uid in self.user_cache:
-            del self.user_cache[uid]
-
-    async def connect(self, websocket: WebSocket, uid: str):
-        """Xử lý kết nối WebSocket mới"""
-        await websocket.accept()
-        self.active_connections[uid] = websocket
-
-        # Lấy thông tin user từ Firestore
-        user_info = await self._get_user_info(uid)
-
-        # Cập nhật status trong Realtime DB
-        location_ref = self.rtdb.reference(f"locations/{uid}")
-        location_ref.update({
-            'info': user_info,
+        self.user_info.invalidate(uid)
+
+    async def connect(self, websocket: WebSocket, uid: str, codec=None) -> ClientConnection:
+        """
+        Xử lý kết nối WebSocket mới (codec: JSON mặc định hoặc binary đã thương lượng).
+        Trả về connection để truyền lại cho disconnect khi socket này đóng
+        """
+        codec = codec or JsonCodec()
+        await websocket.accept(subprotocol=codec.subprotocol)
+        connection = ClientConnection(
+            websocket, uid,
+            max_queue=self.SEND_QUEUE_SIZE,
+            codec=codec,
+            tick_interval=self.DELIVERY_TICK
+        )
+        connection.start()
+        previous = self.active_connections.get(uid)
+        if previous is not None:
+            previous.close()
+        self.active_connections[uid] = connection
+        self.motion_filter.reset(uid)
+        self.activity_tracker.touch(uid, time.time())
+
+        # Cập nhật status (ghi dồn xuống Realtime DB)
+        self.location_store.update(uid, {
             'status': {
                 'online': True,
                 'last_seen': datetime.now().isoformat(),
@@ -85,9 +158,22 @@ class FirebaseLocation:
                 'last_activity': datetime.now().isoformat()
             }
         })
+        try:
+            # User info đọc ngay trên worker giữ connection (cache hoặc Firestore);
+            # đọc lỗi thì giữ nguyên info đang có trong Realtime DB
+            user_info = await self.user_info.load(uid)
+            if user_info:
+                self.location_store.update(uid, {'info': user_info})
+
+            # Gửi một lần các user đang ở gần, sau đó chỉ còn enter/move/leave
+            await self._send_neighbors(uid, self.proximity.neighbors(uid))
+        except BaseException:
+            self.disconnect(uid, connection)
+            raise
+        return connection
 
     async def update_location(self, id: str, location: Dict):
-        """Cập nhật vị trí của user trong Realtime DB"""
+        """Cập nhật vị trí của user (write-behind xuống Realtime DB)"""
         try:
             required_fields = ['latitude', 'longitude']
             if not all(field in location for field in required_fields):
@@ -98,8 +184,7 @@ class FirebaseLocation:
 
             timestamp = datetime.now().isoformat()
 
-            # Cập nhật vị trí trong Realtime DB
-            location_ref = self.rtdb.reference(f'locations/{id}')
+            # Cập nhật vị trí trong bộ nhớ, flusher sẽ ghi xuống Realtime DB
             updates = {
                 'position': {
                     'latitude': location['latitude'],
@@ -118,165 +203,377 @@ class FirebaseLocation:
                     'last_seen': timestamp
                 }
             }
-            location_ref.update(updates)
+            self.location_store.update(id, updates)
+            self.trajectories.append(
+                id,
+                location['latitude'],
+                location['longitude'],
+                speed=location.get('speed'),
+                heading=location.get('heading')
+            )
+            self.activity_tracker.touch(id, time.time())
+            self.spatial_index.update(id, location['latitude'], location['longitude'])
+            self.fanout.forget_remote(id)
+            if id in self.active_connections:
+                self.fanout.track(id, location['latitude'], location['longitude'])
             return timestamp
         except Exception as e:
-            print(f"Error updating location: {str(e)}")
+            logger.error("Error updating location: %s", e)
             raise e
 
     
+    def send(self, uid: str, frame, key=None) -> bool:
+        """Đưa frame vào hàng đợi gửi của user (không chờ socket)"""
+        connection = self.active_connections.get(uid)
+        if connection is None:
+            return False
+        return connection.send(frame, key=key)
+
+    def connection_stats(self) -> Dict[str, Dict]:
+        """Độ sâu hàng đợi và số frame bị gộp/bỏ của từng connection"""
+        return {uid: connection.snapshot() for uid, connection in self.active_connections.items()}
+
+    def _location_event(self, kind: str, uid: str, location_payload: Dict, user_info: Dict, distance: float) -> Dict:
+        # enter gửi không gộp (frame điều khiển), chỉ move được gộp theo ('location', uid)
+        return {
+            'type': kind,
+            'id': uid,
+            'info': user_info,
+            'location': location_payload,
+            'distance': round(distance, 2),
+            'status': 'active'
+        }
+
+    def _leave(self, uid: str, other_id: str):
+        """Gửi leave về other_id cho uid; move của other_id còn trong hàng đợi bị bỏ để không tới sau leave"""
+        connection = self.active_connections.get(uid)
+        if connection is None:
+            return
+        connection.discard(('location', other_id))
+        connection.send({'type': 'leave', 'id': other_id})
+
+    def _send_leave(self, uid: str, others):
+        for other_id in others:
+            self._leave(other_id, uid)
+
+    def _deliver_location(self, uid: str, location_payload: Dict, user_info: Dict) -> List:
+        """
+        Cập nhật tập lân cận của uid (đã có vị trí mới trong spatial index) và chỉ gửi
+        enter/move/leave cho các user đang kết nối. Trả về các user vừa vào bán kính.
+        """
+        entered, moved, left = self.proximity.update(uid)
+        # Chỉ enqueue; enter/leave không bao giờ bị gộp hay bỏ, move cũ của cùng user chưa gửi bị thay thế
+        for other_id, distance in entered:
+            if other_id in self.active_connections:
+                self.send(other_id, self._location_event('enter', uid, location_payload, user_info, distance))
+        for other_id, distance in moved:
+            if other_id in self.active_connections:
+                self.send(
+                    other_id,
+                    self._location_event('move', uid, location_payload, user_info, distance),
+                    key=('location', uid)
+                )
+        self._send_leave(uid, left)
+        for other_id in left:
+            self._leave(uid, other_id)
+        return entered
+
+    async def _send_neighbors(self, uid: str, neighbors: List):
+        """Gửi enter cho uid về các user lân cận (lần đầu kết nối hoặc vừa vào bán kính)"""
+        if uid not in self.active_connections or not neighbors:
+            return
+        requested = {other_id for other_id, _ in neighbors}
+        infos = await self.user_info.load_many(requested)
+        # Trong lúc chờ info, một số user có thể đã rời đi (leave đã vào hàng đợi): chỉ gửi enter cho ai còn ở gần
+        updates = []
+        for other_id, distance in self.proximity.neighbors(uid):
+            if other_id not in requested:
+                continue
+            position = (self.location_store.get(other_id) or {}).get('position')
+            if position is None:
+                continue
+            updates.append(self._location_event('enter', other_id, position, infos.get(other_id, {}), distance))
+        # Một frame điều khiển cho cả nhóm: đám đông lớn không làm tràn hàng đợi của connection mới
+        if updates:
+            self.send(uid, {'type': 'location_batch', 'updates': updates})
+
+    @staticmethod
+    def _location_payload(location: Dict, timestamp: str) -> Dict:
+        return {
+            'latitude': location['latitude'],
+            'longitude': location['longitude'],
+            'timestamp': timestamp,
+            'accuracy': location.get('accuracy'),
+            'heading': location.get('heading'),
+            'speed': location.get('speed')
+        }
+
     async def notify_nearby_users(self, uid: str, location: Dict, timestamp: str):
         """Tìm và thông báo cho các users trong vùng lân cận"""
         try:
-            # Tìm users trong phạm vi 1km
-            nearby_users = await self.get_nearby_users(uid)
-            user_info = await self._get_user_info(uid)
-
-            # Broadcast cho mỗi nearby user
-            for nearby_user in nearby_users:
-                other_id = nearby_user['user_id']
-                if other_id in self.active_connections:
-                    await self.active_connections[other_id].send_json({
-                        'type': 'location_update',
-                        'id': uid,
-                        'info': user_info,
-                        'location': {
-                            'latitude': location['latitude'],
-                            'longitude': location['longitude'],
-                            'timestamp': timestamp,
-                            'accuracy': location.get('accuracy'),
-                            'heading': location.get('heading'),
-                            'speed': location.get('speed')
-                        },
-                        'distance': nearby_user['distance'],
-                        'status': 'active'
-                    })
+            with self.stage_user_info.time():
+                user_info = await self._get_user_info(uid)
+            location_payload = self._location_payload(location, timestamp)
+
+            with self.stage_proximity.time():
+                entered = self._deliver_location(uid, location_payload, user_info)
+                await self._send_neighbors(uid, entered)
+
+            # Các worker khác có user ở ô lân cận sẽ nhận qua Redis
+            with self.stage_fanout.time():
+                await self.fanout.publish(location['latitude'], location['longitude'], {
+                    'type': 'location',
+                    'id': uid,
+                    'info': user_info,
+                    'location': location_payload
+                })
 
         except Exception as e:
-            print(f"Error notifying nearby users: {str(e)}")
-            if uid in self.active_connections:
-                await self.active_connections[uid].send_json({
-                    'type': 'error',
-                    'message': 'Failed to notify nearby users'
-                })
+            logger.error("Error notifying nearby users: %s", e)
+            self.send(uid, {
+                'type': 'error',
+                'message': 'Failed to notify nearby users'
+            })
+
+    def _drop_remote(self, uid: str):
+        """Gỡ bản sao của user do worker khác giữ (không ghi DB)"""
+        self.fanout.forget_remote(uid)
+        self._send_leave(uid, self.proximity.remove(uid))
+        self.spatial_index.remove(uid)
+        self.location_store.remove(uid)
+
+    def _on_remote_message(self, message: Dict):
+        """
+        Sự kiện từ worker khác: đồng bộ index/store cục bộ, rồi với 'location'
+        giao cho socket của worker này ('position' là cập nhật qua HTTP, chỉ đồng bộ)
+        """
+        if message['type'] == 'expire':
+            # Worker quét được các user hết hạn báo cho mọi worker, kể cả worker đang giữ socket
+            self._mark_offline(message['ids'])
+            return
+        if message['type'] == 'user_info':
+            # Hồ sơ đổi ở worker khác: lần đọc sau lấy lại từ Firestore
+            self._clear_user_cache(message['uid'])
+            return
+
+        uid = message['id']
+        if uid in self.active_connections:
+            # User đang kết nối trực tiếp với worker này, dữ liệu cục bộ mới hơn
+            return
+
+        if message['type'] == 'disconnect':
+            self._drop_remote(uid)
+            return
+
+        location = message['location']
+        self.spatial_index.update(uid, location['latitude'], location['longitude'])
+        self.location_store.update(uid, {
+            'position': location,
+            'device_info': {
+                'last_activity': location['timestamp'],
+                'platform': 'mobile'
+            },
+            'status': {
+                'online': True,
+                'last_seen': location['timestamp']
+            }
+        }, persist=False)
+        if message.get('info'):
+            self.user_info.prime(uid, message['info'])
+
+        if message['type'] == 'location':
+            self._deliver_location(uid, location, message.get('info', {}))
+
+    async def report_location(self, uid: str, location: Dict) -> str:
+        """
+        Cập nhật vị trí qua HTTP: không gửi enter/move cho socket lân cận, nhưng
+        đồng bộ store/index của các worker khác qua fan-out để nearby-users ở
+        worker nào cũng thấy user này
+        """
+        timestamp = await self.update_location(uid, location)
+        message = {
+            'type': 'position',
+            'id': uid,
+            'location': self._location_payload(location, timestamp)
+        }
+        info = self.user_info.cache.get(uid)
+        if info:
+            message['info'] = info
+        await self.fanout.publish(location['latitude'], location['longitude'], message)
+        return timestamp
 
     async def broadcast_location(self, uid: str, location: Dict):
         """Broadcast location cho nearby users"""
         try:
+            # Bước 0: Bỏ qua nếu vị trí vẫn khớp với dự đoán từ heading/speed
+            if not self.motion_filter.should_broadcast(uid, location):
+                # Vẫn ghi nhận hoạt động để user không bị chuyển sang offline,
+                # và vẫn lưu vào lộ trình để route history không bị hổng
+                self.activity_tracker.touch(uid, time.time())
+                self.trajectories.append(
+                    uid,
+                    location['latitude'],
+                    location['longitude'],
+                    speed=location.get('speed'),
+                    heading=location.get('heading')
+                )
+                return
+
             # Bước 1: Cập nhật vị trí
-            print("Updating location")
-            timestamp = await self.update_location(uid, location)
+            with self.stage_update.time():
+                timestamp = await self.update_location(uid, location)
             
             # Bước 2: Thông báo cho nearby users
-            print("Notify nearby users")
             await self.notify_nearby_users(uid, location, timestamp)
 
         except Exception as e:
-            print(f"Error broadcasting location: {str(e)}")
-            if uid in self.active_connections:
-                await self.active_connections[uid].send_json({
-                    'type': 'error',
-                    'message': 'Failed to broadcast location'
-                })
+            logger.error("Error broadcasting location: %s", e)
+            self.send(uid, {
+                'type': 'error',
+                'message': 'Failed to broadcast location'
+            })
+
+    def _derive_status(self, record: Dict, now: datetime) -> Dict:
+        """Tính trạng thái online tại thời điểm đọc từ last_activity (không ghi DB)"""
+        status = record.get('status', {})
+        last_activity_str = record.get('device_info', {}).get('last_activity')
+        if not last_activity_str:
+            return {'online': False, 'last_seen': status.get('last_seen', now.isoformat())}
 
-    async def get_nearby_users(self, uid: str) -> List[Dict]:
-        """Tìm users trong bán kính 1km"""
         try:
-            def get_current_location(current_data):
-                if not current_data or 'position' not in current_data:
-                    return None
-                return current_data
-            
+            last_activity = datetime.fromisoformat(last_activity_str)
+        except ValueError:
+            return {'online': False, 'last_seen': last_activity_str}
+
+        is_recent = (now - last_activity).total_seconds() <= self.ONLINE_TIMEOUT
+        return {
+            'online': bool(status.get('online', False)) and is_recent,
+            'last_seen': last_activity_str
+        }
+
+    async def _load_from_db(self):
+        """Nạp các user online từ /locations mà store cục bộ chưa có hoặc có bản cũ hơn"""
+        locations = await self.storage.tree.get(self.location_store.root) or {}
+        for uid, data in locations.items():
+            if uid in self.active_connections or not isinstance(data, dict):
+                continue
+            position = data.get('position')
+            if not position or not data.get('status', {}).get('online', False):
+                continue
+            known = (self.location_store.get(uid) or {}).get('position') or {}
+            if known.get('timestamp', '') >= position.get('timestamp', ''):
+                continue
+            self.location_store.update(uid, {
+                key: data[key] for key in ('position', 'status', 'device_info', 'info') if key in data
+            }, persist=False)
+            self.spatial_index.update(uid, position['latitude'], position['longitude'])
+            # Không có tin mới qua fan-out sau remote_ttl thì bị gỡ như user từ worker khác
+            self.fanout.note_remote(uid)
+
+    async def _sync_from_db(self):
+        if self._db_sync is None or (
+            self._db_sync.done() and time.monotonic() - self._db_synced_at > self.DB_SYNC_INTERVAL
+        ):
+            self._db_synced_at = time.monotonic()
+            self._db_sync = asyncio.ensure_future(self._load_from_db())
+        await asyncio.shield(self._db_sync)
 
-            print('[DEBUG]: Getting current user info')
-            # Lấy vị trí hiện tại từ Realtime DB
-            user_location = self.rtdb.reference(f"locations/{uid}").transaction(get_current_location)
-            print('[DEBUG]: Got current user info successfully')
-            
-            if not user_location:
+    async def get_nearby_users(self, uid: str) -> List[Dict]:
+        """
+        Tìm users trong bán kính 1km từ location store (không transaction).
+        Với nhiều worker, user cập nhật ở worker khác chỉ đến đây qua fan-out của
+        các ô mà worker này đăng ký: ô lân cận chưa đăng ký thì đọc Realtime DB
+        (tối đa một lần mỗi DB_SYNC_INTERVAL) và đăng ký theo dõi, các lần hỏi
+        sau đọc từ bộ nhớ
+        """
+        try:
+            user_pos = (self.location_store.get(uid) or {}).get('position')
+            if self.fanout.active:
+                if user_pos is None or not self.fanout.covers(user_pos['latitude'], user_pos['longitude']):
+                    await self._sync_from_db()
+                    user_pos = (self.location_store.get(uid) or {}).get('position')
+                if user_pos is not None:
+                    self.fanout.watch(uid, user_pos['latitude'], user_pos['longitude'])
+            if user_pos is None:
                 return []
-            
-            print('[DEBUG]: Getting current user location')
-            user_pos = user_location['position']
-            current_location = (user_pos['latitude'], user_pos['longitude'])
-            print(f'[DEBUG]: Got current user location successfully: {current_location}')
-            
+
+            with self.stage_nearby_query.time():
+                # Chỉ xét các user trong những ô lân cận của grid
+                candidates = self.spatial_index.query_radius(
+                    user_pos['latitude'],
+                    user_pos['longitude'],
+                    self.NEARBY_RADIUS_KM,
+                    exclude=uid
+                )
+
+                records = [
+                    (other_id, distance, self.location_store.get(other_id))
+                    for other_id, distance in candidates
+                ]
+                records = [
+                    (other_id, distance, other_data) for other_id, distance, other_data in records
+                    if other_data and 'position' in other_data
+                ]
+
+            # Một lần tra user info cho tất cả kết quả
+            infos = await self.user_info.load_many(other_id for other_id, _, _ in records)
+
+            now = datetime.now()
             nearby_users = []
+            for other_id, distance, other_data in records:
+                other_pos = other_data['position']
+                nearby_users.append({
+                    'id': other_id,
+                    'info': infos.get(other_id, {}),
+                    'location': {
+                        'latitude': other_pos['latitude'],
+                        'longitude': other_pos['longitude']
+                    },
+                    'distance': round(distance, 2),
+                    'last_updated': other_pos.get('timestamp'),
+                    'status': self._derive_status(other_data, now)
+                })
 
-            def get_all_users(current_data):
-                if not current_data:
-                    return current_data
-                
-                current_time = datetime.now()
-                modified_data = current_data.copy()
-
-                for other_id, other_data in current_data.items():
-                    if other_id != uid and 'position' in other_data:
-                        # Kiểm tra và update trạng thái hoạt động
-                        device_info = other_data.get('device_info', {})
-                        last_activity_str = device_info.get('last_activity', '')
-                        
-                        if last_activity_str:
-                            last_activity = datetime.fromisoformat(last_activity_str)
-                            is_online = (current_time - last_activity).total_seconds() <= 300
-                            
-                            # Chỉ update status nếu có thay đổi
-                            if other_data.get('status', {}).get('online') != is_online:
-                                modified_data[other_id] = {
-                                    **other_data,
-                                    'status': {
-                                        'online': is_online,
-                                        'last_seen': datetime.isoformat(last_activity)
-                                    }
-                                }
-
-                return modified_data
-
-            print('[DEBUG]: Getting other users info that are online')
-
-            users_data = self.rtdb.reference('locations').transaction(get_all_users)
-
-            print(f'[DEBUG]: Got other users info successfully: {users_data}')
-
-            if users_data:
-                for other_id, other_data in users_data.items():
-                    if other_id != uid and 'position' in other_data:
-                        other_pos = other_data['position']
-                        other_location = (other_pos['latitude'], other_pos['longitude'])
-                        distance = geodesic(current_location, other_location).km
-
-                        if distance <= self.NEARBY_RADIUS_KM:
-                            other_user_info = await self._get_user_info(other_id)
-                            nearby_users.append({
-                                'id': other_id,
-                                'info': other_user_info,
-                                'location': {
-                                    'latitude': other_pos['latitude'],
-                                    'longitude': other_pos['longitude']
-                                },
-                                'distance': round(distance, 2),
-                                'last_updated': other_pos.get('timestamp'),
-                                'status': other_data.get('status', {
-                                    'online': False,
-                                    'last_seen': datetime.now().isoformat()
-                                })
-                            })
-
-            return sorted(nearby_users, key=lambda x: x['distance'])
+            # candidates đã được sắp xếp theo khoảng cách
+            return nearby_users
 
         except Exception as e:
-            print(f"Error getting nearby users: {str(e)}")
+            logger.error("Error getting nearby users: %s", e)
             return []
 
-    def disconnect(self, uid: str):
-        """Xử lý ngắt kết nối"""
-        if uid in self.active_connections:
-            del self.active_connections[uid]
+    async def get_route_history(self, uid: str, start: float, end: float, max_points: int,
+                                method: str, tolerance_m: float) -> Dict:
+        """Lộ trình của user trong [start, end] (epoch giây), đã giản lược còn tối đa max_points điểm"""
+        return await self.trajectories.query(uid, start, end, max_points, method, tolerance_m)
+
+    def _remove_from_index(self, uid: str, publish: bool = True):
+        """Xóa user khỏi spatial index và báo cho các worker khác"""
+        position = self.spatial_index.get(uid)
+        if position is None:
+            return
+        self._send_leave(uid, self.proximity.remove(uid))
+        self.spatial_index.remove(uid)
+        if publish:
+            self.fanout.publish_nowait(*position, {'type': 'disconnect', 'id': uid})
+
+    def disconnect(self, uid: str, connection: ClientConnection):
+        """
+        Xử lý ngắt kết nối của `connection`. Nếu user đã kết nối lại thì
+        connection cũ chỉ bị đóng, không đụng tới connection mới của user
+        """
+        connection.close()
+        if self.active_connections.get(uid) is not connection:
+            return
+        del self.active_connections[uid]
+        self.fanout.untrack(uid)
+        self.motion_filter.reset(uid)
+        self._remove_from_index(uid)
+        self.activity_tracker.forget(uid)
+        self.trajectories.retire(uid)
         
         try:
-            # Cập nhật status trong Realtime DB
-            location_ref = self.rtdb.reference(f'locations/{uid}')
-            location_ref.update({
+            # Cập nhật status (ghi dồn xuống Realtime DB)
+            self.location_store.update(uid, {
                 'status': {
                     'online': False,
                     'last_seen': datetime.now().isoformat(),
@@ -286,70 +583,80 @@ class FirebaseLocation:
             # Xóa cache
             self._clear_user_cache(uid)
         except Exception as e:
-            print(f"Error updating disconnect status: {str(e)}")
+            logger.error("Error updating disconnect status: %s", e)
+
+    def _mark_offline(self, uids: Iterable[str]):
+        """
+        Chuyển các user hết hạn mà worker này đang giữ sang offline, ghi dồn xuống
+        Realtime DB trong một batch. User không có trong store thì bỏ qua (worker
+        khác giữ và cũng nhận sự kiện 'expire'), bản sao từ worker khác chỉ bị gỡ
+        """
+        now = datetime.now().isoformat()
+        for uid in uids:
+            record = self.location_store.get(uid)
+            if record is None:
+                continue
+            if self.fanout.is_remote(uid):
+                self._drop_remote(uid)
+                continue
+            last_seen = record.get('device_info', {}).get('last_activity', now)
+            self.location_store.update(uid, {
+                'status': {
+                    'online': False,
+                    'last_seen': last_seen,
+                    'disconnected_at': now
+                }
+            })
+            # Mọi worker đều nhận 'expire', không cần thêm 'disconnect' theo ô
+            self._remove_from_index(uid, publish=False)
+            self.trajectories.retire(uid)
+            self.fanout.unwatch(uid)
 
-    async def cleanup_offline_users(self):
-        """Task định kỳ dọn dẹp users không hoạt động"""
+    async def cleanup_offline_users(self, redis):
+        """Task định kỳ chuyển users không hoạt động quá INACTIVE_TIMEOUT sang offline"""
         while True:
             try:
-                def transaction(current_data):
-                    if not current_data:
-                        return current_data
-                    
-                    current_time = datetime.now()
-                    modified_data = current_data.copy()
-
-
-                    for uid, user_data in current_data.items():
-                        try:
-                            device_info = user_data.get('device_info', {})
-                            last_activity_str = device_info.get('last_activity')
-                            status = user_data.get('status', {})
-
-                            if last_activity_str and status.get('online', False):
-                                try:
-                                    last_activity = datetime.fromisoformat(last_activity_str)
-                                    inactive_duration = (current_time - last_activity).total_seconds()
-
-                                    if inactive_duration > self.INACTIVE_TIMEOUT:
-                                        print(f"User {uid} inactive for {inactive_duration} seconds")
-                                        modified_data[uid] = {
-                                            **user_data,
-                                            'status': {
-                                                'online': False,
-                                                'last_seen': datetime.isoformat(last_activity),
-                                                'disconnected_at': current_time.isoformat()
-                                            }
-                                        }
-                                except ValueError as e:
-                                    print(f"Error parsing date for user {uid}: {e}")
-                                    continue
-                        except Exception as e:
-                            print(f"Error processing user {uid}: {e}")
-                            continue
-                    
-                    return modified_data
-
-                result = self.rtdb.reference('locations').transaction(transaction)
-                if result:
-                    print("Cleanup transaction completed:", result)
+                while True:
+                    expired = await self.activity_tracker.sweep(
+                        redis, time.time() - self.INACTIVE_TIMEOUT
+                    )
+                    if expired:
+                        # Mỗi user chỉ được một worker lấy ra khỏi sorted set: báo cho các worker còn lại
+                        logger.debug("Marked %d inactive users offline", len(expired))
+                        self._mark_offline(expired)
+                        await self.fanout.publish_all({'type': 'expire', 'ids': expired})
+                    # Còn user hết hạn thì quét tiếp ngay
+                    if len(expired) < self.activity_tracker.batch_size:
+                        break
 
             except Exception as e:
-                print(f"Cleanup error details: {str(e)}")
+                logger.error("Cleanup error: %s", e)
 
             await asyncio.sleep(self.CLEANUP_INTERVAL)
 
     async def update_user_info(self, uid: str):
-        """Cập nhật user info trong Realtime DB khi thông tin user thay đổi"""
+        """
+        Khi thông tin user thay đổi: mọi worker bỏ cache của user (worker giữ socket
+        đọc lại ở lần gửi sau), còn việc ghi Realtime DB đi qua job queue
+        """
+        # Xóa cache cũ ngay để các lần đọc sau không thấy dữ liệu cũ, kể cả ở worker khác
+        self._clear_user_cache(uid)
+        await self.fanout.publish_all({'type': 'user_info', 'uid': uid})
         try:
-            # Xóa cache cũ
-            self._clear_user_cache(uid)
-            # Lấy thông tin mới từ Firestore
-            user_info = await self._get_user_info(uid)
-            # Cập nhật trong Realtime DB
-            location_ref = self.rtdb.reference(f'locations/{uid}')
-            location_ref.update({
-                'info': user_info
-            })
+            # Nhiều lần đổi liên tiếp của một user chỉ còn một job đang chờ
+            await self.jobs.enqueue('user_info', {'uid': uid}, key=f"user_info:{uid}")
         except Exception as e:
-            print(f"Error updating user info: {str(e)}")
\ No newline at end of file
+            logger.error("Error queueing user info update: %s", e)
+
+    async def _write_user_info(self, payload: Dict):
+        """
+        Job 'user_info': đọc lại từ Firestore và ghi thẳng vào Realtime DB, lỗi thì raise
+        để job queue retry. Worker nhận job có thể không giữ user nên không đụng bộ nhớ
+        """
+        uid = payload['uid']
+        user_info = await self.user_info.read(uid)
+        if user_info is None:
+            return
+        await self.storage.tree.update(f"{self.location_store.root}/{uid}", {
+            'info': user_info
+        })
\ No newline at end of file
@@ -0,0 +1,214 @@
+import asyncio, json, logging, time, uuid
+from typing import Callable, Dict, Hashable, Optional, Set
+from redis import asyncio as aioredis
+from .SpatialIndex import SpatialIndex, Cell
+
+logger = logging.getLogger(__name__)
+
+class GeoFanout:
+    """
+    Cross-worker delivery of location events over Redis pub/sub, sharded by
+    grid cell.
+
+    An event is published on the channel of the cell its user is in. Each
+    worker subscribes only to the cells covering the search radius of the
+    users connected to it, so it receives exactly the events that may concern
+    one of its sockets and hands them to `on_message` for local delivery.
+    Users polling over HTTP are `watch`ed the same way until they have not
+    polled for `remote_ttl` seconds. Remote users learnt this way are
+    dropped after `remote_ttl` seconds without news. Every worker also
+    listens on one broadcast channel for events that are not tied to a
+    cell (`publish_all`).
+    """
+    def __init__(
+        self,
+        index: SpatialIndex,
+        radius_km: float,
+        on_message: Callable[[Dict], None],
+        channel_prefix: str = 'geo',
+        remote_ttl: float = 300.0
+    ):
+        self.index = index
+        self.radius_km = radius_km
+        self.on_message = on_message
+        self.channel_prefix = channel_prefix
+        self.remote_ttl = remote_ttl
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.broadcast_channel = f"{channel_prefix}:all"
+
+        self.redis: Optional[aioredis.Redis] = None
+        self._user_cells: Dict[Hashable, Set[Cell]] = {}
+        self._cell_refs: Dict[Cell, int] = {}
+        self._subscribed: Set[str] = set()
+        self._remote_seen: Dict[str, float] = {}
+        self._watched: Dict[str, float] = {}
+        self._changed = asyncio.Event()
+
+        self.stats = {'published': 0, 'received': 0, 'publish_errors': 0}
+
+    def channel(self, cell: Cell) -> str:
+        return f"{self.channel_prefix}:{cell[0]}:{cell[1]}"
+
+    def track(self, uid: Hashable, latitude: float, longitude: float):
+        """(Re)compute the cells a locally connected user needs to hear from"""
+        cells = set(self.index.covering_cells(latitude, longitude, self.radius_km))
+        old = self._user_cells.get(uid, set())
+        if cells == old:
+            return
+        for cell in cells - old:
+            self._cell_refs[cell] = self._cell_refs.get(cell, 0) + 1
+        for cell in old - cells:
+            self._release(cell)
+        self._user_cells[uid] = cells
+        self._changed.set()
+
+    def untrack(self, uid: Hashable):
+        for cell in self._user_cells.pop(uid, ()):
+            self._release(cell)
+        self._changed.set()
+
+    def watch(self, uid: str, latitude: float, longitude: float):
+        """Like track, for a user polling nearby users over HTTP; expires on its own"""
+        self.track(('poll', uid), latitude, longitude)
+        self._watched[uid] = time.monotonic()
+
+    def unwatch(self, uid: str):
+        if self._watched.pop(uid, None) is not None:
+            self.untrack(('poll', uid))
+
+    @property
+    def active(self) -> bool:
+        """Subscriber running: other workers may hold users this one has not seen"""
+        return self.redis is not None
+
+    def covers(self, latitude: float, longitude: float) -> bool:
+        """True once every event near (latitude, longitude) reaches this worker"""
+        return all(
+            self.channel(cell) in self._subscribed
+            for cell in self.index.covering_cells(latitude, longitude, self.radius_km)
+        )
+
+    def _release(self, cell: Cell):
+        refs = self._cell_refs.get(cell, 0) - 1
+        if refs > 0:
+            self._cell_refs[cell] = refs
+        else:
+            self._cell_refs.pop(cell, None)
+
+    def forget_remote(self, uid: str):
+        self._remote_seen.pop(uid, None)
+
+    def is_remote(self, uid: str) -> bool:
+        return uid in self._remote_seen
+
+    def note_remote(self, uid: str):
+        """A user owned by another worker was learnt outside pub/sub (e.g. from the DB)"""
+        self._remote_seen[uid] = time.monotonic()
+
+    async def publish(self, latitude: float, longitude: float, message: Dict):
+        if self.redis is None:
+            return
+        payload = json.dumps({**message, 'worker': self.worker_id, 'sent_at': time.time()})
+        try:
+            await self.redis.publish(self.channel(self.index.cell_of(latitude, longitude)), payload)
+            self.stats['published'] += 1
+        except Exception as e:
+            self.stats['publish_errors'] += 1
+            logger.warning("Geo fan-out publish failed: %s", e)
+
+    async def publish_all(self, message: Dict):
+        """Publish to every worker, wherever its users are"""
+        if self.redis is None:
+            return
+        payload = json.dumps({**message, 'worker': self.worker_id, 'sent_at': time.time()})
+        try:
+            await self.redis.publish(self.broadcast_channel, payload)
+            self.stats['published'] += 1
+        except Exception as e:
+            self.stats['publish_errors'] += 1
+            logger.warning("Geo fan-out broadcast failed: %s", e)
+
+    def publish_nowait(self, latitude: float, longitude: float, message: Dict):
+        """Publish from synchronous code running on the event loop"""
+        if self.redis is not None:
+            asyncio.get_running_loop().create_task(self.publish(latitude, longitude, message))
+
+    async def _sync_subscriptions(self, pubsub):
+        wanted = {self.channel(cell) for cell in self._cell_refs} | {self.broadcast_channel}
+        added, removed = wanted - self._subscribed, self._subscribed - wanted
+        if added:
+            await pubsub.subscribe(*added)
+        if removed:
+            await pubsub.unsubscribe(*removed)
+        self._subscribed = wanted
+
+    def _handle(self, raw: str):
+        message = json.loads(raw)
+        if message.get('worker') == self.worker_id:
+            return
+        self.stats['received'] += 1
+        if message.get('type') == 'disconnect':
+            self._remote_seen.pop(message['id'], None)
+        elif 'id' in message:
+            self._remote_seen[message['id']] = time.monotonic()
+        self.on_message(message)
+
+    def _expire_remote(self):
+        cutoff = time.monotonic() - self.remote_ttl
+        for uid in [uid for uid, seen in self._remote_seen.items() if seen < cutoff]:
+            del self._remote_seen[uid]
+            self.on_message({'type': 'disconnect', 'id': uid})
+        for uid in [uid for uid, seen in self._watched.items() if seen < cutoff]:
+            self.unwatch(uid)
+
+    async def run(self, redis: aioredis.Redis, poll_interval: float = 0.05):
+        """Subscriber loop, meant to run as a background task"""
+        self.redis = redis
+        pubsub = redis.pubsub()
+        last_expiry = time.monotonic()
+        self._changed.set()
+        try:
+            while True:
+                try:
+                    if self._changed.is_set():
+                        self._changed.clear()
+                        await self._sync_subscriptions(pubsub)
+
+                    if self._subscribed:
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True, timeout=poll_interval
+                        )
+                        if message and message['type'] == 'message':
+                            self._handle(message['data'])
+                    else:
+                        try:
+                            await asyncio.wait_for(self._changed.wait(), timeout=1.0)
+                        except asyncio.TimeoutError:
+                            pass
+
+                    if time.monotonic() - last_expiry > 1.0:
+                        last_expiry = time.monotonic()
+                        self._expire_remote()
+
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Geo fan-out subscriber error: %s", e)
+                    # Resubscribe from scratch on a fresh connection
+                    await pubsub.aclose()
+                    pubsub = redis.pubsub()
+                    self._subscribed = set()
+                    self._changed.set()
+                    await asyncio.sleep(1.0)
+        finally:
+            self.redis = None
+            await pubsub.aclose()
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            'worker_id': self.worker_id,
+            'subscribed_cells': len(self._subscribed - {self.broadcast_channel}),
+            'remote_users': len(self._remote_seen),
+            'watched_users': len(self._watched)
+        }
@@ -1,11 +1,13 @@
-import os, re
+import logging, os, re
 from typing import Optional
 from functools import lru_cache
 from google.cloud import texttospeech, speech
 from googletrans import Translator
 
+logger = logging.getLogger(__name__)
+
 class GoogleCloudAPI:
-    def __init__(self, credentials_file: str, language_code: str = "vi-VN"):
+    def __init__(self, credentials_file: Optional[str] = None, language_code: str = "vi-VN"):
         self.setup(credentials_file)
         self._initialize_clients(language_code)
         self.translator = Translator()
@@ -28,16 +30,20 @@ class GoogleCloudAPI:
             effects_profile_id=['telephony-class-application']
         )
 
+        # Must match AudioPreprocessor output (FLAC, 16 kHz, mono)
         self.default_stt_config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.MP3,
+            encoding=speech.RecognitionConfig.AudioEncoding.FLAC,
             sample_rate_hertz=16000,
+            audio_channel_count=1,
             language_code=language_code,
             enable_automatic_punctuation=True
         )
 
     @staticmethod
-    def setup(credentials_file: str):
-        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_file
+    def setup(credentials_file: Optional[str]):
+        # None: dùng Application Default Credentials có sẵn trong môi trường
+        if credentials_file:
+            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_file
 
     @staticmethod
     @lru_cache(maxsize=1000)
@@ -69,8 +75,8 @@ class GoogleCloudAPI:
 
             return response.audio_content
         
-        except Exception as e:
-            print(f"TTS Error: {str(e)}")
+        except Exception:
+            logger.exception("TTS error")
             return None
     
 
@@ -103,8 +109,8 @@ class GoogleCloudAPI:
 
             return response.audio_content
         
-        except Exception as e:
-            print(f"Translate and TTS Error: {str(e)}")
+        except Exception:
+            logger.exception("Translate and TTS error")
             return None
 
     def stt(self, audio_content: bytes) -> str:
@@ -121,7 +127,7 @@ class GoogleCloudAPI:
                 for result in response.results
             )
 
-        except Exception as e:
-            print(f"STT Error: {str(e)}")
+        except Exception:
+            logger.exception("STT error")
             return ""
 
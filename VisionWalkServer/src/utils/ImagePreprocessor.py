@@ -1,8 +1,10 @@
-import cv2, numpy as np, numpy.typing as npt
+import cv2, logging, numpy as np, numpy.typing as npt
 from typing import Tuple
 from io import BytesIO
 from PIL import Image
 
+logger = logging.getLogger(__name__)
+
 class ImagePreprocessor:
     def __init__(self, target_height: int = 1024):
         self.target_height = target_height
@@ -85,7 +87,7 @@ class ImagePreprocessor:
             return img_array
             
         except Exception as e:
-            print(f"Error in image enhancement: {str(e)}")
+            logger.exception("Error in image enhancement")
             metadata['enhancement_error'] = str(e)
             return img_array
 
@@ -0,0 +1,483 @@
+import asyncio, json, logging, os, random, sqlite3, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    id: str
+    type: str
+    payload: Dict
+    key: Optional[str] = None
+    attempts: int = 0
+    max_attempts: int = 5
+    run_at: float = 0.0
+    enqueued_at: float = 0.0
+
+
+class SQLiteJobBackend:
+    """
+    Jobs in a local SQLite file, shared by the workers of one host (WAL mode,
+    claims under BEGIN IMMEDIATE). Finished jobs are deleted; jobs out of
+    attempts stay with state 'dead'. All calls run on one dedicated thread.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT NOT NULL,
+        key TEXT,
+        payload TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        run_at REAL NOT NULL,
+        enqueued_at REAL NOT NULL,
+        lease_until REAL,
+        last_error TEXT
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_key ON jobs(key) WHERE state = 'pending';
+    CREATE INDEX IF NOT EXISTS jobs_due ON jobs(type, state, run_at);
+    """
+
+    def __init__(self, path: str = 'jobs.sqlite3'):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='jobs-sqlite')
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=5.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(self.SCHEMA)
+        return self._db
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _enqueue(self, job: Job, replace: bool) -> bool:
+        db = self._conn()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if replace and job.key is not None:
+                cursor = db.execute(
+                    "UPDATE jobs SET payload = ? WHERE key = ? AND state = 'pending'",
+                    (json.dumps(job.payload), job.key)
+                )
+                if cursor.rowcount:
+                    db.execute("COMMIT")
+                    return False
+            # The partial unique index turns a second pending job with the same key into a no-op
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO jobs (type, key, payload, max_attempts, run_at, enqueued_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job.type, job.key, json.dumps(job.payload), job.max_attempts, job.run_at, job.enqueued_at)
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return cursor.rowcount > 0
+
+    async def enqueue(self, job: Job, replace: bool = False) -> bool:
+        return await self._run(self._enqueue, job, replace)
+
+    def _claim(self, job_type: str, limit: int, now: float, lease_until: float) -> List[Job]:
+        db = self._conn()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                "SELECT id, type, payload, key, attempts, max_attempts, run_at, enqueued_at FROM jobs "
+                "WHERE type = ? AND ((state = 'pending' AND run_at <= ?) OR (state = 'running' AND lease_until < ?)) "
+                "ORDER BY run_at LIMIT ?",
+                (job_type, now, now, limit)
+            ).fetchall()
+            db.executemany(
+                "UPDATE jobs SET state = 'running', lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                [(lease_until, row[0]) for row in rows]
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return [
+            Job(str(row[0]), row[1], json.loads(row[2]), row[3], row[4] + 1, row[5], row[6], row[7])
+            for row in rows
+        ]
+
+    async def claim(self, job_type: str, limit: int, now: float, lease_until: float) -> List[Job]:
+        return await self._run(self._claim, job_type, limit, now, lease_until)
+
+    def _complete(self, job: Job):
+        self._conn().execute("DELETE FROM jobs WHERE id = ?", (int(job.id),))
+
+    async def complete(self, job: Job):
+        await self._run(self._complete, job)
+
+    def _retry(self, job: Job, run_at: float, error: str):
+        db = self._conn()
+        try:
+            db.execute(
+                "UPDATE jobs SET state = 'pending', run_at = ?, lease_until = NULL, last_error = ? WHERE id = ?",
+                (run_at, error, int(job.id))
+            )
+        except sqlite3.IntegrityError:
+            # A newer job with the same key is already pending and supersedes this one
+            db.execute("DELETE FROM jobs WHERE id = ?", (int(job.id),))
+
+    async def retry(self, job: Job, run_at: float, error: str):
+        await self._run(self._retry, job, run_at, error)
+
+    def _fail(self, job: Job, error: str):
+        self._conn().execute(
+            "UPDATE jobs SET state = 'dead', lease_until = NULL, last_error = ? WHERE id = ?",
+            (error, int(job.id))
+        )
+
+    async def fail(self, job: Job, error: str):
+        await self._run(self._fail, job, error)
+
+    def _depth(self) -> Dict[str, Dict[str, int]]:
+        depth: Dict[str, Dict[str, int]] = {}
+        for job_type, state, count in self._conn().execute("SELECT type, state, COUNT(*) FROM jobs GROUP BY type, state"):
+            depth.setdefault(job_type, {})[state] = count
+        return depth
+
+    async def depth(self) -> Dict[str, Dict[str, int]]:
+        return await self._run(self._depth)
+
+    async def close(self):
+        def _close():
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        await self._run(_close)
+
+
+class RedisJobBackend:
+    """
+    Jobs in Redis, shared by every worker: a hash per job, a due ZSET and a
+    running ZSET (score = lease expiry) per type, and `key:<dedup key>`
+    pointing at the pending job. Each operation is one Lua script.
+    """
+    ENQUEUE_SCRIPT = """
+    local prefix, key = ARGV[1], ARGV[3]
+    if key ~= '' then
+        local existing = redis.call('GET', prefix .. ':key:' .. key)
+        if existing then
+            if ARGV[8] == '1' then
+                redis.call('HSET', prefix .. ':job:' .. existing, 'payload', ARGV[4])
+            end
+            return 0
+        end
+    end
+    local id = redis.call('INCR', prefix .. ':seq')
+    redis.call('HSET', prefix .. ':job:' .. id,
+        'type', ARGV[2], 'key', key, 'payload', ARGV[4], 'attempts', 0,
+        'max_attempts', ARGV[5], 'run_at', ARGV[6], 'enqueued_at', ARGV[7])
+    redis.call('ZADD', prefix .. ':due:' .. ARGV[2], ARGV[6], id)
+    if key ~= '' then
+        redis.call('SET', prefix .. ':key:' .. key, id)
+    end
+    return id
+    """
+
+    CLAIM_SCRIPT = """
+    local prefix, job_type, now = ARGV[1], ARGV[2], tonumber(ARGV[3])
+    local due, running = prefix .. ':due:' .. job_type, prefix .. ':running:' .. job_type
+    -- Leases that ran out (worker died) go back to due
+    for _, id in ipairs(redis.call('ZRANGEBYSCORE', running, '-inf', '(' .. now)) do
+        redis.call('ZREM', running, id)
+        redis.call('ZADD', due, now, id)
+    end
+    local claimed = {}
+    for _, id in ipairs(redis.call('ZRANGEBYSCORE', due, '-inf', now, 'LIMIT', 0, tonumber(ARGV[4]))) do
+        local job = prefix .. ':job:' .. id
+        redis.call('ZREM', due, id)
+        redis.call('ZADD', running, ARGV[5], id)
+        redis.call('HINCRBY', job, 'attempts', 1)
+        local key = redis.call('HGET', job, 'key')
+        if key and key ~= '' and redis.call('GET', prefix .. ':key:' .. key) == id then
+            redis.call('DEL', prefix .. ':key:' .. key)
+        end
+        local fields = redis.call('HMGET', job, 'key', 'payload', 'attempts', 'max_attempts', 'run_at', 'enqueued_at')
+        table.insert(claimed, {id, unpack(fields)})
+    end
+    return claimed
+    """
+
+    RETRY_SCRIPT = """
+    local prefix, id = ARGV[1], ARGV[3]
+    local job = prefix .. ':job:' .. id
+    redis.call('ZREM', prefix .. ':running:' .. ARGV[2], id)
+    local key = redis.call('HGET', job, 'key')
+    if key and key ~= '' then
+        if redis.call('EXISTS', prefix .. ':key:' .. key) == 1 then
+            redis.call('DEL', job)
+            return 0
+        end
+        redis.call('SET', prefix .. ':key:' .. key, id)
+    end
+    redis.call('HSET', job, 'run_at', ARGV[4], 'last_error', ARGV[5])
+    redis.call('ZADD', prefix .. ':due:' .. ARGV[2], ARGV[4], id)
+    return 1
+    """
+
+    def __init__(self, get_redis: Callable[[], Awaitable], prefix: str = 'jobs', dead_ttl: int = 7 * 86400):
+        self.get_redis = get_redis
+        self.prefix = prefix
+        self.dead_ttl = dead_ttl
+        self._scripts: Dict[str, object] = {}
+        self._types: Set[str] = set()
+
+    async def _script(self, name: str):
+        redis = await self.get_redis()
+        script = self._scripts.get(name)
+        if script is None or script.registered_client is not redis:
+            script = self._scripts[name] = redis.register_script(getattr(self, name))
+        return script
+
+    async def enqueue(self, job: Job, replace: bool = False) -> bool:
+        self._types.add(job.type)
+        script = await self._script('ENQUEUE_SCRIPT')
+        job_id = await script(args=[
+            self.prefix, job.type, job.key or '', json.dumps(job.payload),
+            job.max_attempts, job.run_at, job.enqueued_at, int(replace)
+        ])
+        return int(job_id) > 0
+
+    async def claim(self, job_type: str, limit: int, now: float, lease_until: float) -> List[Job]:
+        self._types.add(job_type)
+        script = await self._script('CLAIM_SCRIPT')
+        rows = await script(args=[self.prefix, job_type, now, limit, lease_until])
+        return [
+            Job(str(job_id), job_type, json.loads(payload), key or None, int(attempts), int(max_attempts),
+                float(run_at), float(enqueued_at))
+            for job_id, key, payload, attempts, max_attempts, run_at, enqueued_at in rows
+        ]
+
+    async def complete(self, job: Job):
+        redis = await self.get_redis()
+        pipe = redis.pipeline(transaction=True)
+        pipe.zrem(f"{self.prefix}:running:{job.type}", job.id)
+        pipe.delete(f"{self.prefix}:job:{job.id}")
+        await pipe.execute()
+
+    async def retry(self, job: Job, run_at: float, error: str):
+        script = await self._script('RETRY_SCRIPT')
+        await script(args=[self.prefix, job.type, job.id, run_at, error[:500]])
+
+    async def fail(self, job: Job, error: str):
+        redis = await self.get_redis()
+        pipe = redis.pipeline(transaction=True)
+        pipe.zrem(f"{self.prefix}:running:{job.type}", job.id)
+        pipe.hset(f"{self.prefix}:job:{job.id}", 'last_error', error[:500])
+        pipe.expire(f"{self.prefix}:job:{job.id}", self.dead_ttl)
+        pipe.lpush(f"{self.prefix}:dead", job.id)
+        pipe.ltrim(f"{self.prefix}:dead", 0, 999)
+        await pipe.execute()
+
+    async def depth(self) -> Dict[str, Dict[str, int]]:
+        redis = await self.get_redis()
+        types = sorted(self._types)
+        pipe = redis.pipeline(transaction=False)
+        for job_type in types:
+            pipe.zcard(f"{self.prefix}:due:{job_type}")
+            pipe.zcard(f"{self.prefix}:running:{job_type}")
+        counts = await pipe.execute()
+        return {
+            job_type: {'pending': counts[2 * i], 'running': counts[2 * i + 1]}
+            for i, job_type in enumerate(types)
+        }
+
+    async def close(self):
+        pass
+
+
+class _JobType:
+    def __init__(self, handler, concurrency: int, max_attempts: int, backoff_base: float, backoff_cap: float,
+                 on_dead=None, samples: int = 1024):
+        self.handler = handler
+        self.on_dead = on_dead
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.running = 0
+        self.stats = {'enqueued': 0, 'deduplicated': 0, 'succeeded': 0, 'retried': 0, 'dead': 0}
+        self.wait_ms: Deque[float] = deque(maxlen=samples)
+        self.run_ms: Deque[float] = deque(maxlen=samples)
+
+    @staticmethod
+    def _percentiles(samples) -> Dict[str, float]:
+        samples = sorted(samples)
+        percentile = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))], 3) if samples else 0.0
+        return {'p50': percentile(0.5), 'p99': percentile(0.99), 'max': round(samples[-1], 3) if samples else 0.0}
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            'running': self.running,
+            'concurrency': self.concurrency,
+            'wait_ms': self._percentiles(self.wait_ms),
+            'run_ms': self._percentiles(self.run_ms)
+        }
+
+
+class JobQueue:
+    """
+    Durable queue for deferred side effects.
+
+    Handlers are registered per job type with their own concurrency limit
+    and retry policy. `enqueue` writes the job to the backend and returns;
+    `run` claims due jobs (leased for `lease` seconds, so jobs of a worker
+    that dies are picked up again) and runs them as tasks. A failing job is
+    retried after a jittered exponential backoff until max_attempts, then
+    kept as dead and handed to the type's `on_dead` callback, if any, so it
+    can release what the job held. A job enqueued with a `key` while another job with the
+    same key is still pending is dropped, or with replace=True overwrites
+    that job's payload.
+    """
+    def __init__(self, backend, poll_interval: float = 0.5, lease: float = 120.0):
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.types: Dict[str, _JobType] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._runner: Optional[asyncio.Task] = None
+
+    def register(
+        self,
+        job_type: str,
+        handler: Callable[[Dict], Awaitable[None]],
+        concurrency: int = 1,
+        max_attempts: int = 5,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 300.0,
+        on_dead: Optional[Callable[[Dict], Awaitable[None]]] = None
+    ):
+        self.types[job_type] = _JobType(handler, concurrency, max_attempts, backoff_base, backoff_cap, on_dead)
+
+    async def enqueue(self, job_type: str, payload: Dict, key: Optional[str] = None,
+                      delay: float = 0.0, replace: bool = False) -> bool:
+        """Persist a job; False if it was merged into a pending job with the same key"""
+        kind = self.types[job_type]
+        now = time.time()
+        job = Job('', job_type, payload, key, 0, kind.max_attempts, now + delay, now)
+        created = await self.backend.enqueue(job, replace=replace)
+        kind.stats['enqueued' if created else 'deduplicated'] += 1
+        self._wakeup.set()
+        return created
+
+    async def _execute(self, kind: _JobType, job: Job):
+        started = time.time()
+        kind.wait_ms.append(max(0.0, started - job.run_at) * 1000)
+        try:
+            await kind.handler(job.payload)
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            if job.attempts >= job.max_attempts:
+                kind.stats['dead'] += 1
+                logger.error("Job %s#%s failed for good after %d attempts: %s", job.type, job.id, job.attempts, error)
+                await self.backend.fail(job, error)
+                if kind.on_dead is not None:
+                    try:
+                        await kind.on_dead(job.payload)
+                    except Exception:
+                        logger.exception("on_dead of job %s#%s failed", job.type, job.id)
+            else:
+                delay = min(kind.backoff_cap, kind.backoff_base * 2 ** (job.attempts - 1)) * random.uniform(0.5, 1.0)
+                kind.stats['retried'] += 1
+                await self.backend.retry(job, time.time() + delay, error)
+        else:
+            kind.stats['succeeded'] += 1
+            await self.backend.complete(job)
+        finally:
+            kind.run_ms.append((time.time() - started) * 1000)
+            kind.running -= 1
+            self._wakeup.set()
+
+    def _spawn(self, kind: _JobType, job: Job):
+        kind.running += 1
+        task = asyncio.get_running_loop().create_task(self._execute(kind, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def poll(self) -> int:
+        """Claim and start due jobs for every type with free slots; returns jobs started"""
+        started = 0
+        for job_type, kind in self.types.items():
+            free = kind.concurrency - kind.running
+            if free <= 0:
+                continue
+            now = time.time()
+            for job in await self.backend.claim(job_type, free, now, now + self.lease):
+                self._spawn(kind, job)
+                started += 1
+        return started
+
+    async def run(self):
+        """Worker loop, meant to run as a background task"""
+        self._runner = asyncio.current_task()
+        delay = self.poll_interval
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                await self.poll()
+                delay = self.poll_interval
+            except Exception as e:
+                delay = min(delay * 2, 30.0)
+                logger.warning("Job queue poll failed (retry in %.1fs): %s", delay, e)
+
+    async def drain(self, timeout: Optional[float] = 30.0):
+        """Stop claiming and wait for running jobs, used on shutdown"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._runner is not None and not self._runner.done():
+            await asyncio.wait({self._runner}, timeout=timeout)
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+        await self.backend.close()
+
+    async def snapshot(self) -> Dict:
+        try:
+            depth = await self.backend.depth()
+        except Exception as e:
+            depth = {'error': str(e)}
+        return {
+            'backend': type(self.backend).__name__,
+            'types': {job_type: kind.snapshot() for job_type, kind in self.types.items()},
+            'depth': depth
+        }
+
+
+def create_job_queue(
+    backend: Optional[str] = None,
+    get_redis: Optional[Callable[[], Awaitable]] = None,
+    path: Optional[str] = None
+) -> JobQueue:
+    """
+    Job queue on $VISIONWALK_JOBS: 'sqlite' (default, file `path` or
+    $VISIONWALK_JOBS_PATH, shared by the workers of one host) or 'redis'
+    (shared by every worker). The SQLite path is made absolute here, so the
+    workers of one host agree on the file whatever their working directory.
+    """
+    backend = (backend or os.getenv("VISIONWALK_JOBS", "sqlite")).lower()
+    if backend == 'redis':
+        if get_redis is None:
+            raise ValueError("The redis job backend needs a get_redis callable")
+        return JobQueue(RedisJobBackend(get_redis))
+    if backend == 'sqlite':
+        return JobQueue(SQLiteJobBackend(os.path.abspath(path or os.getenv("VISIONWALK_JOBS_PATH", "jobs.sqlite3"))))
+    raise ValueError(f"Unknown job backend: {backend}")
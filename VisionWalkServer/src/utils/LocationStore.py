@@ -0,0 +1,209 @@
+import asyncio, logging, time
+from typing import Dict, Optional
+from .Storage import TreeStore
+from .Metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+class LocationStore:
+    """
+    Authoritative in-memory view of the `locations` tree with write-behind
+    persistence to the Realtime Database.
+
+    Writes are applied to memory immediately and recorded as dirty paths;
+    a background task flushes the latest value of every dirty path in one
+    multi-path `update` every `flush_interval` seconds, so N updates of the
+    same user between flushes cost a single RTDB write. If the multi-path
+    write fails, every user is written on its own, so one record the
+    database rejects (e.g. a NaN field) cannot hold back the others; a user
+    whose own write fails `max_user_failures` flushes in a row is dropped.
+    When nothing goes through the flush is retried with exponential backoff
+    capped at `max_staleness`, and once the oldest pending write is older
+    than `max_staleness` every failed retry raises an alarm in the log and
+    in `stats['stale_alarms']`. The duration of every successful write is
+    observed in `flush_timer`, if given.
+    """
+    def __init__(
+        self,
+        tree: TreeStore,
+        root: str = 'locations',
+        flush_interval: float = 1.0,
+        max_staleness: float = 10.0,
+        max_batch_size: int = 500,
+        max_user_failures: int = 5,
+        flush_timer: Optional[Histogram] = None
+    ):
+        self.tree = tree
+        self.root = root
+        self.flush_interval = flush_interval
+        self.max_staleness = max_staleness
+        self.max_batch_size = max_batch_size
+        self.max_user_failures = max_user_failures
+        self.flush_timer = flush_timer
+
+        self.records: Dict[str, Dict] = {}
+        self._dirty: Dict[str, Dict] = {}
+        self._dirty_since: Optional[float] = None
+        self._failures: Dict[str, int] = {}
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+        self.stats = {
+            'updates': 0, 'coalesced': 0, 'flushes': 0, 'paths_written': 0, 'flush_errors': 0,
+            'user_write_errors': 0, 'dropped_users': 0, 'stale_alarms': 0
+        }
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self.records
+
+    def get(self, uid: str) -> Optional[Dict]:
+        return self.records.get(uid)
+
+    def load(self, snapshot: Dict):
+        """Seed from an RTDB snapshot without scheduling any write"""
+        for uid, data in (snapshot or {}).items():
+            if isinstance(data, dict):
+                self.records[uid] = dict(data)
+
+    def update(self, uid: str, fields: Dict, persist: bool = True):
+        """Shallow-merge top-level fields into a user node, like `Reference.update`"""
+        self.records.setdefault(uid, {}).update(fields)
+        if not persist:
+            return
+
+        self.stats['updates'] += 1
+        pending = self._dirty.get(uid)
+        if pending is None:
+            self._dirty[uid] = dict(fields)
+        else:
+            self.stats['coalesced'] += 1
+            pending.update(fields)
+
+        if self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+        if len(self._dirty) >= self.max_batch_size:
+            self._wakeup.set()
+
+    def remove(self, uid: str):
+        """Forget a user locally; the RTDB node is left as is"""
+        self.records.pop(uid, None)
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    @property
+    def staleness(self) -> float:
+        """Age in seconds of the oldest unflushed write"""
+        if self._dirty_since is None:
+            return 0.0
+        return time.monotonic() - self._dirty_since
+
+    def _restore(self, batch: Dict[str, Dict], dirty_since: float):
+        """Put unwritten fields back; values written since the swap are newer and win"""
+        for uid, fields in batch.items():
+            pending = self._dirty.setdefault(uid, {})
+            for key, value in fields.items():
+                pending.setdefault(key, value)
+        if self._dirty_since is None or dirty_since < self._dirty_since:
+            self._dirty_since = dirty_since
+
+    async def _flush_each(self, batch: Dict[str, Dict]) -> Dict[str, BaseException]:
+        """Write every user on its own; returns the users whose write failed"""
+        results = await asyncio.gather(
+            *(self.tree.update(f"{self.root}/{uid}", fields) for uid, fields in batch.items()),
+            return_exceptions=True
+        )
+        return {uid: result for uid, result in zip(batch, results) if isinstance(result, BaseException)}
+
+    async def flush(self) -> int:
+        """Write all dirty paths in one multi-path update, per user if that fails. Returns paths written."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+
+            batch, dirty_since = self._dirty, self._dirty_since
+            self._dirty, self._dirty_since = {}, None
+            updates = {
+                f"{uid}/{key}": value
+                for uid, fields in batch.items()
+                for key, value in fields.items()
+            }
+
+            started = time.perf_counter()
+            failed: Dict[str, BaseException] = {}
+            try:
+                try:
+                    await self.tree.update(self.root, updates)
+                except Exception:
+                    failed = await self._flush_each(batch)
+            except BaseException:
+                self._restore(batch, dirty_since)
+                self.stats['flush_errors'] += 1
+                raise
+
+            rejected = any(isinstance(error, (ValueError, TypeError)) for error in failed.values())
+            if len(failed) == len(batch) and not rejected:
+                # Nothing went through and no record was refused as such: the database is unreachable,
+                # keep everything and back off
+                self._restore(batch, dirty_since)
+                self.stats['flush_errors'] += 1
+                raise next(iter(failed.values()))
+
+            for uid, error in failed.items():
+                # This user's write fails on its own (e.g. a value that does not serialize):
+                # retry it a few times, then give up on it
+                self.stats['user_write_errors'] += 1
+                attempts = self._failures.get(uid, 0) + 1
+                if attempts < self.max_user_failures:
+                    self._failures[uid] = attempts
+                    self._restore({uid: batch[uid]}, dirty_since)
+                else:
+                    self._failures.pop(uid, None)
+                    self.stats['dropped_users'] += 1
+                    logger.error("Dropping location update of %s after %d failed writes: %s", uid, attempts, error)
+            if self._failures:
+                for uid in batch:
+                    if uid not in failed:
+                        self._failures.pop(uid, None)
+
+            written = sum(len(fields) for uid, fields in batch.items() if uid not in failed)
+            if self.flush_timer is not None:
+                self.flush_timer.observe(time.perf_counter() - started)
+            self.stats['flushes'] += 1
+            self.stats['paths_written'] += written
+            return written
+
+    async def run(self):
+        """Periodic flusher, meant to run as a background task"""
+        delay = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+                delay = self.flush_interval
+            except Exception as e:
+                delay = min(delay * 2, self.max_staleness)
+                logger.warning("Location flush failed (%d users pending, retry in %.1fs): %s", self.pending, delay, e)
+                if self.staleness > self.max_staleness:
+                    self.stats['stale_alarms'] += 1
+                    logger.error(
+                        "Live locations in the Realtime DB are %.0fs behind (max_staleness %.0fs)",
+                        self.staleness, self.max_staleness
+                    )
+
+    async def drain(self, attempts: int = 3):
+        """Flush everything still pending, used on shutdown"""
+        for attempt in range(attempts):
+            try:
+                await self.flush()
+                return
+            except Exception as e:
+                logger.warning("Location drain attempt %d failed: %s", attempt + 1, e)
+                await asyncio.sleep(min(self.flush_interval * 2 ** attempt, self.max_staleness))
+        logger.error("Dropping %d unflushed location updates", self.pending)
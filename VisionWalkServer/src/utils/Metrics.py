@@ -0,0 +1,214 @@
+import asyncio, logging, math, time
+from bisect import bisect_left
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a cache hit (sub-millisecond) to a slow model call
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+LabelValues = Tuple[str, ...]
+Collect = Callable[[], Union[Dict[LabelValues, float], Awaitable[Dict[LabelValues, float]]]]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: 'Histogram'):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram: an observation is one bisect and two additions.
+    Meant to be updated from the event loop thread.
+    """
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        """`with histogram.time():` observes the block's wall time in seconds"""
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """Estimate, interpolating linearly inside the bucket like histogram_quantile"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                if i == len(self.bounds):
+                    return lower
+                return lower + (self.bounds[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Gauge(Counter):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _Family:
+    def __init__(self, kind: str, name: str, help: str, labelnames: Sequence[str], factory, collect: Optional[Collect]):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.collect = collect
+        self.children: Dict[LabelValues, object] = {}
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self.children[values] = self.factory()
+        return child
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metrics:
+    """
+    Registry of histograms, counters and gauges, rendered in the Prometheus
+    text format (0.0.4).
+
+    Histograms and counters are updated in place by the code being measured;
+    gauges (and counters kept elsewhere, e.g. in a component's `stats`) are
+    read at scrape time from a `collect` callback that returns
+    {label values: value} and may be a coroutine function.
+    """
+    def __init__(self):
+        self.families: Dict[str, _Family] = {}
+        self._stages: Dict[Tuple[str, str], Histogram] = {}
+
+    def _register(self, family: _Family) -> _Family:
+        existing = self.families.get(family.name)
+        if existing is not None:
+            if existing.kind != family.kind or existing.labelnames != family.labelnames:
+                raise ValueError(f"Metric {family.name} is already registered differently")
+            return existing
+        self.families[family.name] = family
+        return family
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> _Family:
+        return self._register(_Family('histogram', name, help, labelnames, lambda: Histogram(buckets), None))
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = (), collect: Optional[Collect] = None) -> _Family:
+        return self._register(_Family('counter', name, help, labelnames, Counter, collect))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), collect: Optional[Collect] = None) -> _Family:
+        return self._register(_Family('gauge', name, help, labelnames, Gauge, collect))
+
+    def stage(self, path: str, stage: str) -> Histogram:
+        """Histogram of visionwalk_stage_seconds for one stage of a request path"""
+        histogram = self._stages.get((path, stage))
+        if histogram is None:
+            histogram = self._stages[path, stage] = self.histogram(
+                'visionwalk_stage_seconds',
+                'Time spent in each stage of a request path',
+                ('path', 'stage')
+            ).labels(path, stage)
+        return histogram
+
+    @staticmethod
+    def _labels(names: Sequence[str], values: LabelValues, extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    async def _collected(self, family: _Family) -> Dict[LabelValues, float]:
+        try:
+            values = family.collect()
+            if asyncio.iscoroutine(values):
+                values = await values
+            return values
+        except Exception:
+            logger.exception("Collecting metric %s failed", family.name)
+            return {}
+
+    async def render(self) -> str:
+        lines: List[str] = []
+        for family in self.families.values():
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            if family.kind == 'histogram':
+                for values, histogram in family.children.items():
+                    cumulative = 0
+                    for bound, bucket_count in zip(histogram.bounds + (math.inf,), histogram.counts):
+                        cumulative += bucket_count
+                        labels = self._labels(family.labelnames, values, f'le="{_format(bound)}"')
+                        lines.append(f"{family.name}_bucket{labels} {cumulative}")
+                    labels = self._labels(family.labelnames, values)
+                    lines.append(f"{family.name}_sum{labels} {_format(histogram.sum)}")
+                    lines.append(f"{family.name}_count{labels} {histogram.count}")
+                continue
+
+            samples = {values: child.value for values, child in family.children.items()}
+            if family.collect is not None:
+                samples.update(await self._collected(family))
+            for values, value in samples.items():
+                lines.append(f"{family.name}{self._labels(family.labelnames, values)} {_format(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict:
+        """Histogram summaries (count, mean and p50/p99 estimates in ms) for the JSON stats endpoints"""
+        result = {}
+        for family in self.families.values():
+            if family.kind != 'histogram':
+                continue
+            for values, histogram in family.children.items():
+                if histogram.count == 0:
+                    continue
+                result['/'.join(values) or family.name] = {
+                    'count': histogram.count,
+                    'mean_ms': round(histogram.sum / histogram.count * 1000, 3),
+                    'p50_ms': round(histogram.quantile(0.5) * 1000, 3),
+                    'p99_ms': round(histogram.quantile(0.99) * 1000, 3)
+                }
+        return result
@@ -0,0 +1,90 @@
+import math, time
+from typing import Dict, Optional, Tuple
+
+class MotionFilter:
+    """
+    Dead-reckoning suppression for location broadcasts.
+
+    The last broadcast fix of each user is kept as a keyframe. A new fix is
+    only broadcast when it drifts more than `distance_threshold_m` from the
+    position predicted by moving the keyframe along its heading at its speed,
+    when the heading turns by more than `heading_threshold_deg` while moving,
+    or when `keyframe_interval` seconds have passed since the last broadcast.
+    """
+    METERS_PER_DEG = 111320.0
+
+    def __init__(
+        self,
+        distance_threshold_m: float = 5.0,
+        heading_threshold_deg: float = 20.0,
+        keyframe_interval: float = 10.0,
+        min_heading_speed: float = 0.5
+    ):
+        self.distance_threshold_m = distance_threshold_m
+        self.heading_threshold_deg = heading_threshold_deg
+        self.keyframe_interval = keyframe_interval
+        # Below this speed (m/s) GPS headings are noise
+        self.min_heading_speed = min_heading_speed
+
+        # uid -> (latitude, longitude, heading, speed, monotonic time)
+        self._keyframes: Dict[str, Tuple[float, float, float, float, float]] = {}
+        self.stats = {'received': 0, 'broadcast': 0, 'suppressed': 0, 'keyframes': 0}
+
+    @staticmethod
+    def _motion(location: Dict) -> Tuple[float, float]:
+        # Devices report -1 / None when heading or speed is unavailable
+        heading = location.get('heading') or 0.0
+        speed = location.get('speed') or 0.0
+        return heading % 360, max(speed, 0.0)
+
+    def predict(self, uid: str, now: float) -> Optional[Tuple[float, float]]:
+        keyframe = self._keyframes.get(uid)
+        if keyframe is None:
+            return None
+        latitude, longitude, heading, speed, t = keyframe
+        distance = speed * (now - t)
+        bearing = math.radians(heading)
+        cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+        return (
+            latitude + distance * math.cos(bearing) / self.METERS_PER_DEG,
+            longitude + distance * math.sin(bearing) / (self.METERS_PER_DEG * cos_lat)
+        )
+
+    def should_broadcast(self, uid: str, location: Dict, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self.stats['received'] += 1
+        heading, speed = self._motion(location)
+
+        keyframe = self._keyframes.get(uid)
+        keyframe_due = keyframe is None or now - keyframe[4] >= self.keyframe_interval
+        if not keyframe_due and not self._diverged(uid, keyframe, location, heading, speed, now):
+            self.stats['suppressed'] += 1
+            return False
+
+        if keyframe_due:
+            self.stats['keyframes'] += 1
+        self.stats['broadcast'] += 1
+        self._keyframes[uid] = (location['latitude'], location['longitude'], heading, speed, now)
+        return True
+
+    def _diverged(self, uid: str, keyframe: Tuple, location: Dict, heading: float, speed: float, now: float) -> bool:
+        predicted_lat, predicted_lon = self.predict(uid, now)
+        dy = (location['latitude'] - predicted_lat) * self.METERS_PER_DEG
+        dx = (location['longitude'] - predicted_lon) * self.METERS_PER_DEG * math.cos(math.radians(predicted_lat))
+        if math.hypot(dx, dy) > self.distance_threshold_m:
+            return True
+
+        turn = abs((heading - keyframe[2] + 180) % 360 - 180)
+        moving = max(speed, keyframe[3]) >= self.min_heading_speed
+        return moving and turn > self.heading_threshold_deg
+
+    def reset(self, uid: str):
+        self._keyframes.pop(uid, None)
+
+    def snapshot(self) -> Dict:
+        received = self.stats['received']
+        return {
+            **self.stats,
+            'suppression_rate': self.stats['suppressed'] / received if received else 0.0,
+            'tracked_users': len(self._keyframes)
+        }
@@ -0,0 +1,79 @@
+import asyncio, bcrypt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+
+class HasherBusy(Exception):
+    """Too many hashes already queued; the caller should reject the request"""
+
+
+class PasswordHasher:
+    """
+    bcrypt on a dedicated, size-limited thread pool.
+
+    bcrypt releases the GIL while hashing, so `workers` threads hash in
+    parallel without touching the event loop. At most `max_pending` hashes
+    may be running or queued; beyond that `HasherBusy` is raised at once
+    instead of letting requests pile up behind a login storm. Hashes made
+    with fewer than `rounds` rounds are reported by `verify_and_upgrade` so
+    the caller can store a stronger one.
+    """
+    def __init__(self, workers: int = 2, max_pending: int = 32, rounds: int = 12):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._pending = 0
+
+        self.stats = {'hashed': 0, 'verified': 0, 'failed': 0, 'rejected': 0, 'upgraded': 0, 'max_pending': 0}
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self.stats['rejected'] += 1
+            raise HasherBusy("Password hashing queue is full")
+        self._pending += 1
+        self.stats['max_pending'] = max(self.stats['max_pending'], self._pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    def _hash(self, password: bytes) -> bytes:
+        return bcrypt.hashpw(password, bcrypt.gensalt(rounds=self.rounds))
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(self._hash, password.encode('utf-8'))
+        self.stats['hashed'] += 1
+        return hashed.decode('utf-8')
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        ok = await self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+        self.stats['verified' if ok else 'failed'] += 1
+        return ok
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # $2b$<rounds>$<salt + hash>
+        try:
+            return int(hashed.split('$')[2]) < self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    async def verify_and_upgrade(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Check a password; on success also return a new hash if the stored cost is too low"""
+        if not await self.verify(password, hashed):
+            return False, None
+        if not self.needs_rehash(hashed):
+            return True, None
+        try:
+            upgraded = await self.hash(password)
+        except HasherBusy:
+            # The login itself succeeded; upgrade on a later one
+            return True, None
+        self.stats['upgraded'] += 1
+        return True, upgraded
+
+    @staticmethod
+    def salt_of(hashed: str) -> str:
+        return hashed[:29]
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, 'pending': self._pending, 'rounds': self.rounds}
@@ -0,0 +1,235 @@
+import asyncio, glob, hashlib, logging, os, time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+from PIL import Image, ImageOps
+from .Storage import BlobStore, DocumentStore
+from .JobQueue import JobQueue
+
+logger = logging.getLogger(__name__)
+
+
+class UndecodableImage(ValueError):
+    """The spooled upload cannot be decoded; retrying the job will not help"""
+
+
+class ProfileImagePipeline:
+    """
+    Background processing of uploaded profile images.
+
+    `submit` only checks the header, writes the upload to `spool_dir` and
+    enqueues a 'profile_image' job on `jobs` (one pending job per user; a
+    newer upload replaces the file of a job that has not started), so a
+    failed upload is retried and work survives a restart. With the redis
+    job backend `spool_dir` has to be shared by the hosts. Jobs carry the
+    absolute path of their file, so workers with another working directory
+    find it too. The job decodes
+    the image once (JPEG draft mode decodes straight at the
+    largest size needed), EXIF-rotated, flattened to RGB and downscaled
+    step by step to every entry of `sizes`, each encoded as a progressive
+    JPEG. Renditions are stored under `<folder>/<sha256 of upload>/<size>.jpg`
+    and the hash is recorded in the `collection` of the document store, so
+    the same picture uploaded again (by anyone, on any worker) is not
+    processed or uploaded twice. An upload that fails to decode is dropped
+    at once, and a job that runs out of attempts removes its file too. Renditions upload concurrently, at most
+    `upload_concurrency` at a time, then `on_ready(uid, urls)` patches the
+    profile unless a newer upload for the same user has been submitted.
+    """
+    def __init__(
+        self,
+        blobs: BlobStore,
+        documents: DocumentStore,
+        on_ready: Callable[[str, Dict[str, str]], Awaitable[None]],
+        jobs: JobQueue,
+        sizes: Sequence[int] = (512, 256, 96),
+        quality: int = 85,
+        max_pixels: int = 40_000_000,
+        workers: int = 2,
+        upload_concurrency: int = 4,
+        folder: str = 'profileImages',
+        collection: str = 'profile_images',
+        spool_dir: Optional[str] = None,
+        concurrency: int = 2
+    ):
+        self.blobs = blobs
+        self.documents = documents
+        self.on_ready = on_ready
+        self.sizes = sorted(sizes, reverse=True)
+        self.quality = quality
+        self.max_pixels = max_pixels
+        self.folder = folder
+        self.collection = collection
+        self.spool_dir = os.path.abspath(spool_dir or os.path.join('spool', 'profile_images'))
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+        self._uploads = asyncio.Semaphore(upload_concurrency)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._latest: Dict[str, int] = {}
+        self.jobs = jobs
+        self.jobs.register('profile_image', self._run, concurrency=concurrency, max_attempts=5, backoff_base=2.0,
+                           on_dead=self._discard)
+
+        self.stats = {
+            'submitted': 0, 'processed': 0, 'deduplicated': 0, 'superseded': 0, 'failed': 0,
+            'renditions_uploaded': 0, 'bytes_in': 0, 'bytes_out': 0
+        }
+
+    def check(self, image_bytes: bytes):
+        """Cheap request-time validation (header only); raises ValueError"""
+        try:
+            with Image.open(BytesIO(image_bytes)) as img:
+                width, height = img.size
+        except Exception:
+            raise ValueError("File is not a supported image")
+        if width * height > self.max_pixels:
+            raise ValueError("Image is too large")
+
+    def _spool(self, uid: str, submitted_at: int, image_bytes: bytes) -> str:
+        """Runs in the executor: write-then-rename, so a job never sees half a file"""
+        path = os.path.join(self.spool_dir, f"{uid}.{submitted_at}")
+        with open(path + '.tmp', 'wb') as f:
+            f.write(image_bytes)
+        os.replace(path + '.tmp', path)
+        return path
+
+    def _unspool(self, uid: str, submitted_at: int):
+        """Remove the spooled file of this job and of the uploads it replaced, with `.tmp` leftovers of crashed spools"""
+        for path in glob.glob(os.path.join(glob.escape(self.spool_dir), glob.escape(uid) + '.*')):
+            name = path[:-len('.tmp')] if path.endswith('.tmp') else path
+            suffix = name.rsplit('.', 1)[-1]
+            if suffix.isdigit() and int(suffix) <= submitted_at:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    async def submit(self, uid: str, image_bytes: bytes):
+        """Validate, spool and queue a new profile image for uid"""
+        self.check(image_bytes)
+        self.stats['submitted'] += 1
+        self.stats['bytes_in'] += len(image_bytes)
+        submitted_at = time.time_ns()
+        self._latest[uid] = submitted_at
+        loop = asyncio.get_running_loop()
+        path = await loop.run_in_executor(self.executor, self._spool, uid, submitted_at, image_bytes)
+        await self.jobs.enqueue(
+            'profile_image',
+            {'uid': uid, 'path': path, 'submitted_at': submitted_at},
+            key=f"profile_image:{uid}",
+            replace=True
+        )
+
+    def _render(self, image_bytes: bytes) -> Dict[int, bytes]:
+        """Runs in the executor: one decode, every size"""
+        renditions = {}
+        with Image.open(BytesIO(image_bytes)) as img:
+            largest = self.sizes[0]
+            img.draft('RGB', (largest, largest))
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGBA')
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel('A'))
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            for size in self.sizes:
+                # Each size is scaled from the previous, already smaller one
+                img.thumbnail((size, size), Image.Resampling.LANCZOS)
+                out = BytesIO()
+                img.save(out, format='JPEG', quality=self.quality, optimize=True, progressive=True)
+                renditions[size] = out.getvalue()
+        return renditions
+
+    async def _upload(self, digest: str, size: int, data: bytes) -> str:
+        async with self._uploads:
+            url = await self.blobs.put(f"{self.folder}/{digest}/{size}.jpg", data, 'image/jpeg')
+        self.stats['renditions_uploaded'] += 1
+        self.stats['bytes_out'] += len(data)
+        return url
+
+    async def _process(self, digest: str, image_bytes: bytes) -> Dict[str, str]:
+        known = await self.documents.get(self.collection, digest)
+        if known:
+            self.stats['deduplicated'] += 1
+            return known['urls']
+
+        loop = asyncio.get_running_loop()
+        try:
+            renditions = await loop.run_in_executor(self.executor, self._render, image_bytes)
+        except (OSError, Image.DecompressionBombError) as e:
+            # UnidentifiedImageError and truncated files; upload errors below stay retryable
+            raise UndecodableImage(str(e)) from e
+        urls = await asyncio.gather(*(self._upload(digest, size, data) for size, data in renditions.items()))
+        urls = {str(size): url for size, url in zip(renditions, urls)}
+        await self.documents.set(self.collection, digest, {'urls': urls})
+        self.stats['processed'] += 1
+        return urls
+
+    async def _urls_for(self, digest: str, image_bytes: bytes) -> Dict[str, str]:
+        # The same picture submitted twice at once is processed once
+        future = self._inflight.get(digest)
+        if future is not None:
+            self.stats['deduplicated'] += 1
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[digest] = future
+        try:
+            urls = await self._process(digest, image_bytes)
+            future.set_result(urls)
+            return urls
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved, even if nobody was waiting
+            raise
+        finally:
+            self._inflight.pop(digest, None)
+            if not future.done():
+                future.cancel()
+
+    @staticmethod
+    def _read(path: str) -> Tuple[bytes, str]:
+        with open(path, 'rb') as f:
+            image_bytes = f.read()
+        return image_bytes, hashlib.sha256(image_bytes).hexdigest()
+
+    async def _run(self, payload: Dict):
+        """Job handler; raising lets the job queue retry with backoff"""
+        uid, submitted_at = payload['uid'], payload['submitted_at']
+        path = payload['path']
+        if not os.path.isabs(path):
+            # Queued before paths were absolute: relative to whatever cwd the submitting worker had
+            path = os.path.join(self.spool_dir, os.path.basename(path))
+        loop = asyncio.get_running_loop()
+        try:
+            image_bytes, digest = await loop.run_in_executor(self.executor, self._read, path)
+        except FileNotFoundError:
+            # Already handled by an earlier attempt; retrying cannot bring the file back
+            logger.warning("Profile image for %s is no longer spooled, skipping", uid)
+            return
+        try:
+            urls = await self._urls_for(digest, image_bytes)
+            # Only this worker knows about newer uploads; after a restart the job simply applies
+            if self._latest.get(uid, submitted_at) > submitted_at:
+                self.stats['superseded'] += 1
+            else:
+                await self.on_ready(uid, urls)
+                if self._latest.get(uid) == submitted_at:
+                    del self._latest[uid]
+        except UndecodableImage as e:
+            self.stats['failed'] += 1
+            logger.error("Profile image for %s cannot be decoded, dropping it: %s", uid, e)
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.warning("Profile image for %s failed: %s", uid, e)
+            raise
+        await loop.run_in_executor(self.executor, self._unspool, uid, submitted_at)
+
+    async def _discard(self, payload: Dict):
+        """on_dead of the job queue: the job gave up, its spooled file is not needed anymore"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._unspool, payload['uid'], payload['submitted_at'])
+
+    def snapshot(self) -> Dict:
+        return dict(self.stats)
@@ -0,0 +1,103 @@
+import numpy as np
+from typing import Dict, List, Set, Tuple
+from geopy.distance import geodesic
+from .SpatialIndex import SpatialIndex
+from .geo import haversine_km, SPHERE_ERROR
+
+Neighbor = Tuple[str, float]
+
+class ProximityTracker:
+    """
+    Incrementally maintained "who is within `radius_km` of whom" relation.
+
+    The relation is symmetric and can only change when one of its two ends
+    moves, so each position update diffs the mover's new neighbourhood
+    against the old one and reports who entered, who is still in range (and
+    must see the move) and who left. A pair only leaves once it is more than
+    `radius_km * (1 + hysteresis)` apart, so users walking along the edge of
+    the radius do not flap in and out.
+
+    The caller updates the SpatialIndex first; the tracker only reads it.
+    """
+    def __init__(self, index: SpatialIndex, radius_km: float, hysteresis: float = 0.05):
+        self.index = index
+        self.radius_km = radius_km
+        self.leave_radius_km = radius_km * (1 + hysteresis)
+        self._neighbors: Dict[str, Set[str]] = {}
+
+        self.stats = {'updates': 0, 'enters': 0, 'moves': 0, 'leaves': 0}
+
+    def neighbors(self, uid: str) -> List[Neighbor]:
+        """Current neighbours of uid with their distances, nearest first"""
+        position = self.index.get(uid)
+        others = [other for other in self._neighbors.get(uid, ()) if other in self.index]
+        if position is None or not others:
+            return []
+        positions = np.array([self.index.get(other) for other in others])
+        distances = haversine_km(position[0], position[1], positions[:, 0], positions[:, 1])
+        return sorted(zip(others, distances.tolist()), key=lambda item: item[1])
+
+    def update(self, uid: str) -> Tuple[List[Neighbor], List[Neighbor], List[str]]:
+        """Re-evaluate uid at its indexed position; returns (entered, moved, left)"""
+        position = self.index.get(uid)
+        if position is None:
+            return [], [], self.remove(uid)
+
+        self.stats['updates'] += 1
+        old = self._neighbors.get(uid, set())
+        entered: List[Neighbor] = []
+        moved: List[Neighbor] = []
+        current: Set[str] = set()
+        for other, distance in self.index.query_radius(*position, self.leave_radius_km, exclude=uid):
+            if other in old:
+                moved.append((other, distance))
+            elif self._within_radius(position, other, distance):
+                entered.append((other, distance))
+            else:
+                continue
+            current.add(other)
+
+        left = [other for other in old if other not in current]
+        for other, _ in entered:
+            self._neighbors.setdefault(other, set()).add(uid)
+        for other in left:
+            self._unlink(other, uid)
+        if current:
+            self._neighbors[uid] = current
+        else:
+            self._neighbors.pop(uid, None)
+
+        self.stats['enters'] += len(entered)
+        self.stats['moves'] += len(moved)
+        self.stats['leaves'] += len(left)
+        return entered, moved, left
+
+    def _within_radius(self, position: Tuple[float, float], other: str, distance: float) -> bool:
+        # Queried with the leave radius, so distances near radius_km are still
+        # spherical: settle those with the geodesic, like query_radius does
+        margin = self.radius_km * SPHERE_ERROR
+        if abs(distance - self.radius_km) > margin:
+            return distance <= self.radius_km
+        return geodesic(position, self.index.get(other)).km <= self.radius_km
+
+    def remove(self, uid: str) -> List[str]:
+        """Drop uid from the relation; returns the users that lose it as a neighbour"""
+        left = list(self._neighbors.pop(uid, ()))
+        for other in left:
+            self._unlink(other, uid)
+        self.stats['leaves'] += len(left)
+        return left
+
+    def _unlink(self, uid: str, other: str):
+        neighbors = self._neighbors.get(uid)
+        if neighbors is not None:
+            neighbors.discard(other)
+            if not neighbors:
+                del self._neighbors[uid]
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            'tracked_users': len(self._neighbors),
+            'pairs': sum(len(neighbors) for neighbors in self._neighbors.values()) // 2
+        }
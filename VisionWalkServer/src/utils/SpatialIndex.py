@@ -0,0 +1,175 @@
+import math, itertools, numpy as np
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .geo import within_radius
+
+Cell = Tuple[int, int]
+
+class SpatialIndex:
+    """
+    In-process fixed-degree grid over (latitude, longitude).
+
+    Positions are bucketed into cells of `cell_deg` degrees and stored in
+    NumPy latitude / longitude columns; a radius query only visits the cells
+    overlapping the query's bounding box and measures those candidates with
+    the vectorized kernel in `geo.within_radius`.
+    """
+    KM_PER_DEG_LAT = 111.32
+    EARTH_HALF_CIRCUMFERENCE_KM = 20037.5
+
+    def __init__(self, cell_deg: float = 0.01, capacity: int = 1024):
+        self.cell_deg = cell_deg
+        self.lon_cells = round(360 / cell_deg)
+        self.cells: Dict[Cell, Set[int]] = {}
+
+        # Columnar storage, one slot per tracked user
+        self._lats = np.zeros(capacity, dtype=np.float64)
+        self._lons = np.zeros(capacity, dtype=np.float64)
+        self._slots: Dict[str, int] = {}
+        self._uids: List[Optional[str]] = []
+        self._slot_cells: List[Optional[Cell]] = []
+        self._free: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._slots
+
+    def cell_of(self, latitude: float, longitude: float) -> Cell:
+        return (
+            math.floor(latitude / self.cell_deg),
+            self._wrap_lon(math.floor(longitude / self.cell_deg))
+        )
+
+    def _wrap_lon(self, j: int) -> int:
+        half = self.lon_cells // 2
+        return (j + half) % self.lon_cells - half
+
+    def get(self, uid: str) -> Optional[Tuple[float, float]]:
+        slot = self._slots.get(uid)
+        if slot is None:
+            return None
+        return float(self._lats[slot]), float(self._lons[slot])
+
+    def update(self, uid: str, latitude: float, longitude: float):
+        cell = self.cell_of(latitude, longitude)
+        slot = self._slots.get(uid)
+        if slot is None:
+            slot = self._allocate(uid)
+            self.cells.setdefault(cell, set()).add(slot)
+        elif self._slot_cells[slot] != cell:
+            self._discard(slot, self._slot_cells[slot])
+            self.cells.setdefault(cell, set()).add(slot)
+
+        self._lats[slot] = latitude
+        self._lons[slot] = longitude
+        self._slot_cells[slot] = cell
+
+    def remove(self, uid: str):
+        slot = self._slots.pop(uid, None)
+        if slot is None:
+            return
+        self._discard(slot, self._slot_cells[slot])
+        self._uids[slot] = None
+        self._slot_cells[slot] = None
+        self._free.append(slot)
+
+    def _allocate(self, uid: str) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._uids[slot] = uid
+        else:
+            slot = len(self._uids)
+            if slot == len(self._lats):
+                self._lats = np.resize(self._lats, 2 * slot)
+                self._lons = np.resize(self._lons, 2 * slot)
+            self._uids.append(uid)
+            self._slot_cells.append(None)
+        self._slots[uid] = slot
+        return slot
+
+    def _discard(self, slot: int, cell: Cell):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(slot)
+            if not members:
+                del self.cells[cell]
+
+    def covering_cells(self, latitude: float, longitude: float, radius_km: float) -> List[Cell]:
+        """All grid cells overlapping the radius' bounding box"""
+        i0, i1, j0, lon_span = self._cell_box(latitude, longitude, radius_km)
+        return [
+            (i, self._wrap_lon(j))
+            for i in range(i0, i1 + 1)
+            for j in range(j0, j0 + lon_span)
+        ]
+
+    def _cell_box(self, latitude: float, longitude: float, radius_km: float) -> Tuple[int, int, int, int]:
+        dlat = radius_km / self.KM_PER_DEG_LAT
+        # Use the widest parallel inside the box so no cell is missed
+        widest_lat = min(abs(latitude) + dlat, 90.0)
+        cos_lat = math.cos(math.radians(widest_lat))
+        if cos_lat < 1e-9:
+            dlon = 180.0
+        else:
+            dlon = min(radius_km / (self.KM_PER_DEG_LAT * cos_lat), 180.0)
+
+        i0 = math.floor((latitude - dlat) / self.cell_deg)
+        i1 = math.floor((latitude + dlat) / self.cell_deg)
+        j0 = math.floor((longitude - dlon) / self.cell_deg)
+        j1 = math.floor((longitude + dlon) / self.cell_deg)
+        return i0, i1, j0, min(j1 - j0 + 1, self.lon_cells)
+
+    def _candidate_cells(self, latitude: float, longitude: float, radius_km: float) -> Iterable[Cell]:
+        i0, i1, _, lon_span = self._cell_box(latitude, longitude, radius_km)
+        # Huge boxes (or a sparse index) are cheaper to filter than to enumerate
+        if (i1 - i0 + 1) * lon_span > len(self.cells):
+            return [cell for cell in self.cells if i0 <= cell[0] <= i1]
+        return self.covering_cells(latitude, longitude, radius_km)
+
+    def candidate_slots(self, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+        """Slots in the cells overlapping the radius (superset of the answer)"""
+        members = [
+            self.cells[cell]
+            for cell in self._candidate_cells(latitude, longitude, radius_km)
+            if cell in self.cells
+        ]
+        return np.fromiter(itertools.chain.from_iterable(members), dtype=np.intp)
+
+    def query_radius(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        exclude: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """(uid, distance_km) within radius_km, sorted by distance"""
+        slots = self.candidate_slots(latitude, longitude, radius_km)
+        if exclude is not None and exclude in self._slots:
+            slots = slots[slots != self._slots[exclude]]
+        if not len(slots):
+            return []
+
+        idx, distances = within_radius(
+            latitude, longitude, self._lats[slots], self._lons[slots], radius_km
+        )
+        uids = self._uids
+        return [(uids[slot], distance) for slot, distance in zip(slots[idx].tolist(), distances.tolist())]
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int,
+        max_radius_km: Optional[float] = None,
+        exclude: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """k nearest (uid, distance_km), growing the search radius geometrically"""
+        limit = max_radius_km or self.EARTH_HALF_CIRCUMFERENCE_KM
+        radius = min(self.cell_deg * self.KM_PER_DEG_LAT, limit)
+        while True:
+            found = self.query_radius(latitude, longitude, radius, exclude=exclude)
+            # Everything outside the radius is farther than everything inside it
+            if len(found) >= k or radius >= limit:
+                return found[:k]
+            radius = min(radius * 2, limit)
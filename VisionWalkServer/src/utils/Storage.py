@@ -0,0 +1,380 @@
+import asyncio, copy, os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class DocumentExists(Exception):
+    """create() on a document id that is already taken"""
+
+
+class DocumentNotFound(Exception):
+    """update() on a document that does not exist"""
+
+
+def _key_order(key: str):
+    # RTDB orders integer-like keys numerically, before the other keys
+    return (0, int(key), '') if key.isdigit() else (1, 0, key)
+
+
+def _split(path: str) -> List[str]:
+    return [part for part in path.split('/') if part]
+
+
+class DocumentStore(ABC):
+    """
+    Async access to Firestore-style collections of documents.
+
+    Documents are plain dicts keyed by (collection, id). `get` returns None
+    for a missing document, `create` raises DocumentExists and `update`
+    (a shallow merge of top-level fields) raises DocumentNotFound.
+    """
+    @abstractmethod
+    async def get(self, collection: str, doc_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def get_many(self, collection: str, doc_ids: Iterable[str], fields: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Existing documents among doc_ids in one round trip, optionally projected on fields"""
+
+    @abstractmethod
+    async def find(self, collection: str, field: str, value: Any, limit: Optional[int] = None) -> List[Tuple[str, Dict]]:
+        """(id, document) pairs whose `field` equals `value`"""
+
+    @abstractmethod
+    async def set(self, collection: str, doc_id: str, data: Dict):
+        ...
+
+    @abstractmethod
+    async def create(self, collection: str, doc_id: str, data: Dict):
+        ...
+
+    @abstractmethod
+    async def update(self, collection: str, doc_id: str, changes: Dict):
+        ...
+
+    @abstractmethod
+    async def delete(self, collection: str, doc_id: str):
+        ...
+
+
+class TreeStore(ABC):
+    """
+    Async access to a Realtime Database-style JSON tree addressed by
+    '/'-separated paths. Writing None deletes a node; `update` is the
+    multi-path update of RTDB (keys are paths relative to `path`).
+    """
+    @abstractmethod
+    async def get(self, path: str) -> Any:
+        ...
+
+    @abstractmethod
+    async def get_range(self, path: str, start_key: str, end_key: str) -> Dict:
+        """Children of `path` with start_key <= key <= end_key in RTDB key order"""
+
+    @abstractmethod
+    async def set(self, path: str, value: Any):
+        ...
+
+    @abstractmethod
+    async def update(self, path: str, updates: Dict[str, Any]):
+        ...
+
+
+class BlobStore(ABC):
+    """Async object storage for uploaded files; `put` returns a public URL"""
+    @abstractmethod
+    async def put(self, path: str, data: bytes, content_type: str) -> str:
+        ...
+
+    @abstractmethod
+    async def delete(self, path: str):
+        ...
+
+
+class _OffLoop:
+    """Runs the blocking Firebase SDK calls on a dedicated thread pool"""
+    def __init__(self, executor: ThreadPoolExecutor):
+        self.executor = executor
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+
+class FirestoreDocuments(_OffLoop, DocumentStore):
+    def __init__(self, client, executor: ThreadPoolExecutor):
+        super().__init__(executor)
+        self.client = client
+
+    def _ref(self, collection: str, doc_id: str):
+        return self.client.collection(collection).document(doc_id)
+
+    async def get(self, collection, doc_id):
+        doc = await self._run(self._ref(collection, doc_id).get)
+        return doc.to_dict() if doc.exists else None
+
+    def _get_all(self, collection, doc_ids, fields):
+        refs = [self._ref(collection, doc_id) for doc_id in doc_ids]
+        return {doc.id: doc.to_dict() for doc in self.client.get_all(refs, field_paths=fields) if doc.exists}
+
+    async def get_many(self, collection, doc_ids, fields=None):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return {}
+        return await self._run(self._get_all, collection, doc_ids, fields)
+
+    def _find(self, collection, field, value, limit):
+        query = self.client.collection(collection).where(field, "==", value)
+        if limit:
+            query = query.limit(limit)
+        return [(doc.id, doc.to_dict()) for doc in query.stream()]
+
+    async def find(self, collection, field, value, limit=None):
+        return await self._run(self._find, collection, field, value, limit)
+
+    async def set(self, collection, doc_id, data):
+        await self._run(self._ref(collection, doc_id).set, data)
+
+    async def create(self, collection, doc_id, data):
+        from google.api_core.exceptions import AlreadyExists
+        try:
+            await self._run(self._ref(collection, doc_id).create, data)
+        except AlreadyExists:
+            raise DocumentExists(f"{collection}/{doc_id}")
+
+    async def update(self, collection, doc_id, changes):
+        from google.api_core.exceptions import NotFound
+        try:
+            await self._run(self._ref(collection, doc_id).update, changes)
+        except NotFound:
+            raise DocumentNotFound(f"{collection}/{doc_id}")
+
+    async def delete(self, collection, doc_id):
+        await self._run(self._ref(collection, doc_id).delete)
+
+
+class RealtimeTree(_OffLoop, TreeStore):
+    def __init__(self, rtdb, executor: ThreadPoolExecutor):
+        super().__init__(executor)
+        self.rtdb = rtdb
+
+    async def get(self, path):
+        return await self._run(self.rtdb.reference(path).get)
+
+    def _get_range(self, path, start_key, end_key):
+        return self.rtdb.reference(path).order_by_key().start_at(start_key).end_at(end_key).get() or {}
+
+    async def get_range(self, path, start_key, end_key):
+        return await self._run(self._get_range, path, start_key, end_key)
+
+    async def set(self, path, value):
+        await self._run(self.rtdb.reference(path).set, value)
+
+    async def update(self, path, updates):
+        await self._run(self.rtdb.reference(path).update, updates)
+
+
+class FirebaseBlobs(_OffLoop, BlobStore):
+    def __init__(self, bucket, executor: ThreadPoolExecutor):
+        super().__init__(executor)
+        self.bucket = bucket
+
+    def _put(self, path, data, content_type):
+        blob = self.bucket.blob(path)
+        blob.upload_from_string(data, content_type=content_type)
+        blob.make_public()
+        return blob.public_url
+
+    async def put(self, path, data, content_type):
+        return await self._run(self._put, path, data, content_type)
+
+    async def delete(self, path):
+        await self._run(self.bucket.blob(path).delete)
+
+
+class _Simulated:
+    """Optional per-call latency so in-memory load tests see realistic interleaving"""
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def _round_trip(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+
+class MemoryDocuments(_Simulated, DocumentStore):
+    """In-process DocumentStore; reads and writes copy, like a round trip would"""
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.collections: Dict[str, Dict[str, Dict]] = {}
+
+    def _docs(self, collection: str) -> Dict[str, Dict]:
+        return self.collections.setdefault(collection, {})
+
+    async def get(self, collection, doc_id):
+        await self._round_trip()
+        doc = self._docs(collection).get(doc_id)
+        return copy.deepcopy(doc) if doc is not None else None
+
+    async def get_many(self, collection, doc_ids, fields=None):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return {}
+        await self._round_trip()
+        docs = self._docs(collection)
+        return {
+            doc_id: copy.deepcopy({k: v for k, v in docs[doc_id].items() if fields is None or k in fields})
+            for doc_id in doc_ids if doc_id in docs
+        }
+
+    async def find(self, collection, field, value, limit=None):
+        await self._round_trip()
+        found = [(doc_id, copy.deepcopy(doc)) for doc_id, doc in self._docs(collection).items() if doc.get(field) == value]
+        return found[:limit] if limit else found
+
+    async def set(self, collection, doc_id, data):
+        await self._round_trip()
+        self._docs(collection)[doc_id] = copy.deepcopy(data)
+
+    async def create(self, collection, doc_id, data):
+        await self._round_trip()
+        docs = self._docs(collection)
+        if doc_id in docs:
+            raise DocumentExists(f"{collection}/{doc_id}")
+        docs[doc_id] = copy.deepcopy(data)
+
+    async def update(self, collection, doc_id, changes):
+        await self._round_trip()
+        doc = self._docs(collection).get(doc_id)
+        if doc is None:
+            raise DocumentNotFound(f"{collection}/{doc_id}")
+        doc.update(copy.deepcopy(changes))
+
+    async def delete(self, collection, doc_id):
+        await self._round_trip()
+        self._docs(collection).pop(doc_id, None)
+
+
+class MemoryTree(_Simulated, TreeStore):
+    """In-process TreeStore with RTDB semantics for None/empty values and key order"""
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.root: Dict = {}
+
+    def _node(self, parts: List[str]) -> Any:
+        node = self.root
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _write(self, parts: List[str], value: Any):
+        if not parts:
+            self.root = copy.deepcopy(value) if isinstance(value, dict) else {}
+            return
+        node = self.root
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None or value == {}:
+                    return
+                child = node[part] = {}
+            node = child
+        if value is None or value == {}:
+            # RTDB does not keep empty nodes
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+
+    async def get(self, path):
+        await self._round_trip()
+        node = self._node(_split(path))
+        return copy.deepcopy(node) if node != {} else None
+
+    async def get_range(self, path, start_key, end_key):
+        await self._round_trip()
+        node = self._node(_split(path))
+        if not isinstance(node, dict):
+            return {}
+        low, high = _key_order(start_key), _key_order(end_key)
+        return {
+            key: copy.deepcopy(value) for key, value in sorted(node.items(), key=lambda item: _key_order(item[0]))
+            if low <= _key_order(key) <= high
+        }
+
+    async def set(self, path, value):
+        await self._round_trip()
+        self._write(_split(path), value)
+
+    async def update(self, path, updates):
+        await self._round_trip()
+        base = _split(path)
+        for relative, value in updates.items():
+            self._write(base + _split(relative), value)
+
+
+class MemoryBlobs(_Simulated, BlobStore):
+    def __init__(self, latency: float = 0.0, base_url: str = 'memory://blobs'):
+        super().__init__(latency)
+        self.base_url = base_url
+        self.blobs: Dict[str, Tuple[bytes, str]] = {}
+
+    async def put(self, path, data, content_type):
+        await self._round_trip()
+        self.blobs[path] = (bytes(data), content_type)
+        return f"{self.base_url}/{path}"
+
+    async def delete(self, path):
+        await self._round_trip()
+        self.blobs.pop(path, None)
+
+
+class Storage:
+    """The three stores the server uses, from one backend"""
+    def __init__(self, backend: str, documents: DocumentStore, tree: TreeStore, blobs: BlobStore):
+        self.backend = backend
+        self.documents = documents
+        self.tree = tree
+        self.blobs = blobs
+
+
+def create_storage(
+    backend: Optional[str] = None,
+    credentials_path: Optional[str] = None,
+    storage_bucket: str = 'YOUR_STORAGE_BUCKET',
+    database_url: str = 'YOUR_DB_URL',
+    workers: int = 16
+) -> Storage:
+    """
+    Build the storage backend named by `backend` or $VISIONWALK_STORAGE:
+
+    - 'firebase' (default): Firestore, Realtime Database and Cloud Storage
+      through firebase_admin, each call on a dedicated `workers`-thread pool.
+    - 'memory': in-process stores with the same behaviour, for running and
+      load-testing the server without Google services.
+      $VISIONWALK_STORAGE_LATENCY_MS adds a simulated round trip per call.
+    """
+    backend = (backend or os.getenv("VISIONWALK_STORAGE", "firebase")).lower()
+    if backend == 'memory':
+        latency = float(os.getenv("VISIONWALK_STORAGE_LATENCY_MS", "0")) / 1000
+        return Storage(backend, MemoryDocuments(latency), MemoryTree(latency), MemoryBlobs(latency))
+    if backend != 'firebase':
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    import firebase_admin
+    from firebase_admin import credentials, db, firestore, storage
+    if not len(firebase_admin._apps):
+        cred = credentials.Certificate(credentials_path)
+        firebase_admin.initialize_app(cred, {
+            'storageBucket': storage_bucket,
+            'databaseURL': database_url
+        })
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='firebase')
+    return Storage(
+        backend,
+        FirestoreDocuments(firestore.client(), executor),
+        RealtimeTree(db, executor),
+        FirebaseBlobs(storage.bucket(), executor)
+    )
@@ -0,0 +1,73 @@
+import time
+from typing import Callable, Dict, Optional
+from cachetools import TLRUCache
+from .types import TokenClaims
+
+
+class TokenRevoked(Exception):
+    """The token verified but has been revoked on this worker"""
+
+
+class TokenCache:
+    """
+    LRU cache of verified tokens, each entry expiring at the token's own `exp`.
+
+    `decode` does the full signature check and returns TokenClaims; it only
+    runs on a miss. At most `maxsize` tokens are kept (roughly 1.5 KB each).
+    Revocation is per worker: `revoke` rejects one token until it expires,
+    `revoke_user` rejects every token of a user issued before that moment.
+    Revoked tokens are also rejected on a miss, so eviction cannot
+    resurrect them.
+    """
+    def __init__(self, decode: Callable[[str], TokenClaims], maxsize: int = 10000, max_token_age: float = 366 * 86400):
+        self.decode = decode
+        self.max_token_age = max_token_age
+        self.cache = TLRUCache(maxsize=maxsize, ttu=lambda token, claims, now: claims.exp, timer=time.time)
+        self._revoked_tokens: Dict[str, float] = {}   # token -> exp
+        self._revoked_users: Dict[str, float] = {}    # uid -> revoked before (epoch seconds)
+
+        self.stats = {'hits': 0, 'misses': 0, 'revoked': 0}
+
+    def get(self, token: str) -> TokenClaims:
+        claims = self.cache.get(token)
+        if claims is None:
+            self.stats['misses'] += 1
+            claims = self.decode(token)
+            self._check(token, claims)
+            self.cache[token] = claims
+        else:
+            self.stats['hits'] += 1
+            self._check(token, claims)
+        return claims
+
+    def _check(self, token: str, claims: TokenClaims):
+        if not (self._revoked_tokens or self._revoked_users):
+            return
+        revoked_before = self._revoked_users.get(claims.id)
+        if token in self._revoked_tokens or (revoked_before is not None and claims.iat < revoked_before):
+            self.stats['revoked'] += 1
+            self.cache.pop(token, None)
+            raise TokenRevoked("Token has been revoked")
+
+    def revoke(self, token: str, exp: Optional[float] = None):
+        claims = self.cache.pop(token, None)
+        now = time.time()
+        self._revoked_tokens[token] = exp or (claims.exp if claims else now + self.max_token_age)
+        self._revoked_tokens = {t: e for t, e in self._revoked_tokens.items() if e > now}
+
+    def revoke_user(self, uid: str, before: Optional[float] = None):
+        now = time.time()
+        self._revoked_users[uid] = before or now
+        # Every token issued before the cut-off has expired after max_token_age
+        self._revoked_users = {u: t for u, t in self._revoked_users.items() if t > now - self.max_token_age}
+
+    def snapshot(self) -> Dict:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else 0.0,
+            'size': len(self.cache),
+            'maxsize': self.cache.maxsize,
+            'revoked_tokens': len(self._revoked_tokens),
+            'revoked_users': len(self._revoked_users)
+        }
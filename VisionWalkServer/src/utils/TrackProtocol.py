@@ -0,0 +1,181 @@
+import json, math, struct
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+Message = Union[Dict, str, bytes]
+
+class JsonCodec:
+    """Default /ws/track protocol: JSON text frames, sent as they are"""
+    subprotocol: Optional[str] = None
+
+    def encode(self, frame: Union[Dict, str]) -> List[Message]:
+        return [frame]
+
+    @staticmethod
+    def decode_location(data: str) -> Dict:
+        return json.loads(data)
+
+
+class BinaryCodec:
+    """
+    Compact /ws/track protocol, negotiated with the `visionwalk.bin.v1`
+    websocket subprotocol. All frames are little-endian, first byte = type.
+
+    client -> server
+        0x01 LOCATION         <B d d f f f   lat, lon, accuracy, heading, speed
+        0x02 PONG             <B
+
+    server -> client
+        0x10 USER_INFO        <B H H  ref, uid length, then uid (utf-8) + info (JSON)
+        0x11 MOVE             <B H d d f f f f d  ref, lat, lon, accuracy, heading,
+                              speed, distance (km), timestamp (epoch seconds)
+        0x12 PING             <B
+        0x13 ERROR            <B  then the error frame as JSON
+        0x14 LOCATION_BATCH   <B H  count, then `count` ENTER / MOVE frames
+        0x15 ENTER            same layout as MOVE
+        0x16 LEAVE            <B H  ref
+
+    A user's info is sent once per session (and again only if it changes);
+    enter / move / leave events refer to it by the small integer `ref`.
+    """
+    subprotocol = 'visionwalk.bin.v1'
+
+    LOCATION = 0x01
+    PONG = 0x02
+    USER_INFO = 0x10
+    MOVE = 0x11
+    PING = 0x12
+    ERROR = 0x13
+    LOCATION_BATCH = 0x14
+    ENTER = 0x15
+    LEAVE = 0x16
+
+    LOCATION_STRUCT = struct.Struct('<Bddfff')
+    USER_INFO_HEADER = struct.Struct('<BHH')
+    LOCATION_EVENT_STRUCT = struct.Struct('<BHddffffd')
+    BATCH_HEADER = struct.Struct('<BH')
+    LEAVE_STRUCT = struct.Struct('<BH')
+
+    def __init__(self):
+        self._refs: Dict[str, int] = {}
+        self._infos: Dict[int, Dict] = {}
+
+    @classmethod
+    def decode(cls, data: bytes) -> Optional[Dict]:
+        """Parse a client frame; returns the location dict, or None for PONG"""
+        if not data:
+            raise ValueError("Empty frame")
+        if data[0] == cls.PONG:
+            return None
+        if data[0] != cls.LOCATION or len(data) != cls.LOCATION_STRUCT.size:
+            raise ValueError("Malformed location frame")
+        _, latitude, longitude, accuracy, heading, speed = cls.LOCATION_STRUCT.unpack(data)
+        # No pydantic model on this path, so reject what it would not catch either
+        if not all(math.isfinite(value) for value in (latitude, longitude, accuracy, heading, speed)):
+            raise ValueError("Non-finite location values")
+        if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+            raise ValueError("Coordinates out of range")
+        return {
+            'latitude': latitude,
+            'longitude': longitude,
+            'accuracy': accuracy,
+            'heading': heading,
+            'speed': speed
+        }
+
+    @classmethod
+    def encode_location(cls, location: Dict) -> bytes:
+        """Client side of LOCATION, used by tests and benchmarks"""
+        return cls.LOCATION_STRUCT.pack(
+            cls.LOCATION,
+            location['latitude'],
+            location['longitude'],
+            location.get('accuracy') or 0.0,
+            location.get('heading') or 0.0,
+            location.get('speed') or 0.0
+        )
+
+    def _ref(self, uid: str, info: Dict, out: List[Message]) -> int:
+        ref = self._refs.get(uid)
+        if ref is None:
+            ref = len(self._refs)
+            if ref > 0xFFFF:
+                raise OverflowError("Too many users referenced in one session")
+            self._refs[uid] = ref
+        if self._infos.get(ref) != info:
+            self._infos[ref] = info
+            uid_bytes = uid.encode('utf-8')
+            out.append(
+                self.USER_INFO_HEADER.pack(self.USER_INFO, ref, len(uid_bytes))
+                + uid_bytes
+                + json.dumps(info, separators=(',', ':')).encode('utf-8')
+            )
+        return ref
+
+    @staticmethod
+    def _epoch(timestamp) -> float:
+        if isinstance(timestamp, (int, float)):
+            return float(timestamp)
+        try:
+            return datetime.fromisoformat(timestamp).timestamp()
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _location_event(self, frame: Dict, out: List[Message]) -> bytes:
+        location = frame['location']
+        ref = self._ref(frame['id'], frame.get('info') or {}, out)
+        return self.LOCATION_EVENT_STRUCT.pack(
+            self.ENTER if frame['type'] == 'enter' else self.MOVE,
+            ref,
+            location['latitude'],
+            location['longitude'],
+            location.get('accuracy') or 0.0,
+            location.get('heading') or 0.0,
+            location.get('speed') or 0.0,
+            frame.get('distance') or 0.0,
+            self._epoch(location.get('timestamp'))
+        )
+
+    def _leave(self, frame: Dict, out: List[Message]):
+        ref = self._refs.get(frame['id'])
+        # Never referenced in this session: the client does not know the user
+        if ref is not None:
+            out.append(self.LEAVE_STRUCT.pack(self.LEAVE, ref))
+
+    def _location_batch(self, frame: Dict, out: List[Message]):
+        records, leaves = [], []
+        for update in frame['updates']:
+            if update.get('type') in ('enter', 'move'):
+                records.append(self._location_event(update, out))
+            elif update.get('type') == 'leave':
+                self._leave(update, leaves)
+            else:
+                out.extend(self.encode(update))
+        # USER_INFO frames collected in `out` must precede the batch referring to them
+        for start in range(0, len(records), 0xFFFF):
+            chunk = records[start:start + 0xFFFF]
+            out.append(self.BATCH_HEADER.pack(self.LOCATION_BATCH, len(chunk)) + b''.join(chunk))
+        out.extend(leaves)
+
+    def encode(self, frame: Union[Dict, str]) -> List[Message]:
+        if frame == 'ping':
+            return [bytes((self.PING,))]
+
+        out: List[Message] = []
+        kind = frame.get('type') if isinstance(frame, dict) else None
+        if kind in ('enter', 'move'):
+            out.append(self._location_event(frame, out))
+        elif kind == 'leave':
+            self._leave(frame, out)
+        elif kind == 'location_batch':
+            self._location_batch(frame, out)
+        else:
+            out.append(bytes((self.ERROR,)) + json.dumps(frame, separators=(',', ':')).encode('utf-8'))
+        return out
+
+
+def negotiate(subprotocols: List[str]):
+    """Pick the codec for a websocket from the subprotocols the client offered"""
+    if BinaryCodec.subprotocol in (subprotocols or []):
+        return BinaryCodec()
+    return JsonCodec()
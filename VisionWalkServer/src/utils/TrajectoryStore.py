@@ -0,0 +1,323 @@
+import asyncio, logging, math, time, numpy as np, numpy.typing as npt
+from typing import Dict, Optional
+from .geo import douglas_peucker
+from .Storage import TreeStore
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('t', 'lat', 'lon', 'speed', 'heading')
+
+
+class Trajectory:
+    """
+    Ring buffer of one user's fixes, stored column-wise in NumPy arrays.
+
+    Starts small and doubles up to `capacity`; after that the oldest fixes
+    are overwritten. `appended` and `persisted` count fixes since creation,
+    so the fixes not yet written to the database are the last
+    `appended - persisted` ones still in the buffer.
+    """
+    def __init__(self, capacity: int, initial: int = 64):
+        self.capacity = capacity
+        size = min(initial, capacity)
+        self.t = np.empty(size, dtype=np.float64)
+        self.lat = np.empty(size, dtype=np.float64)
+        self.lon = np.empty(size, dtype=np.float64)
+        self.speed = np.empty(size, dtype=np.float32)
+        self.heading = np.empty(size, dtype=np.float32)
+        self.head = 0
+        self.count = 0
+        self.appended = 0
+        self.persisted = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _order(self) -> npt.NDArray[np.intp]:
+        size = len(self.t)
+        return (self.head - self.count + np.arange(self.count)) % size
+
+    def _grow(self):
+        order = self._order()
+        size = min(len(self.t) * 2, self.capacity)
+        for name in COLUMNS:
+            column = getattr(self, name)
+            grown = np.empty(size, dtype=column.dtype)
+            grown[:self.count] = column[order]
+            setattr(self, name, grown)
+        self.head = self.count
+
+    def append(self, t: float, latitude: float, longitude: float, speed: float, heading: float) -> bool:
+        """Returns False if an unpersisted fix had to be overwritten"""
+        if self.count == len(self.t) and self.count < self.capacity:
+            self._grow()
+        if self.count:
+            # Keep time sorted for searchsorted, even if the wall clock steps back
+            t = max(t, self.t[(self.head - 1) % len(self.t)])
+
+        i = self.head
+        self.t[i], self.lat[i], self.lon[i] = t, latitude, longitude
+        self.speed[i], self.heading[i] = speed, heading
+        self.head = (i + 1) % len(self.t)
+        self.count = min(self.count + 1, len(self.t))
+        self.appended += 1
+
+        lost = self.appended - self.persisted > self.count
+        if lost:
+            self.persisted = self.appended - self.count
+        return not lost
+
+    @property
+    def oldest(self) -> Optional[float]:
+        if not self.count:
+            return None
+        return float(self.t[(self.head - self.count) % len(self.t)])
+
+    def columns(self, indices: npt.NDArray[np.intp]) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name)[indices] for name in COLUMNS}
+
+    def between(self, start: float, end: float) -> Dict[str, np.ndarray]:
+        order = self._order()
+        t = self.t[order]
+        lo, hi = np.searchsorted(t, start, 'left'), np.searchsorted(t, end, 'right')
+        return self.columns(order[lo:hi])
+
+    def unpersisted(self) -> Dict[str, np.ndarray]:
+        pending = self.appended - self.persisted
+        return self.columns(self._order()[self.count - pending:])
+
+
+def time_buckets(t: npt.NDArray[np.float64], max_points: int) -> npt.NDArray[np.intp]:
+    """Indices of the last fix in each of `max_points` equal time buckets, plus the first fix"""
+    n = len(t)
+    if n <= max_points:
+        return np.arange(n)
+    span = max(t[-1] - t[0], 1e-9)
+    bucket = np.minimum(((t - t[0]) / span * (max_points - 1)).astype(np.intp), max_points - 2)
+    last = np.flatnonzero(np.diff(bucket, append=bucket[-1] + 1))
+    return np.union1d([0], last)
+
+
+class TrajectoryStore:
+    """
+    Per-user path history for route tracking.
+
+    Every fix the worker receives, broadcast or not, is appended to the
+    user's in-memory Trajectory. A background task persists the new fixes
+    every `persist_interval` seconds as column-wise chunks under
+    `<root>/<uid>/<segment>/<first ms>`, where `segment` is the start of a
+    fixed `segment_seconds` window, so a time range maps to a key range on
+    read. A user's fixes can land on several workers, each with its own
+    buffer, so queries read the persisted chunks of the whole window and add
+    this worker's fixes not written yet, then downsample to at most
+    `max_points` fixes. Another worker's fixes show up once it persists them.
+
+    Fixes with non-finite coordinates are not recorded and non-finite speed or
+    heading is stored as 0, since the database cannot hold NaN. If the
+    multi-path write still fails, each user's chunks are written on their own;
+    a user whose chunks are refused `max_user_failures` times in a row has its
+    pending fixes dropped, so one bad user cannot stop persistence for the rest.
+    """
+    def __init__(
+        self,
+        tree: TreeStore,
+        root: str = 'trajectories',
+        capacity: int = 3600,
+        segment_seconds: int = 300,
+        persist_interval: float = 30.0,
+        max_user_failures: int = 3
+    ):
+        self.tree = tree
+        self.root = root
+        self.capacity = capacity
+        self.segment_seconds = segment_seconds
+        self.persist_interval = persist_interval
+        self.max_user_failures = max_user_failures
+
+        self.trajectories: Dict[str, Trajectory] = {}
+        self._retired = set()
+        self._failures: Dict[str, int] = {}
+        self._persist_lock = asyncio.Lock()
+
+        self.stats = {
+            'appended': 0, 'rejected': 0, 'overwritten': 0, 'persists': 0, 'chunks_written': 0,
+            'persist_errors': 0, 'user_persist_errors': 0, 'dropped_fixes': 0, 'queries': 0, 'db_reads': 0
+        }
+
+    def append(self, uid: str, latitude: float, longitude: float, t: Optional[float] = None,
+               speed: Optional[float] = None, heading: Optional[float] = None):
+        if not (math.isfinite(latitude) and math.isfinite(longitude)):
+            self.stats['rejected'] += 1
+            return
+        speed = speed if speed is not None and math.isfinite(speed) else 0.0
+        heading = heading if heading is not None and math.isfinite(heading) else 0.0
+        trajectory = self.trajectories.get(uid)
+        if trajectory is None:
+            trajectory = self.trajectories[uid] = Trajectory(self.capacity)
+        self._retired.discard(uid)
+        if not trajectory.append(time.time() if t is None else t, latitude, longitude, speed, heading):
+            self.stats['overwritten'] += 1
+        self.stats['appended'] += 1
+
+    def retire(self, uid: str):
+        """User went offline: drop the buffer once everything in it is persisted"""
+        if uid in self.trajectories:
+            self._retired.add(uid)
+
+    def _segment(self, t: float) -> int:
+        return int(t // self.segment_seconds) * self.segment_seconds
+
+    def _chunks(self, uid: str, columns: Dict[str, np.ndarray]) -> Dict[str, Dict]:
+        updates = {}
+        segments = (columns['t'] // self.segment_seconds).astype(np.int64)
+        for start in np.flatnonzero(np.diff(segments, prepend=-1)):
+            end = start + np.searchsorted(segments[start:], segments[start], 'right')
+            t = columns['t'][start:end]
+            path = f"{uid}/{self._segment(t[0])}/{int(t[0] * 1000)}"
+            updates[path] = {
+                't': np.round(t, 3).tolist(),
+                'lat': np.round(columns['lat'][start:end], 7).tolist(),
+                'lon': np.round(columns['lon'][start:end], 7).tolist(),
+                'speed': np.round(columns['speed'][start:end].astype(np.float64), 2).tolist(),
+                'heading': np.round(columns['heading'][start:end].astype(np.float64), 1).tolist()
+            }
+        return updates
+
+    async def _persist_each(self, chunks: Dict[str, Dict[str, Dict]]) -> Dict[str, BaseException]:
+        """Write every user's chunks on their own; returns the users whose write failed"""
+        results = await asyncio.gather(
+            *(self.tree.update(self.root, user_chunks) for user_chunks in chunks.values()),
+            return_exceptions=True
+        )
+        return {uid: result for uid, result in zip(chunks, results) if isinstance(result, BaseException)}
+
+    async def persist(self) -> int:
+        """Write all new fixes as chunks in one multi-path update, per user if that fails. Returns fixes written."""
+        async with self._persist_lock:
+            chunks, marks = {}, {}
+            for uid, trajectory in self.trajectories.items():
+                pending = trajectory.appended - trajectory.persisted
+                if pending:
+                    chunks[uid] = self._chunks(uid, trajectory.unpersisted())
+                    marks[uid] = trajectory.appended
+
+            failed: Dict[str, BaseException] = {}
+            if chunks:
+                updates = {path: chunk for user_chunks in chunks.values() for path, chunk in user_chunks.items()}
+                try:
+                    await self.tree.update(self.root, updates)
+                except Exception:
+                    failed = await self._persist_each(chunks)
+                    rejected = any(isinstance(error, (ValueError, TypeError)) for error in failed.values())
+                    if len(failed) == len(chunks) and not rejected:
+                        # Nothing went through: the database is unreachable, retry everything next time
+                        self.stats['persist_errors'] += 1
+                        raise next(iter(failed.values()))
+                self.stats['persists'] += 1
+                self.stats['chunks_written'] += sum(len(chunks[uid]) for uid in chunks if uid not in failed)
+
+            written = 0
+            for uid, appended in marks.items():
+                trajectory = self.trajectories.get(uid)
+                if trajectory is None:
+                    continue
+                if uid in failed:
+                    # Only this user's chunks are refused: retry a few times, then give up on them
+                    self.stats['user_persist_errors'] += 1
+                    attempts = self._failures.get(uid, 0) + 1
+                    if attempts < self.max_user_failures:
+                        self._failures[uid] = attempts
+                        continue
+                    self._failures.pop(uid, None)
+                    self.stats['dropped_fixes'] += appended - trajectory.persisted
+                    logger.error("Dropping %d unpersisted fixes of %s: %s", appended - trajectory.persisted, uid, failed[uid])
+                else:
+                    self._failures.pop(uid, None)
+                    written += appended - trajectory.persisted
+                trajectory.persisted = max(trajectory.persisted, appended)
+            for uid in list(self._retired):
+                trajectory = self.trajectories.get(uid)
+                if trajectory is None or trajectory.persisted == trajectory.appended:
+                    self.trajectories.pop(uid, None)
+                    self._retired.discard(uid)
+            return written
+
+    async def run(self):
+        """Periodic persister, meant to run as a background task"""
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            try:
+                await self.persist()
+            except Exception as e:
+                logger.warning("Trajectory persist failed: %s", e)
+
+    async def drain(self):
+        """Persist everything still pending, used on shutdown"""
+        try:
+            await self.persist()
+        except Exception as e:
+            logger.error("Dropping unpersisted trajectories: %s", e)
+
+    async def _load(self, uid: str, start: float, end: float) -> Dict[str, np.ndarray]:
+        """Read the chunks of the segments overlapping [start, end]"""
+        segments = await self.tree.get_range(
+            f"{self.root}/{uid}", str(self._segment(start)), str(self._segment(end))
+        )
+        chunks = [chunk for chunks in segments.values() if isinstance(chunks, dict) for chunk in chunks.values()]
+        if not chunks:
+            return {name: np.empty(0) for name in COLUMNS}
+        columns = {name: np.concatenate([np.asarray(chunk[name], dtype=np.float64) for chunk in chunks]) for name in COLUMNS}
+        order = np.argsort(columns['t'], kind='stable')
+        keep = order[(columns['t'][order] >= start) & (columns['t'][order] <= end)]
+        return {name: column[keep] for name, column in columns.items()}
+
+    async def query(
+        self,
+        uid: str,
+        start: float,
+        end: float,
+        max_points: int = 300,
+        method: str = 'dp',
+        tolerance_m: float = 5.0
+    ) -> Dict:
+        """Fixes of uid in [start, end], simplified to at most max_points"""
+        self.stats['queries'] += 1
+        self.stats['db_reads'] += 1
+        persisted = await self._load(uid, start, end)
+        parts = [persisted]
+        trajectory = self.trajectories.get(uid)
+        if trajectory is not None:
+            recent = trajectory.between(start, end)
+            # Fixes already persisted by this worker are in both; chunks store t rounded to ms
+            fresh = ~np.isin(np.round(recent['t'], 3), persisted['t'])
+            parts.append({name: column[fresh] for name, column in recent.items()})
+
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+        order = np.argsort(columns['t'], kind='stable')
+        columns = {name: column[order] for name, column in columns.items()}
+        total = len(columns['t'])
+        if method == 'bucket':
+            keep = time_buckets(columns['t'], max_points)
+        else:
+            keep = douglas_peucker(columns['lat'], columns['lon'], tolerance_m, max_points)
+        return {
+            'total_points': total,
+            'points': [
+                {
+                    'latitude': float(columns['lat'][i]),
+                    'longitude': float(columns['lon'][i]),
+                    'timestamp': float(columns['t'][i]),
+                    'speed': round(float(columns['speed'][i]), 2),
+                    'heading': round(float(columns['heading'][i]), 1)
+                }
+                for i in keep
+            ]
+        }
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            'users': len(self.trajectories),
+            'fixes_in_memory': sum(len(trajectory) for trajectory in self.trajectories.values()),
+            'unpersisted': sum(t.appended - t.persisted for t in self.trajectories.values())
+        }
@@ -0,0 +1,221 @@
+import asyncio, json, logging, uuid
+from typing import Dict, Iterable, Optional
+from urllib.parse import quote
+from cachetools import TTLCache
+from redis import asyncio as aioredis
+from .Storage import DocumentStore, DocumentExists
+
+logger = logging.getLogger(__name__)
+
+
+class EmailTaken(Exception):
+    """Another account already owns this email"""
+
+
+class UserDirectory:
+    """
+    Keyed access to user documents: an email -> uid index plus a
+    read-through cache of whole user documents.
+
+    The index lives in its own collection (`user_emails/<email>` ->
+    {'uid': ...}) and is created with `create()`, so two registrations
+    racing for one email cannot both succeed. Accounts created before the
+    index existed are found with the old `where(email == ...)` query once
+    and backfilled.
+
+    Documents are cached for `ttl` seconds and unknown emails for
+    `negative_ttl`. `create`, `update` and `delete` go through here: they
+    drop the entries on this worker and publish the uid and email on
+    `channel`, and `run` applies what other workers publish, so a change
+    on one worker is not served stale by another. Without Redis the TTLs
+    are the only bound.
+    """
+    def __init__(
+        self,
+        documents: DocumentStore,
+        collection: str = 'users',
+        email_collection: str = 'user_emails',
+        ttl: float = 300,
+        negative_ttl: float = 30,
+        maxsize: int = 10000,
+        channel: str = 'users:invalidate'
+    ):
+        self.documents = documents
+        self.collection = collection
+        self.email_collection = email_collection
+        self.profiles = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.uids = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.unknown_emails = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self.channel = channel
+        self.worker_id = uuid.uuid4().hex
+        self.redis: Optional[aioredis.Redis] = None
+
+        self.stats = {
+            'hits': 0, 'misses': 0, 'email_hits': 0, 'email_misses': 0,
+            'fallback_queries': 0, 'backfilled': 0, 'invalidations': 0,
+            'remote_invalidations': 0, 'publish_errors': 0
+        }
+
+    @staticmethod
+    def _email_key(email: str) -> str:
+        # Firestore document ids cannot contain '/'
+        return quote(email, safe='@.+-_')
+
+    async def get(self, uid: str) -> Optional[Dict]:
+        """User document by uid (cached); None if it does not exist"""
+        if uid in self.profiles:
+            self.stats['hits'] += 1
+            return self.profiles[uid]
+        self.stats['misses'] += 1
+        user = await self.documents.get(self.collection, uid)
+        if user is None:
+            return None
+        self.profiles[uid] = user
+        return user
+
+    async def uid_for_email(self, email: str) -> Optional[str]:
+        if email in self.uids:
+            self.stats['email_hits'] += 1
+            return self.uids[email]
+        if email in self.unknown_emails:
+            self.stats['email_hits'] += 1
+            return None
+        self.stats['email_misses'] += 1
+
+        entry = await self.documents.get(self.email_collection, self._email_key(email))
+        uid = entry['uid'] if entry else await self._find_legacy(email)
+
+        if uid is None:
+            self.unknown_emails[email] = True
+        else:
+            self.uids[email] = uid
+        return uid
+
+    async def _find_legacy(self, email: str) -> Optional[str]:
+        """Account without an index entry yet: query by email and backfill the index"""
+        self.stats['fallback_queries'] += 1
+        found = await self.documents.find(self.collection, "email", email, limit=1)
+        if not found:
+            return None
+        uid, user = found[0]
+        self.profiles[uid] = user
+        try:
+            await self.documents.create(self.email_collection, self._email_key(email), {'uid': uid})
+            self.stats['backfilled'] += 1
+        except DocumentExists:
+            pass
+        return uid
+
+    async def find_by_email(self, email: str) -> Optional[Dict]:
+        uid = await self.uid_for_email(email)
+        if uid is None:
+            return None
+        user = await self.get(uid)
+        if user is None or user.get('email') != email:
+            # Stale index entry (account deleted or email changed elsewhere)
+            self.uids.pop(email, None)
+            return None
+        return user
+
+    async def create(self, uid: str, user_doc: Dict):
+        """Claim the email and write the user; raises EmailTaken if it is already claimed"""
+        email = user_doc['email']
+        try:
+            await self.documents.create(self.email_collection, self._email_key(email), {'uid': uid})
+        except DocumentExists:
+            raise EmailTaken(email)
+        try:
+            await self.documents.set(self.collection, uid, user_doc)
+        except Exception:
+            # Do not leave the email claimed by an account that was never written
+            await self.documents.delete(self.email_collection, self._email_key(email))
+            raise
+        self.unknown_emails.pop(email, None)
+        self.uids[email] = uid
+        self.profiles[uid] = user_doc
+        # Other workers may have cached this email as unknown
+        await self._publish(uid, [email])
+
+    async def update(self, uid: str, changes: Dict):
+        await self.documents.update(self.collection, uid, changes)
+        self.invalidate(uid)
+        await self._publish(uid, [changes['email']] if 'email' in changes else [])
+
+    async def delete(self, uid: str):
+        user = await self.get(uid)
+        await self.documents.delete(self.collection, uid)
+        emails = []
+        if user and user.get('email'):
+            await self.documents.delete(self.email_collection, self._email_key(user['email']))
+            self.uids.pop(user['email'], None)
+            emails.append(user['email'])
+        self.invalidate(uid)
+        await self._publish(uid, emails)
+
+    def invalidate(self, uid: str):
+        self.stats['invalidations'] += 1
+        self.profiles.pop(uid, None)
+
+    def clear(self):
+        self.profiles.clear()
+        self.uids.clear()
+        self.unknown_emails.clear()
+
+    def _forget(self, uid: str, emails: Iterable[str]):
+        self.profiles.pop(uid, None)
+        for email in emails:
+            self.uids.pop(email, None)
+            self.unknown_emails.pop(email, None)
+
+    async def _publish(self, uid: str, emails: Iterable[str]):
+        if self.redis is None:
+            return
+        payload = json.dumps({'worker': self.worker_id, 'uid': uid, 'emails': list(emails)})
+        try:
+            await self.redis.publish(self.channel, payload)
+        except Exception as e:
+            # Other workers fall back to the TTL
+            self.stats['publish_errors'] += 1
+            logger.error("User cache invalidation publish failed: %s", e)
+
+    def _handle(self, data):
+        message = json.loads(data)
+        if message.get('worker') == self.worker_id:
+            return
+        self.stats['remote_invalidations'] += 1
+        self._forget(message['uid'], message.get('emails', ()))
+
+    async def run(self, redis: aioredis.Redis):
+        """Subscriber for invalidations from other workers, meant to run as a background task"""
+        self.redis = redis
+        pubsub = redis.pubsub()
+        try:
+            while True:
+                try:
+                    await pubsub.subscribe(self.channel)
+                    # Whatever was published while not subscribed is lost: start from an empty cache
+                    self.clear()
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self._handle(message['data'])
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error("User cache invalidation subscriber error: %s", e)
+                    await pubsub.aclose()
+                    pubsub = redis.pubsub()
+                    await asyncio.sleep(1.0)
+        finally:
+            self.redis = None
+            await pubsub.aclose()
+
+    def snapshot(self) -> Dict:
+        lookups = self.stats['hits'] + self.stats['misses']
+        email_lookups = self.stats['email_hits'] + self.stats['email_misses']
+        return {
+            **self.stats,
+            'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else 0.0,
+            'email_hit_rate': round(self.stats['email_hits'] / email_lookups, 4) if email_lookups else 0.0,
+            'cached_profiles': len(self.profiles),
+            'cached_emails': len(self.uids)
+        }
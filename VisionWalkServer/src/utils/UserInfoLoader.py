@@ -0,0 +1,137 @@
+import asyncio, logging
+from typing import Dict, Iterable, Optional, Set
+from cachetools import TTLCache
+from .Storage import DocumentStore
+
+logger = logging.getLogger(__name__)
+
+class UserInfoLoader:
+    """
+    Batched, coalescing loader for the public part of user profiles
+    (displayName, profileImage, email).
+
+    All uncached UIDs of one `load_many` call are fetched with a single
+    `get_many` on the document store. Concurrent loads of a UID
+    that is already being fetched wait for that fetch instead of issuing
+    another one, and unknown UIDs are remembered for `negative_ttl` seconds.
+    """
+    FIELDS = ['displayName', 'profileImage', 'email']
+
+    def __init__(
+        self,
+        documents: DocumentStore,
+        collection: str = 'users',
+        ttl: float = 300,
+        negative_ttl: float = 30,
+        maxsize: int = 10000
+    ):
+        self.documents = documents
+        self.collection = collection
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.missing = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stale: Set[str] = set()
+
+        self.stats = {'hits': 0, 'negative_hits': 0, 'coalesced': 0, 'fetched': 0, 'batches': 0, 'errors': 0}
+
+    @staticmethod
+    def public_info(user_data: Dict) -> Dict:
+        return {
+            'displayName': user_data.get('displayName', ''),
+            'profileImage': user_data.get('profileImage', None),
+            'email': user_data.get('email', '')
+        }
+
+    def prime(self, uid: str, info: Dict):
+        """Cache info obtained elsewhere (e.g. from another worker)"""
+        self.cache[uid] = info
+        self.missing.pop(uid, None)
+
+    def invalidate(self, uid: str):
+        self.cache.pop(uid, None)
+        self.missing.pop(uid, None)
+        if uid in self._inflight:
+            # A fetch started before the change must not repopulate the cache
+            self._stale.add(uid)
+
+    async def read(self, uid: str) -> Optional[Dict]:
+        """
+        Info of uid straight from the store, None if it does not exist. Leaves
+        the cache alone and, unlike load, raises if the read fails.
+        """
+        docs = await self.documents.get_many(self.collection, [uid], fields=self.FIELDS)
+        self.stats['fetched'] += 1
+        if uid not in docs:
+            return None
+        return self.public_info(docs[uid])
+
+    async def load(self, uid: str) -> Dict:
+        return (await self.load_many([uid]))[uid]
+
+    async def load_many(self, uids: Iterable[str]) -> Dict[str, Dict]:
+        result: Dict[str, Dict] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        to_fetch = []
+
+        for uid in dict.fromkeys(uids):
+            if uid in self.cache:
+                self.stats['hits'] += 1
+                result[uid] = self.cache[uid]
+            elif uid in self.missing:
+                self.stats['negative_hits'] += 1
+                result[uid] = {}
+            elif uid in self._inflight:
+                self.stats['coalesced'] += 1
+                waiting[uid] = self._inflight[uid]
+            else:
+                to_fetch.append(uid)
+
+        if to_fetch:
+            result.update(await self._fetch_batch(to_fetch))
+
+        for uid, future in waiting.items():
+            try:
+                result[uid] = (await asyncio.shield(future)).get(uid, {})
+            except Exception:
+                result[uid] = {}
+
+        return result
+
+    async def _fetch_batch(self, uids) -> Dict[str, Dict]:
+        future = asyncio.get_running_loop().create_future()
+        for uid in uids:
+            self._inflight[uid] = future
+
+        try:
+            docs = await self.documents.get_many(self.collection, uids, fields=self.FIELDS)
+            found = {uid: self.public_info(doc) for uid, doc in docs.items()}
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning("Error getting user info: %s", e)
+            future.set_exception(e)
+            future.exception()  # retrieved, even if nobody was waiting
+            self._stale.difference_update(uids)
+            return {uid: {} for uid in uids}
+        else:
+            future.set_result(found)
+        finally:
+            for uid in uids:
+                self._inflight.pop(uid, None)
+            if not future.done():
+                # Cancelled mid-fetch: release the waiters empty-handed
+                future.set_result({})
+                self._stale.difference_update(uids)
+
+        self.stats['batches'] += 1
+        self.stats['fetched'] += len(uids)
+        for uid in uids:
+            if uid in self._stale:
+                self._stale.discard(uid)
+            elif uid in found:
+                self.cache[uid] = found[uid]
+            else:
+                self.missing[uid] = True
+        return {uid: found.get(uid, {}) for uid in uids}
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, 'cached': len(self.cache), 'cached_missing': len(self.missing)}
@@ -1,7 +1,4 @@
-from .GoogleCloudAPI import GoogleCloudAPI
-from .ImagePreprocessor import ImagePreprocessor
-from .AudioPreprocessor import AudioPreprocessor
-from .FirebaseLocation import FirebaseLocation
-from .FirebaseAdmin import FirebaseAdmin
-
-__all__ = ['GoogleCloudAPI', 'ImagePreprocessor', 'AudioPreprocessor', 'FirebaseLocation', 'FirebaseAdmin']
\ No newline at end of file
+# Import classes from their submodules (`from utils.FirebaseAdmin import FirebaseAdmin`).
+# The package does not re-export them: importing a submodule binds the package attribute
+# of the same name to the module, and the heavy ones (cv2, librosa, Google clients) must
+# only load when a subsystem is first used.
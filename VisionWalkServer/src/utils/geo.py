@@ -0,0 +1,103 @@
+import heapq, numpy as np, numpy.typing as npt
+from typing import Optional, Tuple
+from geopy.distance import geodesic
+
+EARTH_RADIUS_KM = 6371.0088
+# Haversine (sphere) vs. WGS-84 ellipsoid differ by at most ~0.56%
+SPHERE_ERROR = 0.006
+
+
+def haversine_km(
+    latitude: float,
+    longitude: float,
+    lats: npt.NDArray[np.float64],
+    lons: npt.NDArray[np.float64]
+) -> npt.NDArray[np.float64]:
+    """Great-circle distance from one point to arrays of points, in km"""
+    lat0 = np.radians(latitude)
+    phi = np.radians(lats)
+    dphi = phi - lat0
+    dlambda = np.radians(lons - longitude)
+    a = np.sin(dphi * 0.5) ** 2 + np.cos(lat0) * np.cos(phi) * np.sin(dlambda * 0.5) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def within_radius(
+    latitude: float,
+    longitude: float,
+    lats: npt.NDArray[np.float64],
+    lons: npt.NDArray[np.float64],
+    radius_km: float
+) -> Tuple[npt.NDArray[np.intp], npt.NDArray[np.float64]]:
+    """
+    Indices of the points within radius_km and their distances, nearest first.
+
+    Distances come from the vectorized haversine; only points whose spherical
+    distance is within the sphere/ellipsoid error of the boundary are
+    re-measured with the exact geodesic.
+    """
+    distances = haversine_km(latitude, longitude, lats, lons)
+    margin = radius_km * SPHERE_ERROR
+    idx = np.flatnonzero(distances <= radius_km + margin)
+    dist = distances[idx]
+
+    near_boundary = np.flatnonzero(dist >= radius_km - margin)
+    if len(near_boundary):
+        origin = (latitude, longitude)
+        for i in near_boundary:
+            j = idx[i]
+            dist[i] = geodesic(origin, (lats[j], lons[j])).km
+        keep = dist <= radius_km
+        idx, dist = idx[keep], dist[keep]
+
+    order = np.argsort(dist, kind='stable')
+    return idx[order], dist[order]
+
+
+def douglas_peucker(
+    lats: npt.NDArray[np.float64],
+    lons: npt.NDArray[np.float64],
+    tolerance_m: float,
+    max_points: Optional[int] = None
+) -> npt.NDArray[np.intp]:
+    """
+    Indices of the points kept by Douglas-Peucker simplification of a path.
+
+    Points are projected to local metres (equirectangular around the mean
+    latitude). Segments are split most-deviating point first, so when
+    `max_points` stops the refinement early the result is still the best
+    approximation with that many points.
+    """
+    n = len(lats)
+    if n <= 2:
+        return np.arange(n)
+
+    metres = EARTH_RADIUS_KM * 1000
+    y = np.radians(lats) * metres
+    x = np.unwrap(np.radians(lons)) * metres * np.cos(np.radians(np.mean(lats)))
+
+    def farthest(i: int, j: int):
+        px, py = x[i + 1:j] - x[i], y[i + 1:j] - y[i]
+        dx, dy = x[j] - x[i], y[j] - y[i]
+        norm = np.hypot(dx, dy)
+        if norm == 0:
+            deviation = np.hypot(px, py)
+        else:
+            deviation = np.abs(dy * px - dx * py) / norm
+        k = int(np.argmax(deviation))
+        return float(deviation[k]), i + 1 + k
+
+    keep = [0, n - 1]
+    deviation, k = farthest(0, n - 1)
+    heap = [(-deviation, 0, n - 1, k)]
+    while heap and (max_points is None or len(keep) < max_points):
+        deviation, i, j, k = heapq.heappop(heap)
+        if -deviation <= tolerance_m:
+            break
+        keep.append(k)
+        for a, b in ((i, k), (k, j)):
+            if b - a > 1:
+                d, m = farthest(a, b)
+                heapq.heappush(heap, (-d, a, b, m))
+
+    return np.array(sorted(keep), dtype=np.intp)
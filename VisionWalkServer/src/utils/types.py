@@ -1,7 +1,18 @@
 from pydantic import BaseModel
+from typing import Optional
 
 class QARequest(BaseModel):
     question: str
 
 class TTSRequest(BaseModel):
-    text: str
\ No newline at end of file
+    text: str
+
+class TokenClaims(BaseModel):
+    """Payload of a verified access/refresh token (see FirebaseAdmin.create_tokens)"""
+    id: str
+    email: str
+    role: str = 'user'
+    phoneNumber: Optional[str] = None
+    type: str = 'access'
+    exp: float
+    iat: float = 0